@@ -0,0 +1,90 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+"""
+Measures the time needed for importing score.db in a fresh interpreter and
+makes sure that optional subsystems are not loaded during the import. Usage::
+
+    python benchmarks/import_time.py [RUNS [MAX_MILLISECONDS]]
+
+The script exits with a non-zero status, if any of the lazily loaded modules
+was imported, or if the median import time exceeds the given maximum.
+"""
+
+import statistics
+import subprocess
+import sys
+
+# modules, that must not be loaded by a plain "import score.db"
+LAZY_MODULES = (
+    'alembic',
+    'score.db.alembic',
+    'score.db.dataloader',
+    'sqlalchemy.dialects.postgresql',
+    'transaction',
+    'yaml',
+    'zope.sqlalchemy',
+)
+
+SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import score.db
+duration = time.perf_counter() - start
+print(duration)
+print(' '.join(name for name in %r if name in sys.modules))
+''' % (LAZY_MODULES,)
+
+
+def measure():
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT])
+    duration, loaded = output.decode('utf-8').split('\n', 1)
+    return float(duration), loaded.split()
+
+
+def main(runs, limit):
+    durations = []
+    loaded = set()
+    for _ in range(runs):
+        duration, modules = measure()
+        durations.append(duration * 1000)
+        loaded.update(modules)
+    median = statistics.median(durations)
+    print('import score.db: %.1fms median, %.1fms min over %d runs' % (
+        median, min(durations), runs))
+    failed = False
+    if loaded:
+        print('eagerly imported: %s' % ', '.join(sorted(loaded)))
+        failed = True
+    if limit is not None and median > limit:
+        print('median exceeds limit of %.1fms' % limit)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10,
+                  float(sys.argv[2]) if len(sys.argv) > 2 else None))
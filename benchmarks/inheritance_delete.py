@@ -0,0 +1,89 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+"""
+Compares the time needed for deleting many rows from the deepest table of a
+joined-table inheritance hierarchy using row-level and statement-level
+inheritance triggers. Usage::
+
+    python benchmarks/inheritance_delete.py postgresql://localhost/bench 100000
+
+The given database will be destroyed before and after the benchmark!
+"""
+
+import sys
+import time
+import warnings
+import sqlalchemy as sa
+from score.db import create_base, ConfiguredDbModule
+
+Base = create_base()
+
+
+def create_hierarchy(prefix, delete_trigger):
+    classes = []
+    parent = Base
+    for level in range(4):
+        attrs = {'value%d' % level: sa.Column(sa.Integer)}
+        if parent is Base:
+            attrs['__score_db__'] = {'delete_trigger': delete_trigger}
+        parent = type('%sLevel%d' % (prefix, level), (parent, ), attrs)
+        classes.append(parent)
+    return classes
+
+
+hierarchies = {
+    'row': create_hierarchy('Row', 'row'),
+    'statement': create_hierarchy('Statement', 'statement'),
+}
+
+
+def main(url, count):
+    warnings.simplefilter('ignore')
+    engine = sa.create_engine(url)
+    Base.metadata.bind = engine
+    dbconf = ConfiguredDbModule(engine, Base, True, None)
+    dbconf.destroy()
+    dbconf.create()
+    session = dbconf.Session(extension=[])
+    for name, classes in hierarchies.items():
+        leaf = classes[-1]
+        session.bulk_save(leaf, ({'value0': i, 'value3': i}
+                                 for i in range(count)))
+        session.commit()
+        start = time.perf_counter()
+        session.execute(leaf.__table__.delete())
+        session.commit()
+        duration = time.perf_counter() - start
+        remaining = session.query(classes[0]).count()
+        print('%-10s %d rows: %.3fs (%d rows left in root table)' % (
+            name, count, duration, remaining))
+    session.close()
+    dbconf.destroy()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
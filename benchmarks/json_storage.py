@@ -0,0 +1,117 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+"""
+Compares the storage size, write throughput and read latency of JSON
+documents stored using the JSON type and the CompressedJSON type with both
+compression algorithms. Usage::
+
+    python benchmarks/json_storage.py postgresql://localhost/bench 10000
+
+The given database will be destroyed before and after the benchmark!
+"""
+
+import random
+import sys
+import time
+import warnings
+import sqlalchemy as sa
+from score.db import create_base, ConfiguredDbModule, CompressedJSON
+from score.db.helpers import JSON
+
+Base = create_base()
+
+
+class PlainDocument(Base):
+    data = sa.Column(JSON)
+
+
+class ZlibDocument(Base):
+    data = sa.Column(CompressedJSON(algorithm='zlib'))
+
+
+class LzmaDocument(Base):
+    data = sa.Column(CompressedJSON(algorithm='lzma'))
+
+
+def document(index):
+    """
+    Returns a JSON document of a few kilobytes with a realistic amount of
+    repetition.
+    """
+    return {
+        'id': index,
+        'title': 'Document #%d' % index,
+        'tags': ['tag%d' % (index % 17), 'tag%d' % (index % 23)],
+        'items': [{'position': i,
+                   'name': 'item %d of document %d' % (i, index),
+                   'price': round(random.random() * 100, 2),
+                   'available': bool(i % 3)}
+                  for i in range(30)],
+    }
+
+
+def storage_size(session, cls):
+    table = cls.__table__.name
+    if session.bind.dialect.name == 'postgresql':
+        sql = "SELECT pg_total_relation_size('%s')" % table
+    else:
+        sql = 'SELECT sum(length(data)) FROM %s' % table
+    return session.execute(sql).scalar()
+
+
+def main(url, count):
+    warnings.simplefilter('ignore')
+    engine = sa.create_engine(url)
+    Base.metadata.bind = engine
+    dbconf = ConfiguredDbModule(engine, Base, True, None)
+    dbconf.destroy()
+    dbconf.create()
+    session = dbconf.Session(extension=[])
+    documents = [document(i) for i in range(count)]
+    for cls in (PlainDocument, ZlibDocument, LzmaDocument):
+        start = time.perf_counter()
+        session.add_all(cls(data=data) for data in documents)
+        session.commit()
+        write = time.perf_counter() - start
+        ids = [id for (id, ) in session.query(cls.id)]
+        session.expunge_all()
+        start = time.perf_counter()
+        for _ in range(100):
+            sample = random.sample(ids, 5)
+            session.query(cls).filter(cls.id.in_(sample)).all()
+            session.expunge_all()
+        read = (time.perf_counter() - start) / 100
+        print('%-14s size: %10d bytes  write: %7.0f docs/s  '
+              'read 5 docs: %.2fms' % (
+                  cls.__name__, storage_size(session, cls),
+                  count / write, read * 1000))
+    session.close()
+    dbconf.destroy()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
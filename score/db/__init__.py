@@ -24,27 +24,58 @@
 # the discretion of STRG.AT GmbH also the competent court, in whose district the
 # Licensee has his registered seat, an establishment or assets.
 
+import importlib
+import sys
 from ._init import init, ConfiguredDbModule, engine_from_config
-from ._conf import create_base
-from .helpers import (IdType, JSON as JsonType, cls2tbl, tbl2cls,
+from ._conf import create_base, ClassRegistry
+from .helpers import (IdType, CompressedJSON, cls2tbl, tbl2cls,
                       create_collection_class, create_relationship_class)
-
-from .dataloader import load_yaml, load_url, load_data, DataLoaderException
 from .dbenum import Enum
-from .alembic import _import_dummy
 from ._session import SessionMixin
+from ._cache import ObjectCache
 from ._sa_stmt import (generate_create_inheritance_view_statement,
                        generate_drop_inheritance_view_statement)
 
 __version__ = '0.5.12'
 
-# avoid "unused variable" warnings from IDEs
-_import_dummy
-
 __all__ = (
-    'init', 'ConfiguredDbModule', 'engine_from_config', 'create_base', 'IdType',
-    'JsonType', 'cls2tbl', 'tbl2cls', 'create_collection_class',
+    'init', 'ConfiguredDbModule', 'engine_from_config', 'create_base',
+    'ClassRegistry', 'IdType', 'JsonType', 'json_type', 'CompressedJSON',
+    'cls2tbl', 'tbl2cls', 'create_collection_class',
     'create_relationship_class', 'load_yaml', 'load_url', 'load_data',
-    'DataLoaderException', 'Enum', 'SessionMixin',
+    'DataLoaderException', 'Enum', 'SessionMixin', 'ObjectCache',
     'generate_create_inheritance_view_statement',
     'generate_drop_inheritance_view_statement')
+
+# members, that are only imported on first access, since their modules are
+# rarely needed and expensive to load
+_lazy_members = {
+    'JsonType': ('.helpers', 'JSON'),
+    'json_type': ('.helpers', 'json_type'),
+    'load_yaml': ('.dataloader', 'load_yaml'),
+    'load_url': ('.dataloader', 'load_url'),
+    'load_data': ('.dataloader', 'load_data'),
+    'DataLoaderException': ('.dataloader', 'DataLoaderException'),
+}
+
+
+# the alembic operations used to be registered as a side effect of importing
+# score.db: keep doing so for alembic's env.py, which will usually import
+# alembic before the application's database module.
+if 'alembic' in sys.modules:
+    importlib.import_module('.alembic', __name__)
+
+
+def __getattr__(name):
+    try:
+        module, member = _lazy_members[name]
+    except KeyError:
+        raise AttributeError(
+            'module %r has no attribute %r' % (__name__, name))
+    value = getattr(importlib.import_module(module, __name__), member)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_members))
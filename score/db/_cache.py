@@ -0,0 +1,176 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+from collections import OrderedDict
+import copy
+import threading
+import time
+from sqlalchemy import event, inspect as sa_inspect
+import sqlalchemy.orm as sa_orm
+
+
+class ObjectCache:
+    """
+    A process-wide cache of the column values of database objects, keyed by
+    their identity (i.e. class and id). Only objects of the given *classes*
+    (and their sub-classes) are cached. The cache will hold at most
+    *max_entries* objects, discarding the least recently used ones, and will
+    forget entries older than *ttl* seconds, if that value is not `None`.
+
+    The cache is filled whenever an object of one of the *classes* is loaded
+    from the database and entries are invalidated whenever an object is
+    flushed, as well as on commit and rollback of the flushing session. Note
+    that the cache cannot know about modifications made by other processes.
+    """
+
+    def __init__(self, classes, max_entries=10000, ttl=None):
+        self.classes = tuple(classes)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def caches(self, class_):
+        """
+        Whether objects of given *class_* are stored in this cache.
+        """
+        return issubclass(class_, self.classes)
+
+    def get(self, key):
+        """
+        Returns a tuple containing the class and a dict of column values of the
+        object with given identity *key*, or `None` if there is no such entry.
+        """
+        with self._lock:
+            try:
+                class_, values, timestamp = self._entries[key]
+            except KeyError:
+                return None
+            if self.ttl is not None and time.monotonic() - timestamp > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return class_, copy.deepcopy(values)
+
+    def put(self, obj):
+        """
+        Stores the loaded column values of given *obj*.
+        """
+        state = sa_inspect(obj)
+        if state.key is None:
+            return
+        values = dict((attr.key, state.dict[attr.key])
+                      for attr in state.mapper.column_attrs
+                      if attr.key in state.dict)
+        entry = (type(obj), copy.deepcopy(values), time.monotonic())
+        with self._lock:
+            self._entries[state.key] = entry
+            self._entries.move_to_end(state.key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys):
+        """
+        Removes the entries with given identity *keys*.
+        """
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def invalidate_class(self, class_):
+        """
+        Removes all entries of given *class_* and its sub-classes.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if issubclass(self._entries[key][0], class_):
+                    del self._entries[key]
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def register(self, session_class):
+        """
+        Registers the event listeners populating and invalidating this cache
+        for the given :func:`configured session class <.sessionmaker>`.
+        """
+        def load(target, context, attrs=None):
+            session = context.session
+            if not isinstance(session, session_class):
+                return
+            if sa_inspect(target).key in session._cache_pending:
+                return
+            self.put(target)
+
+        for class_ in self.classes:
+            event.listen(class_, 'load', load, propagate=True)
+            event.listen(class_, 'refresh', load, propagate=True)
+
+        @event.listens_for(session_class, 'after_flush')
+        def after_flush(session, flush_context):
+            keys = set()
+            for obj in session.new | session.dirty | session.deleted:
+                key = sa_inspect(obj).key
+                if key is not None and self.caches(type(obj)):
+                    keys.add(key)
+            session._cache_pending.update(keys)
+            self.invalidate(keys)
+
+        @event.listens_for(session_class, 'after_commit')
+        @event.listens_for(session_class, 'after_soft_rollback')
+        def after_transaction(session, *args):
+            self.invalidate(session._cache_pending)
+            session._cache_pending.clear()
+
+        @event.listens_for(session_class, 'after_bulk_update')
+        @event.listens_for(session_class, 'after_bulk_delete')
+        def after_bulk_operation(context):
+            class_ = context.mapper.class_
+            for cached_class in self.classes:
+                if issubclass(class_, cached_class) or \
+                        issubclass(cached_class, class_):
+                    self.invalidate_class(cached_class)
+
+
+class Query(sa_orm.Query):
+    """
+    A :class:`Query <sqlalchemy.orm.query.Query>` class, that looks up objects
+    in the session's :class:`.ObjectCache` in calls to :meth:`get`.
+    """
+
+    def get(self, ident):
+        if self._criterion is None and not self._populate_existing and \
+                self._for_update_arg is None and len(self._entities) == 1:
+            mapper = self._only_full_mapper_zero('get')
+            obj = self.session._from_cache(mapper.class_, ident)
+            if obj is not None:
+                return obj
+        return super().get(ident)
+
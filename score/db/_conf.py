@@ -24,7 +24,9 @@
 # the discretion of STRG.AT GmbH also the competent court, in whose district the
 # Licensee has his registered seat, an establishment or assets.
 
-from .helpers import IdType, cls2tbl
+from .helpers import IdType, TypeCodeType, cls2tbl
+from ._sa_json import JsonPath
+import re
 import sqlalchemy as sa
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.declarative.api import DeclarativeMeta
@@ -34,12 +36,151 @@ class ConfigurationError(Exception):
     pass
 
 
+class ClassRegistry:
+    """
+    Inheritance information about all classes deriving from a :ref:`base
+    class <db_base_class>`. Every base class created by :func:`.create_base`
+    has its own registry, which is available as its member
+    ``__score_db_registry__``. The registry is updated whenever a new class is
+    declared, so all lookups are cheap afterwards.
+    """
+
+    def __init__(self):
+        self.classes = []
+        self._ancestors = {}
+        self._descendants = {}
+        self._children = {}
+        self._type_names = {}
+        self._tables = {}
+
+    def register(self, cls):
+        """
+        Adds a new database class *cls* to this registry.
+        """
+        ancestors = []
+        parent = cls.__score_db__['parent']
+        while parent is not None:
+            ancestors.append(parent)
+            parent = parent.__score_db__['parent']
+        self.classes.append(cls)
+        self._ancestors[cls] = tuple(ancestors)
+        self._descendants[cls] = []
+        self._children[cls] = []
+        if ancestors:
+            self._children[ancestors[0]].append(cls)
+        for ancestor in ancestors:
+            self._descendants[ancestor].append(cls)
+        root = ancestors[-1] if ancestors else cls
+        self._type_names[(root, cls.__score_db__['type_name'])] = cls
+        table = getattr(cls, '__table__', None)
+        if table is not None:
+            self._tables.setdefault(table.name, cls)
+
+    def roots(self):
+        """
+        Returns all classes deriving from the base class directly.
+        """
+        return [cls for cls in self.classes if not self._ancestors[cls]]
+
+    def levels(self):
+        """
+        Generates lists of classes, starting with all :meth:`roots` and
+        continuing with the children of the previous list, until the whole
+        inheritance hierarchy has been traversed.
+        """
+        classes = self.roots()
+        while classes:
+            yield classes
+            classes = [sub for cls in classes for sub in self._children[cls]]
+
+    def root(self, cls):
+        """
+        Returns the class at the top of the inheritance hierarchy of *cls*,
+        i.e. the ancestor deriving from the base class directly.
+        """
+        ancestors = self._ancestors[cls]
+        return ancestors[-1] if ancestors else cls
+
+    def ancestors(self, cls):
+        """
+        Returns a tuple containing the parent class of *cls*, its parent class
+        and so on up to the :meth:`root`.
+        """
+        return self._ancestors[cls]
+
+    def children(self, cls):
+        """
+        Returns the list of classes, whose parent is *cls*.
+        """
+        return list(self._children[cls])
+
+    def descendants(self, cls):
+        """
+        Returns all classes deriving from *cls* directly or indirectly, in the
+        order of their declaration.
+        """
+        return list(self._descendants[cls])
+
+    def tables(self, cls):
+        """
+        Returns the tables of all classes in the inheritance chain of *cls*,
+        starting with the table of the :meth:`root`. Each table is listed only
+        once, even if several classes share it through single-table
+        inheritance.
+        """
+        tables = []
+        for class_ in reversed((cls,) + self._ancestors[cls]):
+            if class_.__table__ not in tables:
+                tables.append(class_.__table__)
+        return tables
+
+    def type_names(self, cls):
+        """
+        Returns the ``type_name`` values of *cls* and all of its
+        :meth:`descendants`.
+        """
+        return [class_.__score_db__['type_name']
+                for class_ in [cls] + self._descendants[cls]]
+
+    def by_type_name(self, cls, type_name):
+        """
+        Returns the class with given *type_name* within the inheritance
+        hierarchy of *cls*.
+        """
+        return self._type_names[(self.root(cls), type_name)]
+
+    def by_table(self, name):
+        """
+        Returns the class that declared the table with given *name*.
+        """
+        return self._tables[name]
+
+
+def _create_on_postgresql_only(table, indexes):
+    """
+    Keeps given *indexes* of *table* from being created along with the table
+    on databases other than postgresql. The indexes remain part of the
+    metadata (for alembic, for example), though.
+    """
+
+    @sa.event.listens_for(table, 'before_create')
+    def hide_indexes(target, connection, **kwargs):
+        if connection.dialect.name != 'postgresql':
+            table.indexes.difference_update(indexes)
+
+    @sa.event.listens_for(table, 'after_create')
+    def restore_indexes(target, connection, **kwargs):
+        table.indexes.update(indexes)
+
+
 def create_base():
     """
     Returns a :ref:`base class <db_base_class>` for database access objects.
     """
 
     Base = None
+    type_codes = {}
+    partial_indexes = {}
 
     class _BaseMeta(DeclarativeMeta):
         """
@@ -56,6 +197,10 @@ def create_base():
                 _BaseMeta.configure_inheritance(cls, classname, bases, attrs)
                 _BaseMeta.set_id(cls, classname, bases, attrs)
             DeclarativeMeta.__init__(cls, classname, bases, attrs)
+            if Base is not None:
+                Base.__score_db_registry__.register(cls)
+                _BaseMeta.configure_partial_indexes(cls)
+                _BaseMeta.configure_json_indexes(cls)
 
         def set_config(cls, classname, bases, attrs):
             """
@@ -69,6 +214,23 @@ def create_base():
             - type_name: name of this type in the database, as stored in the
                 type_column.
             - type_column: name of the column containing the type_name
+            - polymorphic_load: how the columns of sub-classes are loaded when
+                querying this class.
+            - id_block_size: number of ids to reserve at once for new objects,
+                or `None` to let the database assign ids during inserts.
+            - delete_trigger: whether the trigger deleting parent rows is
+                executed for each row or for each statement.
+            - view: whether the inheritance view is a plain or a materialized
+                view.
+            - type_index: whether the type_column has an index.
+            - type_codes: whether the type_column stores integer codes instead
+                of the type names.
+            - type_code: the integer code of this class, if type_codes is
+                enabled.
+            - partial_index: columns to create a partial index on, which only
+                covers rows of this class and its sub-classes.
+            - json_indexes: tuple of (column, path, kind) tuples describing
+                indexes on the contents of JSON columns.
             """
             cfg = {}
             if '__score_db__' in attrs:
@@ -105,6 +267,94 @@ def create_base():
                 if cfg['inheritance'] not in valid:
                     raise ConfigurationError(
                         'Invalid inheritance configuration "%s"' % cfg['inheritance'])
+            # configure polymorphic_load
+            if 'polymorphic_load' not in cfg:
+                if parent is not None:
+                    cfg['polymorphic_load'] = \
+                        parent.__score_db__['polymorphic_load']
+                else:
+                    cfg['polymorphic_load'] = None
+            elif cfg['polymorphic_load'] not in ('selectin', 'inline', None):
+                raise ConfigurationError(
+                    'Invalid polymorphic_load configuration "%s"' %
+                    cfg['polymorphic_load'])
+            # configure id_block_size
+            if parent is not None:
+                # ids are shared by all tables in the inheritance chain
+                inherited = parent.__score_db__['id_block_size']
+                if cfg.setdefault('id_block_size', inherited) != inherited:
+                    raise ConfigurationError(
+                        'Cannot change id_block_size of %s in subclass %s' %
+                        (parent.__name__, classname))
+            elif 'id_block_size' not in cfg:
+                cfg['id_block_size'] = None
+            elif cfg['id_block_size'] is not None and \
+                    int(cfg['id_block_size']) < 1:
+                raise ConfigurationError(
+                    'Invalid id_block_size configuration "%s"' %
+                    cfg['id_block_size'])
+            # configure delete_trigger
+            if 'delete_trigger' not in cfg:
+                if parent is not None:
+                    cfg['delete_trigger'] = \
+                        parent.__score_db__['delete_trigger']
+                else:
+                    cfg['delete_trigger'] = 'row'
+            elif cfg['delete_trigger'] not in ('row', 'statement'):
+                raise ConfigurationError(
+                    'Invalid delete_trigger configuration "%s"' %
+                    cfg['delete_trigger'])
+            # configure view
+            if 'view' not in cfg:
+                cfg['view'] = 'plain'
+            elif cfg['view'] not in ('plain', 'materialized'):
+                raise ConfigurationError(
+                    'Invalid view configuration "%s"' % cfg['view'])
+            # configure type_index and type_codes, both of which describe the
+            # type column and can thus only be configured on the root class
+            for key in ('type_index', 'type_codes'):
+                if parent is not None:
+                    inherited = parent.__score_db__[key]
+                    if cfg.setdefault(key, inherited) != inherited:
+                        raise ConfigurationError(
+                            'Cannot change %s of %s in subclass %s' %
+                            (key, parent.__name__, classname))
+                elif key not in cfg:
+                    cfg[key] = key == 'type_index' and \
+                        cfg['inheritance'] == 'single-table'
+                elif cfg[key] not in (True, False):
+                    raise ConfigurationError(
+                        'Invalid %s configuration "%s"' % (key, cfg[key]))
+            # configure type_code
+            if not cfg['type_codes'] or cfg['inheritance'] is None:
+                cfg.setdefault('type_code', None)
+            elif not isinstance(cfg.get('type_code'), int) or \
+                    not 0 <= cfg['type_code'] < 2 ** 15:
+                raise ConfigurationError(
+                    'Missing or invalid type_code configuration in %s' %
+                    classname)
+            # configure partial_index
+            if not cfg.get('partial_index'):
+                cfg['partial_index'] = None
+            elif parent is None or cfg['inheritance'] != 'single-table':
+                raise ConfigurationError(
+                    'Partial indexes are only supported in sub-classes with '
+                    'single-table inheritance (%s)' % classname)
+            elif cfg['partial_index'] is True:
+                cfg['partial_index'] = ('id',)
+            else:
+                cfg['partial_index'] = tuple(cfg['partial_index'])
+            # configure json_indexes
+            json_indexes = []
+            for path, kind in (cfg.get('json_indexes') or {}).items():
+                if isinstance(path, str):
+                    path = (path, )
+                if kind not in ('gin', 'int', 'float', 'str', 'bool'):
+                    raise ConfigurationError(
+                        'Invalid json_indexes configuration "%s" in %s' %
+                        (kind, classname))
+                json_indexes.append((path[0], tuple(path[1:]), kind))
+            cfg['json_indexes'] = tuple(json_indexes)
             # configure type_column
             if 'type_column' not in cfg:
                 if '__mapper_args__' in attrs and 'polymorphic_on' in attrs['__mapper_args__']:
@@ -154,10 +404,22 @@ def create_base():
             - cls.__mapper_args__
             - cls.__mapper_args__['polymorphic_identity']
             - cls.__mapper_args__['polymorphic_on']
+            - cls.__mapper_args__['polymorphic_load']
             - cls._type
             """
             if cls.__score_db__['inheritance'] is None:
                 return
+            if cls.__score_db__['type_codes']:
+                # the root class' type column is created below
+                root = cls
+                while root.__score_db__['parent'] is not None:
+                    root = root.__score_db__['parent']
+                if root is not cls:
+                    try:
+                        type_codes[root].add(cls.__score_db__['type_name'],
+                                             cls.__score_db__['type_code'])
+                    except ValueError as e:
+                        raise ConfigurationError(str(e))
             # define cls.__mapper_args__
             if '__mapper_args__' not in attrs:
                 attrs['__mapper_args__'] = {}
@@ -168,14 +430,84 @@ def create_base():
             # define cls.__mapper_args__['polymorphic_on']
             if cls.__score_db__['parent'] is not None:
                 # this is a sub-class of another class that should
-                # already have the 'polymorphic_on' configuration.
+                # already have the 'polymorphic_on' configuration. we just
+                # need to define how sqlalchemy should load this class'
+                # table, if it has one.
+                polymorphic_load = cls.__score_db__['polymorphic_load']
+                if polymorphic_load and \
+                        cls.__score_db__['inheritance'] == 'joined-table' and \
+                        'polymorphic_load' not in cls.__mapper_args__:
+                    cls.__mapper_args__['polymorphic_load'] = polymorphic_load
                 return
             cls.__mapper_args__['polymorphic_on'] = cls.__score_db__['type_column']
             # define the type column we're polymorphic on
             type_attr = cls.__mapper_args__['polymorphic_on']
-            if type_attr not in attrs:
+            if cls.__score_db__['type_codes']:
+                if type_attr in attrs:
+                    raise ConfigurationError(
+                        'Cannot use type_codes with the manually declared '
+                        'type column %s.%s' % (classname, type_attr))
+                type_codes[cls] = TypeCodeType()
+                type_codes[cls].add(cls.__score_db__['type_name'],
+                                    cls.__score_db__['type_code'])
+                attrs[type_attr] = sa.Column(type_codes[cls], nullable=False)
+                setattr(cls, type_attr, attrs[type_attr])
+            elif type_attr not in attrs:
                 attrs[type_attr] = sa.Column(sa.String(100), nullable=False)
                 setattr(cls, type_attr, attrs[type_attr])
+            column = attrs[type_attr]
+            if cls.__score_db__['type_index'] and \
+                    isinstance(column, sa.Column) and column.index is None:
+                column.index = True
+
+        def configure_partial_indexes(cls):
+            """
+            Creates the partial index configured for this class and updates
+            the conditions of partial indexes of its parent classes, which
+            need to cover this class, too.
+            """
+            registry = Base.__score_db_registry__
+            cfg = cls.__score_db__
+            if cfg['partial_index']:
+                table = cls.__table__
+                partial_indexes[cls] = sa.Index(
+                    'ix_%s_%s' % (table.name, cfg['type_name']),
+                    *(table.c[name] for name in cfg['partial_index']))
+            if cfg['inheritance'] != 'single-table':
+                return
+            type_column = cls.__table__.c[cfg['type_column']]
+            for class_ in (cls, ) + registry.ancestors(cls):
+                if class_ not in partial_indexes:
+                    continue
+                index = partial_indexes[class_]
+                where = type_column.in_(registry.type_names(class_))
+                for dialect in ('postgresql', 'sqlite'):
+                    index.dialect_options[dialect]['where'] = where
+
+        def configure_json_indexes(cls):
+            """
+            Creates the indexes on the contents of JSON columns configured for
+            this class. Since sqlite has no equivalent of GIN indexes, these
+            are only created on postgresql.
+            """
+            table = cls.__table__
+            gin_indexes = []
+            for column, path, kind in cls.__score_db__['json_indexes']:
+                if column not in table.c:
+                    raise ConfigurationError(
+                        'Unknown JSON column %s in %s' % (column, cls.__name__))
+                name = re.sub(r'\W', '_', '_'.join(
+                    ('ix', table.name, column) + tuple(map(str, path))))
+                expression = JsonPath(table.c[column], path)
+                if kind != 'gin':
+                    sa.Index(name, getattr(expression, 'as_' + kind)())
+                    continue
+                if not path:
+                    expression = table.c[column]
+                gin_indexes.append(
+                    sa.Index(name, expression, postgresql_using='gin'))
+            if gin_indexes:
+                _create_on_postgresql_only(table, gin_indexes)
 
         def set_id(cls, classname, bases, attrs):
             """
@@ -205,4 +537,5 @@ def create_base():
             cls.id = attrs['id']
 
     Base = declarative_base(metaclass=_BaseMeta)
+    Base.__score_db_registry__ = ClassRegistry()
     return Base
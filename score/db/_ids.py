@@ -0,0 +1,128 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import threading
+from sqlalchemy.sql.expression import text
+
+
+class IdAllocator:
+    """
+    Hands out ids for database classes configured with an ``id_block_size``
+    in their :ref:`__score_db__ <db_config_member>` member. Ids are reserved
+    from the database in blocks of that size and assigned to new objects
+    before they are flushed, which allows sqlalchemy to insert them in
+    batches.
+
+    On PostgreSQL, the ids of a block are taken from the sequence of the
+    table's id column. On SQLite, the next free id of each table is stored in
+    the table ``_score_db_ids``, which is updated on a separate, immediately
+    committed connection. Like the values of a sequence, reserved ids are
+    thus never handed out twice, even if the transaction using them is
+    rolled back.
+
+    There should only be one allocator per database and process, as provided
+    by :attr:`.ConfiguredDbModule.id_allocator`.
+    """
+
+    def __init__(self):
+        self._free = {}
+        self._lock = threading.Lock()
+
+    def allocate(self, session, table, count, block_size):
+        """
+        Returns a list of *count* ids for given *table*, reserving new blocks
+        of at least *block_size* ids in the database, if necessary.
+        """
+        with self._lock:
+            free = self._free.setdefault(table.name, [])
+            if len(free) < count:
+                count_ = max(block_size, count - len(free))
+                dialect = session.dbconf.engine.dialect.name
+                if dialect == 'postgresql':
+                    reserved = self._reserve_postgresql(session, table, count_)
+                elif dialect == 'sqlite':
+                    connection = session.connection()
+                    if connection.connection.in_transaction:
+                        # sqlite only allows a single writer: a separate
+                        # connection would wait for the lock held by the
+                        # session's own transaction. the reservation will be
+                        # undone if that transaction is rolled back.
+                        reserved = self._reserve_sqlite(
+                            connection, table, count_)
+                        session._reserved_ids.append((table.name, reserved))
+                    else:
+                        with session.dbconf.engine.begin() as connection:
+                            reserved = self._reserve_sqlite(
+                                connection, table, count_)
+                else:
+                    raise Exception('Can only allocate ids in sqlite and '
+                                    'postgresql databases')
+                free.extend(reserved)
+            ids = free[:count]
+            del free[:count]
+        return ids
+
+    def discard(self, tablename, ids):
+        """
+        Forgets given *ids* of the table with given *tablename*, since their
+        reservation was rolled back.
+        """
+        ids = set(ids)
+        with self._lock:
+            free = self._free.get(tablename, [])
+            free[:] = [id for id in free if id not in ids]
+
+    def clear(self):
+        """
+        Forgets all reserved ids, since the database was destroyed.
+        """
+        with self._lock:
+            self._free.clear()
+
+    def _reserve_postgresql(self, session, table, count):
+        # nextval() is not affected by the session's transaction
+        sql = text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                   "FROM generate_series(1, :count)")
+        return [id for (id, ) in session.execute(
+            sql, {'table': table.name, 'count': count})]
+
+    def _reserve_sqlite(self, connection, table, count):
+        # the table might have been dropped by destroy() in the meantime
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS _score_db_ids ('
+            'name VARCHAR(100) PRIMARY KEY, next INTEGER NOT NULL)')
+        params = {'name': table.name, 'count': count}
+        connection.execute(text(
+            'INSERT OR IGNORE INTO _score_db_ids (name, next) '
+            'SELECT :name, COALESCE(MAX(id), 0) + 1 FROM "%s"' %
+            table.name), params)
+        connection.execute(text(
+            'UPDATE _score_db_ids SET next = next + :count '
+            'WHERE name = :name'), params)
+        last = connection.execute(text(
+            'SELECT next FROM _score_db_ids WHERE name = :name'),
+            params).scalar()
+        return list(range(last - count, last))
@@ -24,16 +24,25 @@
 # the discretion of STRG.AT GmbH also the competent court, in whose district the
 # Licensee has his registered seat, an establishment or assets.
 
+import collections
+import hashlib
 import sqlalchemy as sa
+from sqlalchemy.sql.expression import select
 from score.init import (
     ConfiguredModule, ConfigurationError, parse_dotted_path, parse_bool,
-    parse_call)
-from zope.sqlalchemy import ZopeTransactionExtension
+    parse_call, parse_list, parse_time_interval)
 from ._session import sessionmaker
+from ._cache import ObjectCache
+from ._ids import IdAllocator
 from ._sa_stmt import (
-    DropInheritanceTrigger, CreateInheritanceTrigger,
+    DropInheritanceTrigger, CreateInheritanceTrigger, DropView,
+    DropMaterializedView, RefreshMaterializedView, CreateView,
+    CreateMaterializedView, StatementBatch,
     generate_create_inheritance_view_statement,
-    generate_drop_inheritance_view_statement)
+    generate_create_materialized_view_statements,
+    generate_drop_materialized_view_statements)
+from .helpers import cls2tbl
+from . import _json
 import warnings
 
 
@@ -41,9 +50,21 @@ defaults = {
     'base': None,
     'destroyable': False,
     'ctx.member': 'db',
+    'cache.classes': [],
+    'cache.max_entries': 10000,
+    'cache.ttl': None,
+    'json.backend': 'auto',
 }
 
 
+# stores hashes of the views and triggers generated by
+# ConfiguredDbModule.create()
+ddl_table = sa.Table(
+    '_score_db_ddl', sa.MetaData(),
+    sa.Column('name', sa.String(200), primary_key=True),
+    sa.Column('hash', sa.String(40), nullable=False))
+
+
 def init(confdict, ctx=None):
     """
     Initializes this module acoording to :ref:`our module initialization
@@ -73,6 +94,27 @@ def init(confdict, ctx=None):
 
         >>> ctx.db.query(User).first()
 
+    :confkey:`cache.classes` :faint:`[default=list()]`
+        A list of dotted python paths to database classes, that should be
+        stored in a process-wide :class:`.ObjectCache`. Objects of these
+        classes (and their sub-classes) will be served from the cache in calls
+        to :meth:`Query.get <sqlalchemy.orm.query.Query.get>` and
+        :meth:`.SessionMixin.by_ids`. This is useful for small, frequently
+        accessed tables, like users, groups or lookup tables. No cache is
+        created, if this list is empty.
+
+    :confkey:`cache.max_entries` :faint:`[default=10000]`
+        Maximum number of objects to keep in the cache.
+
+    :confkey:`cache.ttl` :faint:`[default=None]`
+        Maximum age of cached objects, as interpreted by
+        :func:`score.init.parse_time_interval`. Entries never expire, if this
+        value is `None`.
+
+    :confkey:`json.backend` :faint:`[default=auto]`
+        The library to use for serializing JSON values. See
+        :func:`score.db._json.set_backend` for valid values.
+
     This function will initialize an sqlalchemy
     :ref:`Engine <sqlalchemy:engines_toplevel>` and the provided
     :ref:`base class <db_base_class>`.
@@ -81,6 +123,7 @@ def init(confdict, ctx=None):
     warnings.warn('The module score.db is deprecated in favor of score.sa.orm')
     conf = defaults.copy()
     conf.update(confdict)
+    _json.set_backend(conf['json.backend'])
     engine = engine_from_config(conf)
     if not conf['base']:
         import score.db
@@ -96,11 +139,20 @@ def init(confdict, ctx=None):
             cursor = dbapi_connection.cursor()
             cursor.execute("PRAGMA foreign_keys=ON")
             cursor.close()
+    cache = None
+    cache_classes = [parse_dotted_path(path)
+                     for path in parse_list(conf['cache.classes'])]
+    if cache_classes:
+        ttl = conf['cache.ttl']
+        if ttl is not None:
+            ttl = parse_time_interval(ttl)
+        cache = ObjectCache(cache_classes, int(conf['cache.max_entries']), ttl)
     db_conf = ConfiguredDbModule(
-        engine, Base, parse_bool(conf['destroyable']), ctx_member)
+        engine, Base, parse_bool(conf['destroyable']), ctx_member, cache)
     if ctx_member:
 
         def constructor(ctx):
+            from zope.sqlalchemy import ZopeTransactionExtension
             zope_tx = ZopeTransactionExtension(
                 transaction_manager=ctx.tx_manager)
             return db_conf.Session(extension=zope_tx)
@@ -127,6 +179,11 @@ def engine_from_config(config):
     - ``sqlalchemy.pool_recycle`` (converted to `int`)
 
     Any other keys are used without conversion.
+
+    Engines for postgresql databases will also use the configured
+    :func:`JSON backend <score.db._json.set_backend>` for JSONB values. The
+    :class:`score.db.helpers.JsonType` serializes its values itself on
+    other databases.
     """
     conf = dict()
     for key in config:
@@ -149,7 +206,11 @@ def engine_from_config(config):
             conf[key] = int(config[key])
         else:
             conf[key] = config[key]
-    return sa.engine_from_config(conf)
+    kwargs = {}
+    url = sa.engine.url.make_url(conf['sqlalchemy.url'])
+    if url.get_backend_name() == 'postgresql':
+        kwargs.update(_json.engine_kwargs())
+    return sa.engine_from_config(conf, **kwargs)
 
 
 class ConfiguredDbModule(ConfiguredModule):
@@ -158,38 +219,142 @@ class ConfiguredDbModule(ConfiguredModule):
     <score.init.ConfiguredModule>`.
     """
 
-    def __init__(self, engine, Base, destroyable, ctx_member):
+    def __init__(self, engine, Base, destroyable, ctx_member, cache=None):
         super().__init__(__package__)
         self.engine = engine
         self.Base = Base
         self.destroyable = destroyable
         self.ctx_member = ctx_member
-        self.Session = sessionmaker(
-            self, extension=ZopeTransactionExtension(), bind=engine)
+        self.cache = cache
+        self.id_allocator = IdAllocator()
+        self.Session = sessionmaker(self, zope_transaction=True, bind=engine)
 
-    def create(self):
+    def create(self, *, force=False):
         """
         Generates all necessary tables, views, triggers, sequences, etc.
+
+        A hash of each generated view and trigger definition is stored in the
+        table ``_score_db_ddl``. Subsequent calls will only re-create those
+        views and triggers, whose definition changed in the meantime or which
+        are missing from the database, unless *force* evaluates to `True`.
         """
         # create all tables
         self.Base.metadata.create_all()
+        ddl_table.create(self.engine, checkfirst=True)
         session = self.Session(extension=[])
+        views = self._list_views(session)
+        triggers = self._list_triggers(session)
+        hashes = {}
+        if not force:
+            hashes = dict(session.execute(
+                select([ddl_table.c.name, ddl_table.c.hash])).fetchall())
         # generate inheritance views and triggers: we do this starting with the
         # base class and working our way down the inheritance hierarchy
-        classes = [cls for cls in self.Base.__subclasses__()
-                   if cls.__score_db__['parent'] is None]
-        while classes:
+        # classes sharing a table with single-table inheritance replace each
+        # other's trigger, so we key triggers by table and views by class.
+        # only the statements creating an object are hashed, the statements
+        # dropping it depend on what currently exists in the database.
+        objects = collections.OrderedDict()
+        for classes in self.Base.__score_db_registry__.levels():
             for cls in classes:
-                self._create_inheritance_trigger(session, cls)
-                self._create_inheritance_view(session, cls)
-            classes = [sub for cls in classes for sub in cls.__subclasses__()]
+                objects['trigger:' + cls.__tablename__] = \
+                    self._create_inheritance_trigger(cls)
+                viewname = cls2tbl(cls)[1:]
+                objects['view:' + viewname] = \
+                    self._create_inheritance_view(cls, views.get(viewname))
+        statements = []
+        changed = {}
+        for name, (drops, creates) in objects.items():
+            sql = [str(stmt.compile(dialect=self.engine.dialect))
+                   for stmt in creates]
+            digest = hashlib.sha1('\n'.join(sql).encode('utf-8')).hexdigest()
+            # the stored hash is not enough: tables might have been
+            # re-created (dropping their triggers) or views might have been
+            # dropped manually since the hash was written.
+            if hashes.get(name) == digest and all(
+                    self._exists(stmt, views, triggers) for stmt in creates):
+                continue
+            statements.extend(
+                (stmt, str(stmt.compile(dialect=self.engine.dialect)))
+                for stmt in drops)
+            statements.extend(zip(creates, sql))
+            changed[name] = digest
+        dialect = self.engine.dialect.name
+        if statements and dialect == 'postgresql':
+            # send all statements in a single round trip
+            session.execute(StatementBatch([stmt for stmt, _ in statements]))
+        elif statements and dialect == 'sqlite':
+            # executescript() commits any pending transaction before running
+            # the script, so we need to wrap the statements in a transaction
+            # of our own to keep them atomic.
+            session.connection().connection.executescript(
+                'BEGIN;\n%s;\nCOMMIT;' % ';\n'.join(
+                    sql for _, sql in statements))
+        else:
+            for stmt, _ in statements:
+                session.execute(stmt)
+        if changed:
+            session.execute(ddl_table.delete().where(
+                ddl_table.c.name.in_(list(changed))))
+            session.execute(ddl_table.insert(), [
+                {'name': name, 'hash': digest}
+                for name, digest in changed.items()])
         session.commit()
 
-    def _create_inheritance_trigger(self, session, class_):
+    def _list_views(self, session):
+        """
+        Returns a dict mapping the names of all views in the database to their
+        kind, i.e. ``plain`` or ``materialized``. The latter are tables on
+        sqlite.
+        """
+        dialect = self.engine.dialect.name
+        views = {}
+        if dialect == 'postgresql':
+            from .pg import list_views, list_materialized_views
+            views.update((name, 'materialized')
+                         for name in list_materialized_views(session))
+        elif dialect == 'sqlite':
+            from .sqlite import list_views, list_tables
+            views.update((name, 'materialized')
+                         for name in list_tables(session))
+        else:
+            return views
+        views.update((name, 'plain') for name in list_views(session))
+        return views
+
+    def _list_triggers(self, session):
+        """
+        Returns the set of trigger names present in the database.
+        """
+        dialect = self.engine.dialect.name
+        if dialect == 'postgresql':
+            from .pg import list_triggers
+        elif dialect == 'sqlite':
+            from .sqlite import list_triggers
+        else:
+            return set()
+        return set(list_triggers(session))
+
+    def _exists(self, stmt, views, triggers):
+        """
+        Tests whether the view or trigger created by given *stmt* is present
+        in the database. The *views* and *triggers* in the database must be
+        passed as returned by :meth:`._list_views` and :meth:`._list_triggers`.
+        Statements creating other objects (like the indexes of materialized
+        views) are considered present.
+        """
+        if isinstance(stmt, CreateMaterializedView):
+            return views.get(stmt.name) == 'materialized'
+        if isinstance(stmt, CreateView):
+            return views.get(stmt.name) == 'plain'
+        trigger = getattr(stmt, 'trigger_name', None)
+        return trigger is None or trigger in triggers
+
+    def _create_inheritance_trigger(self, class_):
         """
-        Creates the inheritance trigger for given *class_*. This trigger will
-        delete entries from parent tables, whenever a row in the given table is
-        deleted.
+        Returns the statements dropping and creating the inheritance trigger
+        for given *class_* as a tuple of two lists. This trigger will delete entries from parent tables, whenever
+        a row in the given table is deleted.
 
         Example: assuming the given class ``Administrator`` is a sub-class of
         ``User``, this will create an sqlite trigger like the following:
@@ -199,21 +364,32 @@ class ConfiguredDbModule(ConfiguredModule):
             FOR EACH ROW BEGIN
               DELETE FROM _user WHERE id = OLD.id;
             END
+
+        If the class' ``delete_trigger`` is configured as ``statement``, the
+        trigger on postgresql will delete all parent rows of a DELETE
+        statement at once:
+
+            CREATE TRIGGER autodel_administrator
+              AFTER DELETE ON _administrator
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE autodelstmt_user();
         """
-        parent_tables = []
         parent = class_.__score_db__['parent']
-        while parent:
-            parent_tables.append(parent.__table__)
-            parent = parent.__score_db__['parent']
-        session.execute(DropInheritanceTrigger(class_.__table__))
-        if parent_tables:
-            session.execute(CreateInheritanceTrigger(
-                class_.__table__, parent_tables[0]))
-
-    def _create_inheritance_view(self, session, class_):
+        creates = []
+        if parent is not None:
+            creates.append(CreateInheritanceTrigger(
+                class_.__table__, parent.__table__,
+                class_.__score_db__['delete_trigger']))
+        return [DropInheritanceTrigger(class_.__table__)], creates
+
+    def _create_inheritance_view(self, class_, existing=None):
         """
-        Creates the inheritance view for given *class_*. The view combines all
-        fields in the given class, as well as those in parent classes.
+        Returns the statements dropping and creating the inheritance view for
+        given *class_* as a tuple of two lists. The view combines all fields in
+        the given class, as well as those in parent classes. The kind of view
+        currently present in the database—``plain``, ``materialized`` or
+        `None`—must be passed as *existing*, since it determines how the
+        current view needs to be dropped.
 
         Example: assuming the following table structure:
 
@@ -234,12 +410,60 @@ class ConfiguredDbModule(ConfiguredModule):
           CREATE VIEW image AS
           SELECT f.id, f.name, i.format
           FROM _file f INNER JOIN _image i ON f.id = i.id
+
+        If the class is configured to have a materialized ``view``, this will
+        create a materialized view with indexes on the id and the type column
+        on postgresql, which can be updated using :meth:`.refresh_views`. On
+        sqlite, the view will be a table, that is kept up to date by triggers
+        on all tables in the inheritance chain.
         """
-        dropview = generate_drop_inheritance_view_statement(class_)
-        session.execute(dropview)
+        dialect = self.engine.dialect.name
+        viewname = cls2tbl(class_)[1:]
+        drops = []
+        if existing == 'materialized':
+            drops.extend(generate_drop_materialized_view_statements(
+                class_, dialect))
+            drops.append(DropMaterializedView(viewname))
+        elif existing == 'plain':
+            drops.append(DropView(viewname))
+        creates = []
         if class_.__score_db__['inheritance'] is not None:
-            createview = generate_create_inheritance_view_statement(class_)
-            session.execute(createview)
+            creates.append(
+                generate_create_inheritance_view_statement(class_))
+            if class_.__score_db__['view'] == 'materialized':
+                creates.extend(generate_create_materialized_view_statements(
+                    class_, dialect))
+        return drops, creates
+
+    def refresh_views(self, session=None, *, concurrently=True):
+        """
+        Refreshes all materialized inheritance views on postgresql. The
+        refresh will not block concurrent readers of the views, unless
+        *concurrently* is `False`.
+
+        The refresh is part of the transaction of the given *session*. If no
+        session is given, the views are refreshed in a separate transaction,
+        which is committed immediately.
+
+        This function does nothing on sqlite, where these views are always up
+        to date.
+        """
+        if self.engine.dialect.name != 'postgresql':
+            return
+        if session is None:
+            with self.engine.begin() as connection:
+                self._refresh_views(connection, concurrently)
+            return
+        self._refresh_views(session, concurrently)
+        session._mark_changed()
+
+    def _refresh_views(self, connection, concurrently):
+        for classes in self.Base.__score_db_registry__.levels():
+            for cls in classes:
+                if cls.__score_db__['view'] == 'materialized' and \
+                        cls.__score_db__['inheritance'] is not None:
+                    connection.execute(RefreshMaterializedView(
+                        cls2tbl(cls)[1:], concurrently))
 
     def destroy(self, session=None):
         """
@@ -261,3 +485,4 @@ class ConfiguredDbModule(ConfiguredModule):
         if session is None:
             session = self.Session()
         destroy(session, self.destroyable)
+        self.id_allocator.clear()
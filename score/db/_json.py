@@ -0,0 +1,169 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+"""
+Serialization of the values of :data:`score.db.JsonType` columns.
+"""
+
+import functools
+import json
+from sqlalchemy.ext.mutable import MutableDict
+
+
+def _stdlib_backend():
+    return json.dumps, json.loads
+
+
+def _orjson_backend():
+    import orjson
+
+    def dumps(value):
+        try:
+            return orjson.dumps(value).decode('utf-8')
+        except TypeError:
+            # orjson is stricter than the stdlib, it will not serialize
+            # dicts with non-string keys, for example
+            return json.dumps(value)
+
+    return dumps, orjson.loads
+
+
+backends = {
+    'json': _stdlib_backend,
+    'orjson': _orjson_backend,
+}
+
+dumps, loads = json.dumps, json.loads
+
+
+def set_backend(name='auto'):
+    """
+    Sets the library to use for serializing and de-serializing JSON values.
+    Valid values for *name* are ``json`` (python's built-in module),
+    ``orjson`` and ``auto``, which will use orjson if it is installed, and
+    fall back to python's json module otherwise.
+
+    The backend is used by the :data:`JsonType` on sqlite and—if the
+    functions returned by :func:`engine_kwargs` are passed to
+    :func:`sqlalchemy.create_engine`—by the JSONB type on postgresql.
+    """
+    global dumps, loads
+    if name == 'auto':
+        try:
+            dumps, loads = _orjson_backend()
+        except ImportError:
+            dumps, loads = _stdlib_backend()
+        return
+    try:
+        backend = backends[name]
+    except KeyError:
+        raise ValueError('Invalid JSON backend "%s"' % name)
+    dumps, loads = backend()
+
+
+def engine_kwargs():
+    """
+    Returns the keyword arguments for :func:`sqlalchemy.create_engine`, that
+    make the postgresql dialect use the configured backend.
+    """
+    return {
+        'json_serializer': lambda value: dumps(value),
+        'json_deserializer': lambda value: loads(value),
+    }
+
+
+def _decoding(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.decode()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+class LazyJsonDict(MutableDict):
+    """
+    A dict containing a JSON object, that is only de-serialized on first
+    access. The serialized value is kept until the dict is modified, so
+    writing an unmodified value back to the database does not need to
+    serialize it again.
+
+    Note that some functions implemented in C access the contents of the
+    dict directly, without calling any of its methods: ``json.dumps()`` will
+    serialize the dict as ``{}``, unless it was accessed previously. Call
+    :meth:`decode` before passing it to such functions.
+    """
+
+    # the values of instances created without calling the constructor, while
+    # unpickling, for example
+    raw = None
+    decoded = True
+
+    def __init__(self, raw):
+        super().__init__()
+        self.raw = raw
+        self.decoded = False
+
+    def decode(self):
+        """
+        De-serializes the JSON object, if that did not already happen.
+        """
+        if not self.decoded:
+            self.decoded = True
+            dict.update(self, loads(self.raw))
+
+    def changed(self):
+        self.raw = None
+        super().changed()
+
+    def __getstate__(self):
+        self.decode()
+        return dict(self)
+
+    def __setstate__(self, state):
+        self.raw = None
+        self.decoded = True
+        dict.update(self, state)
+
+    def __eq__(self, other):
+        # dict's comparison reads the contents of *other* directly
+        self.decode()
+        if isinstance(other, LazyJsonDict):
+            other.decode()
+        return super().__eq__(other)
+
+    def __ne__(self, other):
+        self.decode()
+        if isinstance(other, LazyJsonDict):
+            other.decode()
+        return super().__ne__(other)
+
+    for _name in ('__getitem__', '__contains__', '__iter__', '__len__',
+                  '__repr__', '__reduce_ex__', 'get',
+                  'keys', 'values', 'items', 'copy', '__setitem__',
+                  '__delitem__', 'setdefault', 'update', 'pop', 'popitem',
+                  'clear'):
+        locals()[_name] = _decoding(getattr(MutableDict, _name))
+    del _name
@@ -0,0 +1,318 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+"""
+Portable expressions for querying the contents of JSON columns.
+"""
+
+import re
+from sqlalchemy import (
+    Boolean, Float, Integer, String, TypeDecorator, literal, type_coerce)
+from sqlalchemy.exc import CompileError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.elements import _clone
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.types import NullType
+from . import _json
+
+
+_conversions = {
+    'int': (Integer, 'BIGINT', 'INTEGER'),
+    'float': (Float, 'DOUBLE PRECISION', 'REAL'),
+    'str': (String, None, None),
+    'bool': (Boolean, 'BOOLEAN', None),
+}
+
+_identifier_re = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class JsonComparator(TypeDecorator.Comparator):
+    """
+    Comparator of the types returned by :func:`score.db.json_type`. Indexing
+    a JSON column creates a :class:`.JsonPath`, whereas :meth:`contains`
+    tests whether the column contains a given JSON document.
+
+    The remaining operators of sqlalchemy's :class:`JSONB
+    <sqlalchemy.dialects.postgresql.JSONB>` type—like ``has_key()``,
+    ``has_any()`` or ``contained_by()``—are available as well, but can only
+    be used on postgresql.
+    """
+
+    def __getitem__(self, key):
+        return JsonPath(self.expr, ())[key]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(_jsonb_comparator(self.expr), name)
+
+    def contains(self, other, **kwargs):
+        """
+        Tests whether the column contains the JSON document *other*, i.e.
+        whether all keys of a JSON object are present with the same values,
+        or whether all members of an array are present.
+        """
+        return JsonContains(self.expr, (), other)
+
+
+class JsonPath(ColumnElement):
+    """
+    A path into a JSON column, like ``Model.data['a']['b']``. The path can
+    be extended with further keys or array indexes, and must be converted
+    to a value with one of the ``as_*`` methods before comparing it::
+
+        session.query(Model).filter(Model.data['a']['b'].as_int() > 3)
+
+    The path is always rendered as a literal, which means that the generated
+    expressions can be matched against expression indexes created with the
+    ``json_indexes`` :ref:`configuration <db_config_member>`.
+
+    Like the :class:`.JsonComparator`, paths also provide the operators of
+    sqlalchemy's JSONB type on postgresql. The ``astext`` attribute is an
+    alias of :meth:`as_str`, though, and works on sqlite, too.
+    """
+
+    type = NullType()
+
+    def __init__(self, column, path):
+        self.column = column
+        self.path = path
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return JsonPath(self.column, self.path + key)
+        if not isinstance(key, (str, int)):
+            raise TypeError('Invalid JSON path element %r' % (key,))
+        return JsonPath(self.column, self.path + (key,))
+
+    def as_int(self):
+        """
+        The value at this path as an integer.
+        """
+        return JsonValue(self, 'int')
+
+    def as_float(self):
+        """
+        The value at this path as a floating point number.
+        """
+        return JsonValue(self, 'float')
+
+    def as_str(self):
+        """
+        The value at this path as a string.
+        """
+        return JsonValue(self, 'str')
+
+    def as_bool(self):
+        """
+        The value at this path as a boolean.
+        """
+        return JsonValue(self, 'bool')
+
+    @property
+    def astext(self):
+        return self.as_str()
+
+    def contains(self, other, **kwargs):
+        """
+        Tests whether the value at this path contains the JSON document
+        *other*, see :meth:`JsonComparator.contains`.
+        """
+        return JsonContains(self.column, self.path, other)
+
+    def get_children(self, **kwargs):
+        return self.column,
+
+    def _copy_internals(self, clone=_clone, **kw):
+        self.column = clone(self.column, **kw)
+
+    @property
+    def _from_objects(self):
+        return self.column._from_objects
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(_jsonb_comparator(self), name)
+
+
+def _jsonb_comparator(expr):
+    """
+    Returns the comparator of sqlalchemy's JSONB type for given *expr*.
+    """
+    # importing the postgresql dialect is expensive and rarely needed
+    from sqlalchemy.dialects.postgresql import JSONB
+    return type_coerce(expr, JSONB()).comparator
+
+
+class JsonValue(ColumnElement):
+    """
+    The value at a :class:`.JsonPath`, converted to *conversion*, which is
+    one of ``int``, ``float``, ``str`` and ``bool``.
+    """
+
+    def __init__(self, path, conversion):
+        self.path = path
+        self.conversion = conversion
+        self.type = _conversions[conversion][0]()
+
+    def get_children(self, **kwargs):
+        return self.path,
+
+    def _copy_internals(self, clone=_clone, **kw):
+        self.path = clone(self.path, **kw)
+
+    @property
+    def _from_objects(self):
+        return self.path._from_objects
+
+
+class JsonContains(ColumnElement):
+    """
+    Tests whether the value at *path* in *column* contains the JSON document
+    *value*. Compiles to the ``@>`` operator on postgresql, which can make
+    use of GIN indexes. The sqlite implementation compares each scalar in the
+    document individually and does not support objects nested in arrays.
+    """
+
+    type = Boolean()
+
+    def __init__(self, column, path, value):
+        self.column = column
+        self.path = path
+        self.value = value
+
+    def get_children(self, **kwargs):
+        return self.column,
+
+    def _copy_internals(self, clone=_clone, **kw):
+        self.column = clone(self.column, **kw)
+
+    @property
+    def _from_objects(self):
+        return self.column._from_objects
+
+
+def _pg_path(path):
+    elements = ('"%s"' % str(key).replace('\\', '\\\\').replace('"', '\\"')
+                for key in path)
+    return "'{%s}'" % ','.join(elements).replace("'", "''")
+
+
+def _sqlite_path(path):
+    result = '$'
+    for key in path:
+        if isinstance(key, int):
+            result += '[%d]' % key
+        elif _identifier_re.match(key):
+            result += '.' + key
+        elif '"' in key:
+            raise CompileError(
+                'Cannot use JSON keys containing quotes on sqlite: %r' % key)
+        else:
+            result += '."%s"' % key
+    return "'%s'" % result.replace("'", "''")
+
+
+@compiles(JsonPath, 'postgresql')
+def visit_json_path_postgresql(element, compiler, **kw):
+    return '(%s #> %s)' % (
+        compiler.process(element.column, **kw), _pg_path(element.path))
+
+
+@compiles(JsonPath, 'sqlite')
+def visit_json_path_sqlite(element, compiler, **kw):
+    return 'json_extract(%s, %s)' % (
+        compiler.process(element.column, **kw), _sqlite_path(element.path))
+
+
+@compiles(JsonValue, 'postgresql')
+def visit_json_value_postgresql(element, compiler, **kw):
+    path = element.path
+    value = '(%s #>> %s)' % (
+        compiler.process(path.column, **kw), _pg_path(path.path))
+    cast = _conversions[element.conversion][1]
+    if cast is None:
+        return value
+    return 'CAST(%s AS %s)' % (value, cast)
+
+
+@compiles(JsonValue, 'sqlite')
+def visit_json_value_sqlite(element, compiler, **kw):
+    value = compiler.process(element.path, **kw)
+    cast = _conversions[element.conversion][2]
+    if cast is None:
+        return value
+    return 'CAST(%s AS %s)' % (value, cast)
+
+
+@compiles(JsonContains, 'postgresql')
+def visit_json_contains_postgresql(element, compiler, **kw):
+    column = compiler.process(element.column, **kw)
+    if element.path:
+        column = '(%s #> %s)' % (column, _pg_path(element.path))
+    return '%s @> CAST(%s AS JSONB)' % (
+        column, compiler.process(literal(_json.dumps(element.value)), **kw))
+
+
+@compiles(JsonContains, 'sqlite')
+def visit_json_contains_sqlite(element, compiler, **kw):
+    column = compiler.process(element.column, **kw)
+    conditions = []
+
+    def add_conditions(path, value):
+        if isinstance(value, dict):
+            if not value:
+                conditions.append("json_type(%s, %s) = 'object'" % (
+                    column, _sqlite_path(path)))
+            for key, member in value.items():
+                add_conditions(path + (key,), member)
+        elif isinstance(value, (list, tuple)):
+            if not value:
+                conditions.append("json_type(%s, %s) = 'array'" % (
+                    column, _sqlite_path(path)))
+            for member in value:
+                if isinstance(member, (dict, list, tuple)):
+                    raise CompileError(
+                        'Cannot test containment of nested JSON documents '
+                        'in arrays on sqlite')
+                conditions.append(
+                    'EXISTS (SELECT 1 FROM json_each(%s, %s) '
+                    'WHERE json_each.value = %s)' % (
+                        column, _sqlite_path(path),
+                        compiler.process(literal(member), **kw)))
+        elif value is None or isinstance(value, bool):
+            conditions.append("json_type(%s, %s) = '%s'" % (
+                column, _sqlite_path(path), _json.dumps(value)))
+        else:
+            conditions.append('json_extract(%s, %s) = %s' % (
+                column, _sqlite_path(path),
+                compiler.process(literal(value), **kw)))
+
+    add_conditions(element.path, element.value)
+    if not conditions:
+        return '1 = 1'
+    return '(%s)' % ' AND '.join(conditions)
@@ -24,7 +24,8 @@
 # the discretion of STRG.AT GmbH also the competent court, in whose district the
 # Licensee has his registered seat, an establishment or assets.
 
-from sqlalchemy.sql.expression import Executable, ClauseElement, select
+from sqlalchemy.sql.expression import (
+    Executable, ClauseElement, Insert, literal_column, select, text)
 from sqlalchemy.ext.compiler import compiles
 import textwrap
 from .helpers import cls2tbl
@@ -34,11 +35,34 @@ class DropInheritanceTrigger(Executable, ClauseElement):
     def __init__(self, table):
         self.table = table
 
+    @property
+    def trigger_name(self):
+        return 'autodel' + self.table.name
+
 
 class CreateInheritanceTrigger(Executable, ClauseElement):
-    def __init__(self, table, parent):
+    def __init__(self, table, parent, level='row'):
         self.table = table
         self.parent = parent
+        self.level = level
+
+    @property
+    def trigger_name(self):
+        return 'autodel' + self.table.name
+
+
+class InsertOnConflict(Insert):
+    """
+    An :func:`insert <sqlalchemy.sql.expression.insert>` statement into
+    *table* with an additional ``ON CONFLICT`` clause on given
+    *index_elements*. The conflicting rows are ignored, if *update_columns* is
+    empty. Otherwise, the given columns will be updated with the new values.
+    """
+
+    def __init__(self, table, index_elements, update_columns=()):
+        super().__init__(table)
+        self.index_elements = index_elements
+        self.update_columns = update_columns
 
 
 class DropView(Executable, ClauseElement):
@@ -52,13 +76,116 @@ class CreateView(Executable, ClauseElement):
         self.select = select
 
 
+class DropMaterializedView(Executable, ClauseElement):
+    def __init__(self, name):
+        self.name = name
+
+
+class CreateMaterializedView(Executable, ClauseElement):
+    def __init__(self, name, select):
+        self.name = name
+        self.select = select
+
+
+class RefreshMaterializedView(Executable, ClauseElement):
+    def __init__(self, name, concurrently=True):
+        self.name = name
+        self.concurrently = concurrently
+
+
+class DropMaterializedViewTrigger(Executable, ClauseElement):
+    def __init__(self, name, table, event):
+        self.name = name
+        self.table = table
+        self.event = event
+
+    @property
+    def trigger_name(self):
+        return 'autosync_%s_%s_%s' % (
+            self.name, self.table.name, self.event.lower())
+
+
+class CreateMaterializedViewTrigger(Executable, ClauseElement):
+    def __init__(self, name, table, event, select):
+        self.name = name
+        self.table = table
+        self.event = event
+        self.select = select
+
+    @property
+    def trigger_name(self):
+        return 'autosync_%s_%s_%s' % (
+            self.name, self.table.name, self.event.lower())
+
+
+class StatementBatch(Executable, ClauseElement):
+    """
+    Multiple *statements* sent to the database at once.
+    """
+
+    def __init__(self, statements):
+        self.statements = statements
+
+
 def generate_drop_inheritance_view_statement(class_):
     viewname = cls2tbl(class_)[1:]
+    if class_.__score_db__['view'] == 'materialized':
+        return DropMaterializedView(viewname)
     return DropView(viewname)
 
 
 def generate_create_inheritance_view_statement(class_):
     viewname = cls2tbl(class_)[1:]
+    viewselect = _generate_inheritance_view_select(class_)
+    if class_.__score_db__['view'] == 'materialized':
+        return CreateMaterializedView(viewname, viewselect)
+    return CreateView(viewname, viewselect)
+
+
+def generate_create_materialized_view_statements(class_, dialect):
+    """
+    Returns the statements that need to be executed after the creation of a
+    materialized inheritance view of given *class_*: the indexes of the view
+    and — on sqlite, where the view is emulated with a table — the triggers
+    keeping it up to date.
+    """
+    viewname = cls2tbl(class_)[1:]
+    statements = [
+        text('CREATE UNIQUE INDEX "ix_{view}_id" ON "{view}" (id)'.format(
+            view=viewname)),
+        text('CREATE INDEX "ix_{view}_type" ON "{view}" ("{col}")'.format(
+            view=viewname, col=class_.__score_db__['type_column'])),
+    ]
+    if dialect != 'sqlite':
+        return statements
+    registry = class_.__score_db__['base'].__score_db_registry__
+    viewselect = _generate_inheritance_view_select(class_).where(
+        class_.__table__.c.id == literal_column('NEW.id'))
+    for table in registry.tables(class_):
+        for event in ('INSERT', 'UPDATE'):
+            statements.append(CreateMaterializedViewTrigger(
+                viewname, table, event, viewselect))
+        statements.append(CreateMaterializedViewTrigger(
+            viewname, table, 'DELETE', None))
+    return statements
+
+
+def generate_drop_materialized_view_statements(class_, dialect):
+    """
+    Returns the statements that need to be executed before a materialized
+    inheritance view of given *class_* can be dropped.
+    """
+    if dialect != 'sqlite':
+        return []
+    registry = class_.__score_db__['base'].__score_db_registry__
+    viewname = cls2tbl(class_)[1:]
+    return [DropMaterializedViewTrigger(viewname, table, event)
+            for table in registry.tables(class_)
+            for event in ('INSERT', 'UPDATE', 'DELETE')]
+
+
+def _generate_inheritance_view_select(class_):
+    registry = class_.__score_db__['base'].__score_db_registry__
     tables = class_.__table__
     cols = {}
     def add_cols(table):
@@ -67,63 +194,84 @@ def generate_create_inheritance_view_statement(class_):
                 cols[col.name] = col
     add_cols(class_.__table__)
     if class_.__score_db__['inheritance'] is not None:
-        parent = class_.__score_db__['parent']
-        while parent:
+        for parent in registry.ancestors(class_):
             table = parent.__table__
             tables = tables.join(
                 table, onclause=table.c.id == class_.__table__.c.id)
             add_cols(table)
-            parent = parent.__score_db__['parent']
     if class_.__score_db__['inheritance'] != 'single-table':
-        viewselect = select(cols.values(), from_obj=tables)
-    else:
-        typecol = getattr(
-            class_, class_.__score_db__['type_column'])
-        typenames = []
-        def add_typenames(cls):
-            typenames.append(cls.__score_db__['type_name'])
-            for subclass in cls.__subclasses__():
-                add_typenames(subclass)
-        add_typenames(class_)
-        viewselect = select(cols.values(),
-                            from_obj=class_.__table__,
-                            whereclause=typecol.in_(typenames))
-    return CreateView(viewname, viewselect)
+        return select(cols.values(), from_obj=tables)
+    typecol = getattr(
+        class_, class_.__score_db__['type_column'])
+    return select(cols.values(),
+                  from_obj=class_.__table__,
+                  whereclause=typecol.in_(registry.type_names(class_)))
 
 
 @compiles(DropInheritanceTrigger, 'sqlite')
 def visit_drop_inheritance_trigger_sqlite(element, compiler, **kw):
-    return "DROP TRIGGER IF EXISTS autodel{table}".format(
-        table=element.table.name)
+    return "DROP TRIGGER IF EXISTS %s" % element.trigger_name
 
 
 @compiles(DropInheritanceTrigger, 'postgresql')
 def visit_drop_inheritance_trigger_postgresql(element, compiler, **kw):
-    return "DROP TRIGGER IF EXISTS autodel{table} ON {table}".format(
-        table=element.table.name)
+    return "DROP TRIGGER IF EXISTS {trigger} ON {table}".format(
+        trigger=element.trigger_name, table=element.table.name)
 
 
 @compiles(CreateInheritanceTrigger, 'sqlite')
 def visit_create_inheritance_trigger_sqlite(element, compiler, **kw):
     return textwrap.dedent("""
-        CREATE TRIGGER autodel{table} AFTER DELETE ON {table}
+        CREATE TRIGGER {trigger} AFTER DELETE ON {table}
         FOR EACH ROW BEGIN
             DELETE FROM {parent} WHERE id = OLD.id;
         END
-    """).strip().format(parent=element.parent.name, table=element.table.name)
+    """).strip().format(parent=element.parent.name, table=element.table.name,
+                        trigger=element.trigger_name)
 
 
 @compiles(CreateInheritanceTrigger, 'postgresql')
 def visit_create_inheritance_trigger_postgresql(element, compiler, **kw):
+    if element.level == 'statement':
+        # requires postgresql 10 for transition tables
+        return textwrap.dedent("""
+            CREATE OR REPLACE FUNCTION autodelstmt{parent}() RETURNS TRIGGER
+            AS $_$
+                BEGIN
+                    DELETE FROM {parent} WHERE id IN (SELECT id FROM old_rows);
+                    RETURN NULL;
+                END $_$ LANGUAGE 'plpgsql';
+            CREATE TRIGGER {trigger} AFTER DELETE ON {table}
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE autodelstmt{parent}()
+        """).strip().format(parent=element.parent.name,
+                            table=element.table.name,
+                            trigger=element.trigger_name)
     return textwrap.dedent("""
         CREATE OR REPLACE FUNCTION autodel{parent}() RETURNS TRIGGER AS $_$
             BEGIN
                 DELETE FROM {parent} WHERE id = OLD.id;
                 RETURN OLD;
             END $_$ LANGUAGE 'plpgsql';
-        CREATE TRIGGER autodel{table} AFTER DELETE ON {table}
-        FOR EACH ROW EXECUTE PROCEDURE autodel{parent}();
-    """).strip().format(parent=element.parent.name, table=element.table.name)
+        CREATE TRIGGER {trigger} AFTER DELETE ON {table}
+        FOR EACH ROW EXECUTE PROCEDURE autodel{parent}()
+    """).strip().format(parent=element.parent.name, table=element.table.name,
+                        trigger=element.trigger_name)
+
+
+@compiles(InsertOnConflict, 'sqlite')
+@compiles(InsertOnConflict, 'postgresql')
+def visit_insert_on_conflict(element, compiler, **kw):
+    preparer = compiler.preparer
+    target = ', '.join(map(preparer.quote, element.index_elements))
+    if not element.update_columns:
+        action = 'DO NOTHING'
+    else:
+        action = 'DO UPDATE SET ' + ', '.join(
+            '{col} = excluded.{col}'.format(col=preparer.quote(col))
+            for col in element.update_columns)
+    return '%s ON CONFLICT (%s) %s' % (
+        compiler.visit_insert(element, **kw), target, action)
 
 
 @compiles(DropView, 'sqlite')
@@ -139,3 +287,67 @@ def visit_create_view(element, compiler, **kw):
          element.name,
          compiler.process(element.select, literal_binds=True)
      )
+
+
+@compiles(DropMaterializedView, 'sqlite')
+def visit_drop_materialized_view_sqlite(element, compiler, **kw):
+    return 'DROP TABLE IF EXISTS "%s"' % element.name
+
+
+@compiles(DropMaterializedView, 'postgresql')
+def visit_drop_materialized_view_postgresql(element, compiler, **kw):
+    return 'DROP MATERIALIZED VIEW IF EXISTS "%s"' % element.name
+
+
+@compiles(CreateMaterializedView, 'sqlite')
+def visit_create_materialized_view_sqlite(element, compiler, **kw):
+    return 'CREATE TABLE "%s" AS %s' % (
+         element.name,
+         compiler.process(element.select, literal_binds=True)
+     )
+
+
+@compiles(CreateMaterializedView, 'postgresql')
+def visit_create_materialized_view_postgresql(element, compiler, **kw):
+    return 'CREATE MATERIALIZED VIEW "%s" AS %s' % (
+         element.name,
+         compiler.process(element.select, literal_binds=True)
+     )
+
+
+@compiles(RefreshMaterializedView, 'postgresql')
+def visit_refresh_materialized_view(element, compiler, **kw):
+    return 'REFRESH MATERIALIZED VIEW %s"%s"' % (
+        'CONCURRENTLY ' if element.concurrently else '', element.name)
+
+
+@compiles(DropMaterializedViewTrigger, 'sqlite')
+def visit_drop_materialized_view_trigger(element, compiler, **kw):
+    return 'DROP TRIGGER IF EXISTS "%s"' % element.trigger_name
+
+
+@compiles(CreateMaterializedViewTrigger, 'sqlite')
+def visit_create_materialized_view_trigger(element, compiler, **kw):
+    if element.event == 'DELETE':
+        insert = ''
+    else:
+        insert = 'INSERT INTO "%s" %s;' % (
+            element.name,
+            compiler.process(element.select, literal_binds=True))
+    return textwrap.dedent("""
+        CREATE TRIGGER "{trigger}"
+        AFTER {EVENT} ON {table}
+        FOR EACH ROW BEGIN
+            DELETE FROM "{view}" WHERE id = {row}.id;
+            {insert}
+        END
+    """).strip().format(
+        view=element.name, table=element.table.name,
+        trigger=element.trigger_name, EVENT=element.event,
+        row='OLD' if element.event == 'DELETE' else 'NEW', insert=insert)
+
+
+@compiles(StatementBatch, 'postgresql')
+def visit_statement_batch(element, compiler, **kw):
+    return ';\n'.join(
+        compiler.process(stmt, **kw) for stmt in element.statements)
@@ -24,10 +24,24 @@
 # the discretion of STRG.AT GmbH also the competent court, in whose district the
 # Licensee has his registered seat, an establishment or assets.
 
-from datetime import datetime
-from sqlalchemy import Table, Column
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count, islice
+import json
+import sys
+from sqlalchemy import Table, Column, Integer, MetaData, String, event
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.expression import (
+    and_, bindparam, column, exists, literal, select, text, tuple_,
+    UnaryExpression)
 from sqlalchemy.orm.session import Session as SASession
 import sqlalchemy.orm as sa_orm
+import sqlalchemy.util as sa_util
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.ext.orderinglist import OrderingList
+from ._cache import Query as CachingQuery
+from ._sa_stmt import InsertOnConflict
 
 
 class IdNotFound(Exception):
@@ -38,37 +52,127 @@ class IdNotFound(Exception):
     pass
 
 
+class TemporaryTablePool:
+    """
+    Pool of temporary tables belonging to a single database connection. The
+    pool is stored in the connection's :attr:`info
+    <sqlalchemy.engine.Connection.info>` dict and thus lives as long as the
+    underlying DBAPI connection.
+
+    Tables are not dropped after usage, but kept for later re-use by another
+    temporary table with the same column definitions. The tables are neither
+    part of the application's metadata, nor visible to other connections.
+    """
+
+    def __init__(self):
+        self.counter = count()
+        self.free = {}
+
+    @classmethod
+    def get(cls, connection):
+        """
+        Returns the pool of given *connection*.
+        """
+        try:
+            return connection.info['score.db.tmp']
+        except KeyError:
+            pool = connection.info['score.db.tmp'] = cls()
+            return pool
+
+    def acquire(self, connection, columns):
+        """
+        Returns an empty temporary table with given *columns* and a flag
+        indicating whether the table was created in the database.
+        """
+        signature = self._signature(columns)
+        try:
+            table = self.free[signature].pop()
+        except (KeyError, IndexError):
+            pass
+        else:
+            if connection.dialect.name == 'postgresql':
+                connection.execute('TRUNCATE %s' % table.name)
+            else:
+                connection.execute(table.delete())
+            return table, False
+        table = Table('tmp%d' % next(self.counter), MetaData(),
+                      *(col.copy() for col in columns),
+                      prefixes=['TEMPORARY'],
+                      postgresql_on_commit='DELETE ROWS')
+        table.info['score.db.signature'] = signature
+        table.create(connection)
+        return table, True
+
+    def release(self, table):
+        """
+        Makes given *table* available for re-use.
+        """
+        signature = table.info['score.db.signature']
+        self.free.setdefault(signature, []).append(table)
+
+    def forget(self, table):
+        """
+        Removes given *table* from the pool, since it no longer exists in the
+        database.
+        """
+        signature = table.info['score.db.signature']
+        try:
+            self.free[signature].remove(table)
+        except (KeyError, ValueError):
+            pass
+
+    def _signature(self, columns):
+        return tuple((col.name, repr(col.type), col.primary_key, col.nullable)
+                     for col in columns)
+
+
 class TemporaryTableCreator:
     """
-    Helper class that wraps the creation and destruction of temporary tables
+    Helper class that wraps the acquisition and release of temporary tables
     within `with` blocks. There is no need to us this class directly, you can
     just use :meth:`.Session.mktmp`, instead.
     """
 
-    def __init__(self, session, columns):
+    def __init__(self, session, columns, rows=None):
         self.session = session
         self.columns = columns
+        self.rows = rows
+        self.pool = None
         self.table = None
 
     def __enter__(self):
         """
         Creates and returns the temporary table.
         """
-        metadata = self.session.dbconf.Base.metadata
-        name = 'tmp%d' % ((datetime.now().timestamp() * 1000) % 10**8)
-        while name in metadata.tables:
-            name = 'tmp%d' % ((datetime.now().timestamp() * 1000) % 10**8)
-        name = 'temp.%s' % name
-        self.table = Table(name, metadata, *self.columns)
-        metadata.create_all(tables=[self.table])
-        return self.table
+        return self.acquire()
 
     def __exit__(self, type, value, traceback):
         """
-        Destroys the temporary table created during :meth:`__enter__`.
+        Releases the temporary table acquired during :meth:`__enter__`.
         """
-        metadata = self.session.dbconf.Base.metadata
-        metadata.drop_all(tables=[self.table])
+        self.release()
+
+    def acquire(self):
+        """
+        Fetches an empty temporary table from the connection's
+        :class:`.TemporaryTablePool`, fills it with the *rows* passed to the
+        constructor and returns it.
+        """
+        connection = self.session.connection()
+        self.pool = TemporaryTablePool.get(connection)
+        self.table, created = self.pool.acquire(connection, self.columns)
+        if created:
+            self.session._tmp_created.append(
+                (self.pool, self.table, self.session.transaction))
+        if self.rows is not None:
+            self.session._insert_rows(self.table, self.rows)
+        return self.table
+
+    def release(self):
+        """
+        Returns the table acquired during :meth:`acquire` to the pool.
+        """
+        self.pool.release(self.table)
 
 
 class SessionMixin:
@@ -77,7 +181,22 @@ class SessionMixin:
     classes that adds some convenience features.
     """
 
-    def mktmp(self, columns):
+    def __init__(self):
+        self._missing_ids = set()
+        self._cache_pending = set()
+        self._tmp_tables = []
+        self._tmp_created = []
+        self._reserved_ids = []
+        self._prefetch_executor = None
+        self._zope_extension = None
+        self.by_ids_stats = {
+            'identity_map_hits': 0,
+            'cache_hits': 0,
+            'missing_ids_hits': 0,
+            'queried': 0,
+        }
+
+    def mktmp(self, columns, rows=None):
         """
         Provides a scoped temporary table with provided *columns* definitions.
         Example usage::
@@ -87,13 +206,211 @@ class SessionMixin:
                 do_something(with=tmp_table)
             # the table is deleted automatically at this point
 
+        The table can be filled with an iterable of *rows*, each of which must
+        be a tuple containing the values in the order of the *columns*. The
+        rows are transmitted using ``COPY FROM STDIN`` on PostgreSQL and
+        batches of multi-row ``INSERT`` statements on SQLite::
+
+            rows = ((id, ) for id in ids)
+            with session.mktmp([Column('id', IdType)], rows=rows) as tmp:
+                # ...
+
         """
         if not isinstance(columns, list):
             columns = list(columns)
-        return TemporaryTableCreator(self, columns)
+        return TemporaryTableCreator(self, columns, rows)
+
+    def filter_in(self, query, column, values, *, threshold=1000):
+        """
+        Restricts given *query* to rows, where *column* contains one of the
+        given *values*. This is equivalent to::
+
+            query.filter(column.in_(values))
+
+        If there are more than *threshold* values, the values are stored in a
+        temporary table instead, which is joined to the query. The temporary
+        table is returned to the connection's :class:`.TemporaryTablePool`
+        when the transaction is committed and emptied once it is re-used, so
+        the returned query must be executed before the transaction is
+        committed.
+        """
+        values = list(values)
+        if len(values) <= threshold:
+            return query.filter(column.in_(values))
+        rows = ((value, ) for value in set(values))
+        creator = self.mktmp([Column('value', column.type, primary_key=True)],
+                             rows=rows)
+        table = creator.acquire()
+        self._tmp_tables.append(creator)
+        return query.join(table, table.c.value == column)
+
+    def bulk_save(self, cls, rows, *, on_conflict=None):
+        """
+        Inserts *rows* of given database class *cls* without creating any
+        objects. Each row must be a dict mapping attribute names of *cls* to
+        their values. Returns the list of ids of the inserted rows.
+
+        Rows without an ``id`` receive a new id from the database before
+        anything is written. Afterwards, each table in the :ref:`inheritance
+        <db_inheritance>` chain of *cls* is written using a single ``COPY``
+        statement on PostgreSQL or as few multi-row ``INSERT`` statements as
+        possible on SQLite::
+
+            ids = session.bulk_save(Blogger, (
+                {'name': name, 'may_publish': False} for name in names))
+
+        Passing ``'ignore'`` as *on_conflict* will skip rows with an id that
+        already exists in the database, while ``'update'`` will overwrite all
+        given values of these rows instead.
+
+        Note that the rows are written immediately, bypassing the session's
+        unit of work: objects already present in the session will not be
+        updated. Entries of updated rows are removed from the
+        :class:`.ObjectCache`, though.
+        """
+        if on_conflict not in (None, 'ignore', 'update'):
+            raise ValueError('Invalid on_conflict value "%s"' % on_conflict)
+        mapper = sa_inspect(cls)
+        tables = cls.__score_db__['base'].__score_db_registry__.tables(cls)
+        rows = [dict(row) for row in rows]
+        missing = [row for row in rows if row.get('id') is None]
+        if missing:
+            ids = self._allocate_ids(cls, len(missing))
+            for row, id in zip(missing, ids):
+                row['id'] = id
+        if cls.__score_db__['inheritance'] is not None:
+            type_attr = cls.__score_db__['type_column']
+            for row in rows:
+                row[type_attr] = mapper.polymorphic_identity
+        for table in tables:
+            columns = []
+            keys = []
+            for column in table.c:
+                try:
+                    key = mapper.get_property_by_column(column).key
+                except sa_orm.exc.UnmappedColumnError:
+                    key = column.key
+                if column.default is None and \
+                        not any(key in row for row in rows):
+                    # leave the column to the database
+                    continue
+                columns.append(column)
+                keys.append(key)
+            values = [tuple(self._bulk_value(row, key, column)
+                            for key, column in zip(keys, columns))
+                      for row in rows]
+            self._insert_rows(table, values, columns=columns,
+                              on_conflict=on_conflict)
+        cache = self.dbconf.cache
+        if cache is not None and on_conflict == 'update':
+            keys = set(sa_orm.util.identity_key(cls, row['id'])
+                       for row in rows)
+            self._cache_pending.update(keys)
+            cache.invalidate(keys)
+        return [row['id'] for row in rows]
+
+    def _bulk_value(self, row, key, column):
+        """
+        Returns the value of *column* in given *row* for :meth:`.bulk_save`,
+        applying the column's python-side default, if the *key* is missing.
+        """
+        try:
+            return row[key]
+        except KeyError:
+            pass
+        default = column.default
+        if default is None or not (default.is_scalar or default.is_callable):
+            return None
+        if default.is_scalar:
+            return default.arg
+        return default.arg(None)
+
+    def _allocate_ids(self, cls, count):
+        """
+        Reserves *count* new ids for given database class *cls* and returns
+        them as a list.
+        """
+        if count == 0:
+            return []
+        root = cls.__score_db__['base'].__score_db_registry__.root(cls)
+        block_size = root.__score_db__['id_block_size']
+        if block_size:
+            return self.dbconf.id_allocator.allocate(
+                self, root.__table__, count, block_size)
+        dialect = self.dbconf.engine.dialect.name
+        if dialect == 'postgresql':
+            sql = text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                       "FROM generate_series(1, :count)")
+            return [id for (id, ) in self.execute(
+                sql, {'table': root.__tablename__, 'count': count})]
+        if dialect == 'sqlite':
+            # sqlite will assign max(id) + 1 to new rows without an id. the
+            # no-op update acquires the database's write lock before max(id)
+            # is read, keeping concurrent writers from receiving the same ids
+            # until this transaction ends.
+            self.execute(text('UPDATE "%s" SET id = id WHERE 0 = 1' %
+                              root.__tablename__))
+            sql = text('SELECT COALESCE(MAX(id), 0) FROM "%s"' %
+                       root.__tablename__)
+            last = self.execute(sql).scalar()
+            return list(range(last + 1, last + 1 + count))
+        raise Exception(
+            'Can only allocate ids in sqlite and postgresql databases')
+
+    def _insert_rows(self, table, rows, *, columns=None, on_conflict=None):
+        """
+        Inserts all *rows* (tuples of values in the order of the table's
+        *columns*) into given *table* using the fastest method available for
+        the current database. See :meth:`.bulk_save` for the description of the
+        *on_conflict* parameter.
+        """
+        if columns is None:
+            columns = list(table.c)
+        dialect = self.dbconf.engine.dialect.name
+        self._mark_changed()
+        if on_conflict is None and dialect == 'postgresql':
+            from .pg import copy_rows
+            rows = list(rows)
+            try:
+                copy_rows(self, table, rows, columns=columns)
+                return
+            except TypeError:
+                # some value has no representation in the COPY format, fall
+                # back to INSERT statements below.
+                pass
+        if on_conflict is None and dialect == 'sqlite':
+            from .sqlite import insert_rows
+            insert_rows(self, table, rows, columns=columns)
+            return
+        keys = [c.key for c in columns]
+        if on_conflict is None:
+            def execute(chunk):
+                self.execute(table.insert(), chunk)
+        else:
+            index_elements = [c.name for c in table.primary_key]
+            update_columns = []
+            if on_conflict == 'update':
+                update_columns = [c.name for c in columns
+                                  if c.name not in index_elements]
+
+            def execute(chunk):
+                self.execute(InsertOnConflict(
+                    table, index_elements, update_columns).values(chunk))
+        batch_size = 1000
+        if dialect == 'sqlite':
+            from .sqlite import MAX_VARIABLES
+            batch_size = max(1, MAX_VARIABLES // len(keys))
+        rows = iter(rows)
+        while True:
+            chunk = [dict(zip(keys, row)) for row in islice(rows, batch_size)]
+            if not chunk:
+                break
+            execute(chunk)
 
     def by_ids(self, type, ids, *, order='_ids',
-               yield_per=100, ignore_missing=True):
+               yield_per=100, ignore_missing=True, single_query=False,
+               use_identity_map=True, remember_missing=False, prefetch=0,
+               polymorphic_load=False):
         """
         Yields objects of *type* with given *ids*. The parameter *yield_per*
         defines the chunk size of each database operation.
@@ -108,19 +425,165 @@ class SessionMixin:
             for user in session.by_ids(User, [4,2,5]):
                 print(user)
 
+        Ids occurring multiple times in *ids* will yield the same object
+        multiple times in this default order.
+
         It is possible to provide a different or ordering by passing an
         sqlalchemy expression as *order*::
 
             for user in session.by_ids(User, [4,2,5], order=User.name.desc()):
                 # ...
 
+        Passing a truthy value as *single_query* will send the whole list of
+        *ids* to the database at once (as an array on PostgreSQL and as a JSON
+        document on SQLite) and join it against the table of *type*. The
+        result is sorted by the database and streamed through a server-side
+        cursor, fetching *yield_per* rows at a time. Missing ids are detected
+        within the same query. Other databases fall back to the default
+        behaviour.
+
         .. note::
             If you provide a custom *order*, and if there would be more than
             one database operation (i.e. if ``len(ids) > yield_per``), the
             function will create a temporary table for sorting the result. If
             you have enough memory, you might want to pass *yield_per* as
-            ``len(ids)`` to avoid that.
+            ``len(ids)`` to avoid that. Passing *single_query* avoids the
+            temporary table, too.
+
+        Unless *use_identity_map* is `False`, objects already present in the
+        session's identity map or in the :class:`object cache
+        <score.db.ObjectCache>` are returned without querying the database.
+        This does not apply to custom *order* expressions, since these can
+        only be evaluated by the database.
+
+        If *remember_missing* is truthy, ids found to be missing are stored
+        in the session and will not be queried again until the next flush.
+        The number of objects served from the identity map and the object
+        cache, the number of ids skipped due to *remember_missing* and the
+        number of ids actually queried are counted in the session's
+        ``by_ids_stats`` dict.
+
+        A positive *prefetch* value will query up to that many chunks in a
+        background thread while the caller is still processing the current
+        one. The background queries run on a dedicated connection and thus
+        will not see any uncommitted changes of this session. The loaded
+        objects are merged into this session before they are returned, unless
+        the session already contains an object with the same id, which is
+        returned unchanged instead. The background thread is started on first
+        use and kept until the session is closed. This mode is only available
+        without a custom *order* and is ignored on SQLite, where connections
+        cannot be shared between threads.
+
+        If *type* has sub-classes with their own tables (i.e. joined-table
+        :ref:`inheritance <db_inheritance>`), the columns of these tables are
+        normally loaded lazily for each object, unless the class was
+        configured with a ``polymorphic_load`` value in its :ref:`__score_db__
+        <db_config_member>` member. Passing a truthy *polymorphic_load* value
+        will instead load these columns with one additional query per
+        sub-class and chunk.
         """
+        ids = list(ids)
+        if order is not None and order != '_ids' or \
+                not (use_identity_map or remember_missing):
+            self.by_ids_stats['queried'] += len(ids)
+            yield from self._by_ids_query(
+                type, ids, order, yield_per, ignore_missing, single_query,
+                prefetch, polymorphic_load)
+            return
+        found = {}
+        query_ids = []
+        for id in ids:
+            if remember_missing and (type, id) in self._missing_ids:
+                self.by_ids_stats['missing_ids_hits'] += 1
+                if not ignore_missing:
+                    raise IdNotFound(id)
+                continue
+            if use_identity_map:
+                obj = self._from_identity_map(type, id)
+                if obj is not None:
+                    self.by_ids_stats['identity_map_hits'] += 1
+                    found[id] = obj
+                    continue
+                obj = self._from_cache(type, id)
+                if obj is not None:
+                    self.by_ids_stats['cache_hits'] += 1
+                    found[id] = obj
+                    continue
+            query_ids.append(id)
+        self.by_ids_stats['queried'] += len(query_ids)
+        result = self._by_ids_query(
+            type, query_ids, order, yield_per, ignore_missing, single_query,
+            prefetch, polymorphic_load)
+        if order is None:
+            yield from found.values()
+            found_ids = set()
+            for obj in result:
+                found_ids.add(obj.id)
+                yield obj
+            if remember_missing:
+                self._missing_ids.update(
+                    (type, id) for id in query_ids if id not in found_ids)
+            return
+        # the query yields objects in the order of *query_ids*, skipping
+        # missing ones. we can thus merge both sources by comparing the next
+        # object's id with the id we are expecting.
+        next_obj = next(result, None)
+        for id in ids:
+            if id in found:
+                yield found[id]
+            elif next_obj is not None and next_obj.id == id:
+                yield next_obj
+                next_obj = next(result, None)
+            elif remember_missing:
+                self._missing_ids.add((type, id))
+
+    def _from_identity_map(self, type, id):
+        """
+        Returns the object of given *type* with given *id*, if it is present
+        in the identity map and has not been expired or deleted.
+        """
+        key = sa_orm.util.identity_key(type, id)
+        obj = self.identity_map.get(key)
+        if obj is None or not isinstance(obj, type) or obj in self.deleted:
+            return None
+        if sa_inspect(obj).expired:
+            return None
+        return obj
+
+    def _from_cache(self, type, id):
+        """
+        Returns the object of given *type* with given *id*, if the configured
+        :class:`.ObjectCache` contains an entry for it. The returned object
+        will be attached to this session.
+        """
+        cache = self.dbconf.cache
+        if cache is None or not cache.caches(type):
+            return None
+        key = sa_orm.util.identity_key(type, id)
+        if key in self.identity_map or key in self._cache_pending:
+            return None
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        class_, values = entry
+        if not issubclass(class_, type):
+            return None
+        obj = sa_inspect(class_).class_manager.new_instance()
+        for name, value in values.items():
+            set_committed_value(obj, name, value)
+        sa_orm.make_transient_to_detached(obj)
+        self.add(obj)
+        return obj
+
+    def _by_ids_query(self, type, ids, order, yield_per, ignore_missing,
+                      single_query, prefetch, polymorphic_load):
+        """
+        Performs the database queries for :meth:`.by_ids`.
+        """
+        if single_query and self._ids_selectable_supported():
+            yield from self._by_ids_single_query(
+                type, ids, order, yield_per, ignore_missing, polymorphic_load)
+            return
         if ignore_missing:
             def test_missing(ids, objects):
                 pass
@@ -136,6 +599,13 @@ class SessionMixin:
                     found_ids = list(map(lambda o: o.id, result))
                 first_missing = next(id for id in ids if id not in found_ids)
                 raise IdNotFound(first_missing)
+        if prefetch > 0 and order in (None, '_ids') and \
+                len(ids) > yield_per and \
+                self.dbconf.engine.dialect.name != 'sqlite':
+            yield from self._by_ids_prefetch(
+                type, ids, order, yield_per, test_missing, prefetch,
+                polymorphic_load)
+            return
         if order is None:
             # unsorted, just return in random order.
             # note: we're not using sqlalchemy's Query.yield_per() here, since
@@ -144,7 +614,10 @@ class SessionMixin:
             while len(ids) > 0:
                 chunk = ids[0:yield_per]
                 ids = ids[yield_per:]
-                objects = self.query(type).filter(type.id.in_(chunk)).all()
+                objects = self._by_ids_options(
+                    self.query(type), type, polymorphic_load).\
+                    filter(type.id.in_(chunk)).\
+                    all()
                 test_missing(chunk, objects)
                 yield from objects
             return
@@ -153,14 +626,16 @@ class SessionMixin:
             while len(ids) > 0:
                 chunk = ids[0:yield_per]
                 ids = ids[yield_per:]
-                result = dict(self.query(type.id, type).
-                              filter(type.id.in_(chunk)))
+                result = dict(self._by_ids_options(
+                    self.query(type.id, type), type, polymorphic_load).
+                    filter(type.id.in_(chunk)))
                 test_missing(chunk, result)
                 yield from (result[id] for id in chunk if id in result)
             return
         if len(ids) <= yield_per:
             # sort by something, but use a single query
-            objects = self.query(type).\
+            objects = self._by_ids_options(
+                self.query(type), type, polymorphic_load).\
                 filter(type.id.in_(ids)).\
                 order_by(order).\
                 all()
@@ -175,20 +650,456 @@ class SessionMixin:
         tmpcols = [
             Column('id', type.id.property.columns[0].type, primary_key=True),
         ]
-        with self.mktmp(tmpcols) as tmp:
-            while len(ids) > 0:
-                chunk = ids[0:yield_per]
-                ids = ids[yield_per:]
-                self.execute(tmp.insert(), map(lambda id: {'id': id}, chunk))
-            sorted_ids = self.query(type.id).\
-                join(tmp, onclause=(tmp.ref == type.id)).\
-                order_by(order).\
+        with self.mktmp(tmpcols, rows=((id, ) for id in set(ids))) as tmp:
+            sorted_ids = [id for (id, ) in self.query(type.id).
+                          join(tmp, tmp.c.id == type.id).
+                          order_by(order)]
+        if not ignore_missing and len(set(ids)) != len(sorted_ids):
+            found_ids = set(sorted_ids)
+            first_missing = next(id for id in ids if id not in found_ids)
+            raise IdNotFound(first_missing)
+        yield from self._by_ids_query(type, sorted_ids, '_ids', yield_per,
+                                      ignore_missing, False, prefetch,
+                                      polymorphic_load)
+
+    def _by_ids_options(self, query, type, polymorphic_load):
+        """
+        Adds loader options to a *query* of :meth:`.by_ids`. If
+        *polymorphic_load* is truthy, the tables of all sub-classes of *type*
+        will be loaded with one query per sub-class.
+        """
+        if not polymorphic_load:
+            return query
+        mapper = sa_inspect(type)
+        subclasses = [m.class_ for m in mapper.self_and_descendants
+                      if m is not mapper and not m.single]
+        if not subclasses:
+            return query
+        return query.options(sa_orm.selectin_polymorphic(type, subclasses))
+
+    def _by_ids_prefetch(self, type, ids, order, yield_per, test_missing,
+                         prefetch, polymorphic_load):
+        """
+        Implementation of :meth:`.by_ids` for the *prefetch* mode. A single
+        worker thread with its own session and connection performs the
+        queries, while at most *prefetch* chunks are waiting to be consumed.
+        """
+        connection = self.dbconf.engine.connect()
+        session = self.dbconf.Session(bind=connection, extension=[])
+
+        def fetch(chunk):
+            objects = self._by_ids_options(
+                session.query(type), type, polymorphic_load).\
+                filter(type.id.in_(chunk)).\
                 all()
-            if not ignore_missing and len(ids) != len(sorted_ids):
-                first_missing = next(id for id in ids if id not in sorted_ids)
-                raise IdNotFound(first_missing)
-        return self.by_ids(type, sorted_ids, order='_id', yield_per=yield_per,
-                           ignore_missing=ignore_missing)
+            session.expunge_all()
+            return objects
+
+        chunks = [ids[i:i + yield_per] for i in range(0, len(ids), yield_per)]
+        pending = deque()
+        if self._prefetch_executor is None:
+            self._prefetch_executor = ThreadPoolExecutor(max_workers=1)
+        executor = self._prefetch_executor
+        try:
+            for chunk in chunks:
+                pending.append((chunk, executor.submit(fetch, chunk)))
+                if len(pending) <= prefetch:
+                    continue
+                chunk, future = pending.popleft()
+                yield from self._by_ids_merge(
+                    chunk, future.result(), order, test_missing)
+            while pending:
+                chunk, future = pending.popleft()
+                yield from self._by_ids_merge(
+                    chunk, future.result(), order, test_missing)
+        finally:
+            for chunk, future in pending:
+                if not future.cancel():
+                    future.exception()
+            session.close()
+            connection.close()
+
+    def _by_ids_merge(self, chunk, objects, order, test_missing):
+        """
+        Merges *objects* loaded by :meth:`._by_ids_prefetch` into this session
+        and returns them in the requested *order*.
+        """
+        merged = []
+        for obj in objects:
+            # never overwrite objects of this session, they might contain
+            # changes that were not flushed, yet
+            existing = self.identity_map.get(sa_inspect(obj).key)
+            if existing is None:
+                existing = self.merge(obj, load=False)
+            merged.append(existing)
+        objects = merged
+        if order is None:
+            test_missing(chunk, objects)
+            return objects
+        result = dict((obj.id, obj) for obj in objects)
+        test_missing(chunk, result)
+        return [result[id] for id in chunk if id in result]
+
+    def _ids_selectable_supported(self):
+        """
+        Whether :meth:`._ids_selectable` can be used with the current database.
+        """
+        return self.dbconf.engine.dialect.name in ('postgresql', 'sqlite')
+
+    def _ids_selectable(self, type, ids):
+        """
+        Returns a selectable with the columns ``id`` and ``position``,
+        containing all given *ids* along with their (1-based) position in the
+        list. The whole list is passed to the database as a single parameter.
+        """
+        idtype = type.id.property.columns[0].type
+        if self.dbconf.engine.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import ARRAY
+            stmt = text(
+                'SELECT * FROM unnest(:ids) WITH ORDINALITY '
+                'AS _ids(id, position)')
+            stmt = stmt.bindparams(bindparam(
+                'ids', value=ids, type_=ARRAY(idtype)))
+        else:
+            stmt = text(
+                'SELECT value AS id, "key" + 1 AS position '
+                'FROM json_each(:ids)')
+            stmt = stmt.bindparams(bindparam(
+                'ids', value=json.dumps(ids), type_=String))
+        return stmt.columns(
+            column('id', idtype), column('position', Integer)).alias('_ids')
+
+    def _by_ids_single_query(self, type, ids, order, yield_per,
+                             ignore_missing, polymorphic_load):
+        """
+        Implementation of :meth:`.by_ids` for the *single_query* mode.
+        """
+        if not ids:
+            return
+        idtbl = self._ids_selectable(type, ids)
+        # the position keeps sqlalchemy from de-duplicating the rows of ids
+        # occurring multiple times
+        query = self._by_ids_options(
+            self.query(idtbl.c.id, idtbl.c.position, type), type,
+            polymorphic_load).\
+            select_from(idtbl).\
+            outerjoin(type, type.id == idtbl.c.id)
+        if order == '_ids':
+            query = query.order_by(idtbl.c.position)
+        elif order is not None:
+            # missing ids are sorted by their position, since all columns of
+            # *type* are NULL for them.
+            query = query.order_by(order, idtbl.c.position)
+        for id, _, obj in query.yield_per(yield_per):
+            if obj is not None:
+                yield obj
+            elif not ignore_missing:
+                raise IdNotFound(id)
+
+    def stream(self, type, *, filter=None, order=None, batch_size=1000,
+               server_side_cursor=False):
+        """
+        Yields all objects of given *type*, optionally restricted by an
+        sqlalchemy *filter* expression, while keeping the memory footprint
+        constant: the objects are fetched in batches of *batch_size* and each
+        batch is expunged from the session once the caller has processed it.
+        Do not keep references to these objects if you need to modify them
+        later on, they will no longer be part of this session::
+
+            for user in session.stream(User, filter=User.active == True):
+                send_newsletter(user)
+
+        The objects are paginated using the primary key by default. It is
+        possible to provide a different *order*, which should be a single,
+        indexed column, optionally in descending order. The id is used as
+        tie-breaker in that case::
+
+            for user in session.stream(User, order=User.name.desc()):
+                # ...
+
+        Rows containing NULL in the *order* column would end the iteration
+        prematurely, which is why nullable columns are rejected with a
+        :class:`ValueError`. Other expressions must never evaluate to NULL.
+
+        Each batch is fetched with a separate query, which continues after the
+        last row of the previous batch instead of using an ``OFFSET``. If
+        *server_side_cursor* is truthy, a single query will be executed and
+        its results will be fetched in batches through a server-side cursor
+        instead. On PostgreSQL, this requires the current transaction to remain
+        open until the iteration is complete.
+        """
+        descending = False
+        if order is None:
+            order = type.id
+        elif isinstance(order, UnaryExpression) and \
+                order.modifier in (operators.desc_op, operators.asc_op):
+            descending = order.modifier is operators.desc_op
+            order = order.element
+        if getattr(order, 'nullable', False):
+            raise ValueError(
+                'Cannot stream objects ordered by nullable column %s' % order)
+        if descending:
+            order_by = (order.desc(), type.id.desc())
+        else:
+            order_by = (order, type.id)
+        query = self.query(type, order, type.id).order_by(*order_by)
+        if filter is not None:
+            query = query.filter(filter)
+        if server_side_cursor:
+            batch = []
+            for obj, _, _ in query.yield_per(batch_size):
+                batch.append(obj)
+                if len(batch) < batch_size:
+                    continue
+                yield from batch
+                self._expunge_batch(batch)
+                batch = []
+            yield from batch
+            self._expunge_batch(batch)
+            return
+        last = None
+        while True:
+            if last is None:
+                rows = query.limit(batch_size).all()
+            elif descending:
+                rows = query.filter(tuple_(order, type.id) < last).\
+                    limit(batch_size).all()
+            else:
+                rows = query.filter(tuple_(order, type.id) > last).\
+                    limit(batch_size).all()
+            if not rows:
+                return
+            batch = [obj for obj, _, _ in rows]
+            yield from batch
+            self._expunge_batch(batch)
+            if len(rows) < batch_size:
+                return
+            last = tuple_(*rows[-1][1:])
+
+    def _expunge_batch(self, objects):
+        """
+        Removes all *objects* of a batch yielded by :meth:`.stream` from the
+        session, unless they were modified in the meantime.
+        """
+        for obj in objects:
+            if obj in self and not sa_inspect(obj).modified:
+                self.expunge(obj)
+
+    def sync_relationship(self, owner, member, target_ids):
+        """
+        Replaces the contents of a relationship *member* of given *owner*
+        object—as created by :func:`.create_relationship_class`—with the
+        objects with given *target_ids*. This is equivalent to::
+
+            setattr(owner, member, session.by_ids(Target, target_ids))
+
+        But instead of loading the current and the new collection, the
+        difference is computed in the database and applied with at most one
+        ``DELETE`` and one ``INSERT`` statement on the link table. Returns the
+        number of deleted and inserted rows as a tuple.
+
+        The order of the *target_ids* is stored in sorted relationships,
+        unsorted relationships will contain each id only once. The *member*
+        of the *owner* is expired afterwards, but objects already loaded into
+        the session are not updated otherwise: the backref of a target
+        object, for example, will still contain its old value.
+        """
+        prop = sa_inspect(type(owner)).get_property(member)
+        if getattr(prop, 'secondary', None) is None:
+            raise ValueError('%s.%s is not a relationship with a link table' %
+                             (type(owner).__name__, member))
+        table = prop.secondary
+        index_column = self._sync_index_column(table, prop)
+        result = self._sync_link_rows(
+            owner, table, prop.synchronize_pairs[0][1],
+            prop.secondary_synchronize_pairs[0][1], target_ids, index_column,
+            self._sync_positions(prop))
+        self.expire(owner, [member])
+        return result
+
+    def sync_collection(self, owner, member, values):
+        """
+        Replaces the contents of a collection *member* of given *owner*
+        object—as created by :func:`.create_collection_class`—with given
+        *values*. See :meth:`.sync_relationship` for details.
+
+        The positions of the values are calculated the same way the
+        collection itself would, i.e. a collection with ``'sparse'``
+        *ordering* will leave gaps between them.
+        """
+        prop = sa_inspect(type(owner)).get_property(member + '_wrapper')
+        table = prop.mapper.local_table
+        value_column = prop.mapper.get_property('value').columns[0]
+        index_column = self._sync_index_column(table, prop)
+        result = self._sync_link_rows(
+            owner, table, prop.synchronize_pairs[0][1], value_column,
+            values, index_column, self._sync_positions(prop))
+        self.expire(owner, [member + '_wrapper'])
+        return result
+
+    def load_collections(self, owners, *members):
+        """
+        Loads the given *members* of all *owners* at once. Each member must
+        be the name of a collection created by :func:`.create_collection_class`
+        or of a relationship created by :func:`.create_relationship_class`.
+        All owners must be instances of the class owning these members.
+
+        Accessing such a member on each of a thousand owners would otherwise
+        issue a thousand queries, whereas this function will only issue one
+        query per member::
+
+            groups = session.query(Group).all()
+            session.load_collections(groups, 'permissions', 'users')
+            for group in groups:
+                print(group.name, group.permissions)
+
+        The owners are passed to the database using :meth:`.filter_in`.
+        Members already loaded are left untouched.
+        """
+        owners = list(owners)
+        if not owners:
+            return
+        mapper = sa_inspect(type(owners[0]))
+        for member in members:
+            if mapper.has_property(member + '_wrapper'):
+                self._load_collection(
+                    owners, mapper.get_property(member + '_wrapper'))
+                continue
+            prop = mapper.get_property(member)
+            if getattr(prop, 'secondary', None) is None:
+                raise ValueError(
+                    '%s.%s is neither a collection nor a relationship with a '
+                    'link table' % (mapper.class_.__name__, member))
+            self._load_relationship(owners, prop)
+
+    def _load_collection(self, owners, prop):
+        """
+        Loads the values of collection property *prop* for all *owners*.
+        """
+        pending = dict((owner.id, owner) for owner in owners
+                       if prop.key in sa_inspect(owner).unloaded)
+        if not pending:
+            return
+        cls = prop.mapper.class_
+        owner_column = prop.synchronize_pairs[0][1]
+        owner_key = prop.mapper.get_property_by_column(owner_column).key
+        order = [owner_column]
+        if 'index' in prop.mapper.local_table.c:
+            order.append(prop.mapper.local_table.c.index)
+        order.append(cls.id)
+        query = self.filter_in(self.query(cls), owner_column, pending)
+        entries = dict((id, []) for id in pending)
+        for entry in query.order_by(*order):
+            entries[getattr(entry, owner_key)].append(entry)
+        for id, values in entries.items():
+            set_committed_value(pending[id], prop.key, values)
+            if prop.back_populates:
+                for entry in values:
+                    set_committed_value(entry, prop.back_populates,
+                                        pending[id])
+
+    def _load_relationship(self, owners, prop):
+        """
+        Loads the objects of relationship property *prop* with a link table
+        for all *owners*.
+        """
+        pending = dict((owner.id, owner) for owner in owners
+                       if prop.key in sa_inspect(owner).unloaded)
+        if not pending:
+            return
+        cls = prop.mapper.class_
+        owner_column = prop.synchronize_pairs[0][1]
+        query = self.query(cls, owner_column).\
+            join(prop.secondary, prop.secondaryjoin)
+        query = self.filter_in(query, owner_column, pending)
+        order = [owner_column]
+        if prop.order_by:
+            order.extend(prop.order_by)
+        targets = dict((id, []) for id in pending)
+        for target, id in query.order_by(*order):
+            targets[id].append(target)
+        for id, values in targets.items():
+            set_committed_value(pending[id], prop.key, values)
+
+    def _sync_index_column(self, table, prop):
+        """
+        Returns the column storing the position of the values in given link
+        *table* of relationship property *prop*, or `None` if the
+        relationship is unsorted.
+        """
+        if 'index' not in table.c:
+            return None
+        if not prop.order_by:
+            # this is the backref of a sorted relationship, which would have
+            # no value for the index column of new rows
+            raise ValueError('Cannot synchronize unsorted side of %s' % prop)
+        return table.c.index
+
+    def _sync_positions(self, prop):
+        """
+        Returns a function calculating the value of the index column for a
+        given position in the collection of relationship property *prop*.
+        Positions are used as-is, unless the collection is an
+        :class:`OrderingList <sqlalchemy.ext.orderinglist.OrderingList>`.
+        """
+        if prop.collection_class is None:
+            return lambda index: index
+        collection = prop.collection_class()
+        if not isinstance(collection, OrderingList):
+            return lambda index: index
+        return lambda index: collection.ordering_func(index, collection)
+
+    def _sync_link_rows(self, owner, table, owner_column, value_column,
+                        values, index_column, positions):
+        """
+        Implementation of :meth:`.sync_relationship` and
+        :meth:`.sync_collection`.
+        """
+        if owner.id is None:
+            self.flush()
+        if index_column is None:
+            # preserve the order of the values for a deterministic insertion
+            values = list(OrderedDict.fromkeys(values))
+            rows = ((value, ) for value in values)
+            columns = [Column('value', value_column.type, primary_key=True)]
+        else:
+            rows = ((value, positions(index))
+                    for index, value in enumerate(values))
+            columns = [Column('value', value_column.type, nullable=False),
+                       Column('position', Integer, primary_key=True)]
+        with self.mktmp(columns, rows=rows) as tmp:
+            match = [value_column == tmp.c.value]
+            if index_column is not None:
+                match.append(index_column == tmp.c.position)
+            deleted = self.execute(table.delete().where(and_(
+                owner_column == owner.id,
+                ~exists().where(and_(*match))))).rowcount
+            present = select([literal(1)]).where(and_(
+                owner_column == owner.id, *match))
+            targets = [owner_column, value_column]
+            sources = [literal(owner.id, owner_column.type), tmp.c.value]
+            if index_column is not None:
+                targets.append(index_column)
+                sources.append(tmp.c.position)
+            inserted = self.execute(table.insert().from_select(
+                targets, select(sources).where(~exists(present)))).rowcount
+        if deleted or inserted:
+            self._mark_changed()
+        return deleted, inserted
+
+    def _mark_changed(self):
+        """
+        Informs the zope transaction this session is joined to about changes
+        made through :meth:`execute <sqlalchemy.orm.session.Session.execute>`,
+        which would otherwise be rolled back when the transaction is
+        committed.
+        """
+        extension = self._zope_extension
+        if extension is None:
+            return
+        from zope.sqlalchemy import mark_changed
+        mark_changed(self, extension.transaction_manager,
+                     extension.keep_session)
 
 
 def sessionmaker(conf, *args, **kwargs):
@@ -197,7 +1108,13 @@ def sessionmaker(conf, *args, **kwargs):
     <sqlalchemy.orm.sessionmaker>` that adds our :class:`.SessionMixin` to the
     session base class. All arguments — except the :class:`.DbConfiguration`
     *conf* — are passed to the wrapped ``sessionmaker`` function.
+
+    If *zope_transaction* evaluates to `True`, sessions created without an
+    explicit ``extension`` argument will join the current zope transaction.
+    The package ``zope.sqlalchemy`` is only imported once such a session is
+    created.
     """
+    zope_transaction = kwargs.pop('zope_transaction', False)
     try:
         base = kwargs['class_']
     except KeyError:
@@ -207,8 +1124,97 @@ def sessionmaker(conf, *args, **kwargs):
 
         def __init__(self, *args, **kwargs):
             self.dbconf = conf
+            if zope_transaction and 'extension' not in kwargs:
+                from zope.sqlalchemy import ZopeTransactionExtension
+                kwargs['extension'] = ZopeTransactionExtension()
             base.__init__(self, *args, **kwargs)
             SessionMixin.__init__(self)
+            # extensions of zope.sqlalchemy can only be present, if it was
+            # imported already
+            zope_sqlalchemy = sys.modules.get('zope.sqlalchemy')
+            if zope_sqlalchemy is not None:
+                for extension in sa_util.to_list(kwargs.get('extension', [])):
+                    if isinstance(extension,
+                                  zope_sqlalchemy.ZopeTransactionExtension):
+                        self._zope_extension = extension
+
+        def close(self):
+            base.close(self)
+            if self._prefetch_executor is not None:
+                self._prefetch_executor.shutdown(wait=True)
+                self._prefetch_executor = None
+
+    @event.listens_for(ConfiguredSession, 'after_flush')
+    def forget_missing_ids(session, flush_context):
+        session._missing_ids.clear()
+
+    @event.listens_for(ConfiguredSession, 'before_flush')
+    def allocate_ids(session, flush_context, instances):
+        pending = {}
+        for obj in session.new:
+            cfg = getattr(obj, '__score_db__', None)
+            if cfg is None or cfg['id_block_size'] is None or \
+                    obj.id is not None:
+                continue
+            root = cfg['base'].__score_db_registry__.root(type(obj))
+            pending.setdefault(root, []).append(obj)
+        for root, objects in pending.items():
+            ids = session._allocate_ids(root, len(objects))
+            for obj, id in zip(objects, ids):
+                obj.id = id
+
+    @event.listens_for(ConfiguredSession, 'after_commit')
+    def keep_reserved_ids(session):
+        session._reserved_ids.clear()
+
+    @event.listens_for(ConfiguredSession, 'before_commit')
+    def release_tmp_tables(session):
+        # releasing a savepoint keeps the tables in use until the enclosing
+        # transaction is committed.
+        if session.transaction.nested:
+            return
+        while session._tmp_tables:
+            session._tmp_tables.pop().release()
+
+    @event.listens_for(ConfiguredSession, 'after_commit')
+    def keep_tmp_tables(session):
+        if not session.transaction.nested:
+            session._tmp_created.clear()
+
+    @event.listens_for(ConfiguredSession, 'after_soft_rollback')
+    def forget_tmp_tables(session, previous_transaction):
+        # tables created within the transaction or savepoint that was just
+        # rolled back no longer exist, all others can be re-used.
+        boundary = previous_transaction
+        while not boundary.nested and boundary.parent is not None:
+            boundary = boundary.parent
+        created = set()
+        for entry in session._tmp_created[:]:
+            pool, table, transaction = entry
+            while transaction is not None and transaction is not boundary:
+                transaction = transaction.parent
+            if transaction is not None:
+                pool.forget(table)
+                created.add(table)
+                session._tmp_created.remove(entry)
+        creators, session._tmp_tables = session._tmp_tables, []
+        for creator in creators:
+            if creator.table in created:
+                continue
+            if boundary.nested:
+                session._tmp_tables.append(creator)
+            else:
+                creator.release()
+
+    @event.listens_for(ConfiguredSession, 'after_rollback')
+    def discard_reserved_ids(session):
+        for tablename, ids in session._reserved_ids:
+            conf.id_allocator.discard(tablename, ids)
+        session._reserved_ids.clear()
+
+    if conf.cache is not None:
+        conf.cache.register(ConfiguredSession)
+        kwargs.setdefault('query_cls', CachingQuery)
 
     kwargs['class_'] = ConfiguredSession
     return sa_orm.sessionmaker(*args, **kwargs)
@@ -26,8 +26,13 @@
 
 
 # This file has nothing to export, it just adds some operations to the alembic
-# engine, it has to be executed, though. Since many python source checkers
-# complain when importing * from a module, we provide a useless export variable:
+# engine, it has to be executed, though. score.db only imports it, if alembic
+# was imported before, so alembic's env.py should import it explicitly:
+#
+#   import score.db.alembic
+#
+# Since many python source checkers complain when importing * from a module, we
+# provide a useless export variable:
 _import_dummy = None
 
 try:
@@ -24,19 +24,23 @@
 # the discretion of STRG.AT GmbH also the competent court, in whose district the
 # Licensee has his registered seat, an establishment or assets.
 
+from collections import OrderedDict
 from datetime import datetime
 import io
+import itertools
 import score.init
 import sqlalchemy as sa
 from sqlalchemy.ext.associationproxy import AssociationProxy
-from .dbenum import Enum, EnumType
+from sqlalchemy.ext.orderinglist import OrderingList
+from sqlalchemy.orm.interfaces import MANYTOMANY, MANYTOONE
+from .dbenum import Enum, EnumCodeType, EnumType
 
 
 class DataLoaderException(Exception):
     pass
 
 
-def load_data(thing, objects=None):
+def load_data(thing, objects=None, *, bulk=False, session=None):
     """
     Loads data from given *thing*, i.e. a file, a file-like object or a URL. If
     the source contains references to other objects loaded in an earlier call,
@@ -47,29 +51,48 @@ def load_data(thing, objects=None):
         objects = load_data('base.yaml')
         if generate_dummy_data:
             objects = load_data('dummy.yaml', objects)
+
+    Large data sets can be loaded with *bulk* set to `True`. In this mode, no
+    objects are created: the data is written immediately using the given
+    *session*, which must be a session of this module. Each class is written
+    with :meth:`.SessionMixin.bulk_save` after the classes it references,
+    using ids reserved before anything is written. The return value is a dict
+    mapping class names to dicts mapping object names to their ids, which can
+    be passed as *objects* to further bulk loads:
+
+    .. code-block:: python
+
+        ids = load_data('base.yaml', bulk=True, session=session)
+        ids = load_data('dummy.yaml', ids, bulk=True, session=session)
+
+    Bulk loading supports columns, relationships in all directions and
+    association proxies to collections, like the ones created by
+    :func:`.create_collection_class`. Objects may only be referenced from a
+    one-to-many relationship, if they are part of the same call.
     """
     if isinstance(thing, io.IOBase):
-        return load_yaml(thing, objects)
+        return load_yaml(thing, objects, bulk=bulk, session=session)
     if not isinstance(thing, str):
         raise DataLoaderException('Could not determine loader to use')
     if ':' in thing:
-        return load_url(thing, objects)
-    return load_yaml(thing, objects)
+        return load_url(thing, objects, bulk=bulk, session=session)
+    return load_yaml(thing, objects, bulk=bulk, session=session)
 
 
-def load_url(url, objects=None):
+def load_url(url, objects=None, *, bulk=False, session=None):
     """
     Loads objects from a yaml resources under given *url*. See :func:`load_data`
-    for the description of the *objects* parameter.
+    for the description of the other parameters.
     """
     import urllib
-    return load_yaml(urllib.request.urlopen(url))
+    return load_yaml(urllib.request.urlopen(url), objects,
+                     bulk=bulk, session=session)
 
 
-def load_yaml(file, objects=None):
+def load_yaml(file, objects=None, *, bulk=False, session=None):
     """
     Loads objects from a yaml *file*. See :func:`load_data` for the description
-    of the *objects* parameter.
+    of the other parameters.
     """
     import yaml
     try:
@@ -78,7 +101,12 @@ def load_yaml(file, objects=None):
         from yaml import Loader
     if not isinstance(file, io.IOBase):
         file = open(file)
-    return _postprocess(yaml.load(file, Loader=Loader), objects)
+    data = yaml.load(file, Loader=Loader)
+    if bulk:
+        if session is None:
+            raise DataLoaderException('Bulk loading requires a session')
+        return _bulk_load(data, objects, session)
+    return _postprocess(data, objects)
 
 
 def _postprocess(data, objects=None):
@@ -126,12 +154,12 @@ def _postprocess(data, objects=None):
                         relcls = relcls()
                     if not isinstance(relcls, type):
                         relcls = relcls.__class__
-                    value = _replace_object(classes, objects, relcls, value)
+                    value = _replace_object(objects, relcls, value)
                 elif member in proxies[classname]:
                     proxy = proxies[classname][member]
                     col = proxy.attr[1].property.columns[0]
                     if isinstance(col.type, type(cls)):
-                        value = _replace_object(classes, objects, relcls, value)
+                        value = _replace_object(objects, relcls, value)
                     else:
                         value = map(lambda v: _convert_value(v, col), value)
                 elif member in columns[classname]:
@@ -140,26 +168,221 @@ def _postprocess(data, objects=None):
     return objects
 
 
-def _replace_object(classes, objects, cls, value):
+def _bulk_load(data, ids, session):
+    ids = dict((classname, dict(names))
+               for classname, names in (ids or {}).items())
+    # rows of all classes by class, rows of named objects by class name
+    rows = OrderedDict()
+    named = {}
+    links = OrderedDict()
+    classes = OrderedDict()
+    for classname in data:
+        cls = score.init.parse_dotted_path(classname)
+        classes[classname] = cls
+        rows[cls] = []
+        named[classname] = OrderedDict()
+        for name, members in (data[classname] or {}).items():
+            row = {}
+            if members and members.get('id') is not None:
+                row['id'] = members['id']
+            rows[cls].append(row)
+            named[classname][name] = row
+        ids.setdefault(classname, {}).update(
+            (name, _Reference(row)) for name, row in named[classname].items())
+    for classname, cls in classes.items():
+        for name, row in named[classname].items():
+            members = data[classname][name] or {}
+            for member, value in members.items():
+                _bulk_member(ids, named, rows, links, cls, row, member, value)
+    # ids are shared by all classes with the same root class and must be
+    # reserved at once—including those of the rows created for association
+    # proxies—as sqlite derives new ids from the existing rows
+    roots = OrderedDict()
+    for cls in rows:
+        registry = cls.__score_db__['base'].__score_db_registry__
+        roots.setdefault(registry.root(cls), []).extend(
+            row for row in rows[cls] if 'id' not in row)
+    for root, missing in roots.items():
+        for row, id in zip(missing, session._allocate_ids(root, len(missing))):
+            row['id'] = id
+    for values in itertools.chain(
+            itertools.chain.from_iterable(rows.values()),
+            itertools.chain.from_iterable(links.values()),
+            ids.values()):
+        for key, value in values.items():
+            if isinstance(value, _Reference):
+                values[key] = value.row['id']
+    for cls in _bulk_order(rows):
+        if rows[cls]:
+            session.bulk_save(cls, rows[cls])
+    for table, values in links.items():
+        columns = OrderedDict()
+        for value in values:
+            columns.update((column, None) for column in value)
+        columns = list(columns)
+        session._insert_rows(
+            table, [tuple(value.get(column) for column in columns)
+                    for value in values], columns=columns)
+    return ids
+
+
+class _Reference:
+    """
+    The id of the object with given *row* in a bulk load, which is only known
+    after all rows were created.
+    """
+
+    __slots__ = ('row',)
+
+    def __init__(self, row):
+        self.row = row
+
+
+def _bulk_member(ids, named, rows, links, cls, row, member, value):
+    """
+    Stores the *value* of given *member* of an object of *cls* in its *row*,
+    or in the rows of the referenced objects.
+    """
+    mapper = sa.inspect(cls)
+    if member in mapper.relationships:
+        prop = mapper.relationships[member]
+        target = prop.mapper.class_
+        if prop.direction == MANYTOONE:
+            id = None
+            if value is not None:
+                id = _replace_object(ids, target, value)
+            for local, remote in prop.local_remote_pairs:
+                row[_bulk_key(mapper, local)] = id
+            return
+        position = _bulk_positions(prop)
+        if prop.direction == MANYTOMANY:
+            for index, id in enumerate(_replace_object(ids, target, value)):
+                link = {}
+                for local, column in prop.synchronize_pairs:
+                    link[column] = _Reference(row)
+                for remote, column in prop.secondary_synchronize_pairs:
+                    link[column] = id
+                for column in prop.order_by or ():
+                    if column.table is prop.secondary:
+                        link[column] = index
+                links.setdefault(prop.secondary, []).append(link)
+            return
+        try:
+            members = _replace_object(named, target, value)
+        except DataLoaderException as e:
+            raise DataLoaderException(
+                '%s (one-to-many relationships can only reference objects '
+                'loaded in the same bulk load)' % e)
+        for index, member_row in enumerate(members):
+            _bulk_link(prop, row, member_row, index, position)
+        return
+    proxy = mapper.all_orm_descriptors.get(member)
+    if isinstance(proxy, AssociationProxy):
+        prop = mapper.relationships[proxy.target_collection]
+        target = prop.mapper.class_
+        position = _bulk_positions(prop)
+        for index, item in enumerate(value):
+            member_row = {}
+            rows.setdefault(target, []).append(member_row)
+            _bulk_member(ids, named, rows, links, target, member_row,
+                         proxy.value_attr, item)
+            _bulk_link(prop, row, member_row, index, position)
+        return
+    if member in mapper.column_attrs:
+        column = mapper.column_attrs[member].columns[0]
+        row[member] = _convert_value(value, column)
+        return
+    raise DataLoaderException(
+        'Cannot bulk load member %s of %s' % (member, cls.__name__))
+
+
+def _bulk_link(prop, row, member_row, index, position):
+    """
+    Stores the reference of the one-to-many relationship *prop* from an
+    object's *row* to the row of one of its members.
+    """
+    mapper = prop.mapper
+    for local, remote in prop.local_remote_pairs:
+        member_row[_bulk_key(mapper, remote)] = _Reference(row)
+    if position:
+        attr, value = position
+        member_row[attr] = value(index)
+
+
+def _bulk_positions(prop):
+    """
+    Returns the attribute storing the positions of the members of given
+    relationship *prop*, and a function calculating these positions, if the
+    relationship uses an :class:`OrderingList
+    <sqlalchemy.ext.orderinglist.OrderingList>`.
+    """
+    if prop.collection_class is None:
+        return None
+    collection = prop.collection_class()
+    if not isinstance(collection, OrderingList):
+        return None
+    return collection.ordering_attr, \
+        lambda index: collection.ordering_func(index, collection)
+
+
+def _bulk_key(mapper, column):
+    try:
+        return mapper.get_property_by_column(column).key
+    except sa.orm.exc.UnmappedColumnError:
+        return column.key
+
+
+def _bulk_order(rows):
+    """
+    Sorts the classes in *rows* topologically, so that each class is written
+    after the classes its tables reference with a foreign key.
+    """
+    tables = {}
+    for cls in rows:
+        registry = cls.__score_db__['base'].__score_db_registry__
+        tables[cls] = set(registry.tables(cls))
+    dependencies = OrderedDict()
+    for cls in rows:
+        referenced = set(fk.column.table
+                         for table in tables[cls]
+                         for fk in table.foreign_keys) - tables[cls]
+        dependencies[cls] = set(other for other in rows if other is not cls
+                                and tables[other] & referenced)
+    result = []
+    while dependencies:
+        ready = [cls for cls, deps in dependencies.items() if not deps]
+        if not ready:
+            raise DataLoaderException(
+                'Cannot bulk load classes with cyclic references: %s' %
+                ', '.join(cls.__name__ for cls in dependencies))
+        for cls in ready:
+            del dependencies[cls]
+            result.append(cls)
+        for deps in dependencies.values():
+            deps.difference_update(ready)
+    return result
+
+
+def _replace_object(objects, cls, value):
     if isinstance(value, list):
         def converter(item):
-            return _replace_object(classes, objects, cls, item)
+            return _replace_object(objects, cls, item)
         return list(map(converter, value))
-    key = '%s.%s' % (cls.__module__, cls.__name__)
-    if key in objects:
-        return objects[key][value]
-    for classname in objects:
-        othercls = classes[classname]
-        if not issubclass(othercls, cls):
-            continue
-        if value in objects[classname]:
-            return objects[classname][value]
+    candidates = [cls]
+    if hasattr(cls, '__score_db__'):
+        registry = cls.__score_db__['base'].__score_db_registry__
+        candidates += registry.descendants(cls)
+    for candidate in candidates:
+        key = '%s.%s' % (candidate.__module__, candidate.__name__)
+        if key in objects and value in objects[key]:
+            return objects[key][value]
     raise DataLoaderException('Could not find referenced object "%s"' % value)
 
 
 def _convert_value(value, column):
     if isinstance(column.type, sa.DateTime) and not isinstance(value, datetime):
         return datetime(value)
-    if isinstance(column.type, EnumType) and not isinstance(value, Enum):
+    if isinstance(column.type, (EnumType, EnumCodeType)) and \
+            not isinstance(value, Enum):
         return column.type.enum(value.strip())
     return value
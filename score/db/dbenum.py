@@ -30,13 +30,26 @@
 # http://techspot.zzzeek.org/2011/01/14/the-enum-recipe/
 
 import enum
-from sqlalchemy.types import SchemaType, TypeDecorator, Enum as SAEnum
+from sqlalchemy.types import (
+    SchemaType, SmallInteger, TypeDecorator, Enum as SAEnum)
 import re
 
 
 class Enum(enum.Enum):
     """
     Enumeration class that can be used in database classes.
+
+    Enumerations declaring a dict mapping each member name to a small integer
+    as ``__db_codes__`` are stored as these codes in a SMALLINT column,
+    instead of storing their values::
+
+        class Status(Enum):
+            __db_codes__ = {'ONLINE': 1, 'OFFLINE': 2}
+            ONLINE = 'online'
+            OFFLINE = 'offline'
+
+    The codes must be unique, between 0 and 32767 and must never change once
+    data was written.
     """
 
     def __init__(self, *args):
@@ -47,6 +60,18 @@ class Enum(enum.Enum):
             raise ValueError(
                 "Duplicate value in score.db.Enum:  %r --> %r"
                 % (a, e))
+        codes = getattr(cls, '__db_codes__', None)
+        if codes is None:
+            return
+        code = codes.get(self.name)
+        if not isinstance(code, int) or not 0 <= code < 2 ** 15:
+            raise ValueError(
+                "Missing or invalid code of %r in score.db.Enum" % self.name)
+        for e in cls:
+            if codes[e.name] == code:
+                raise ValueError(
+                    "Duplicate code in score.db.Enum:  %r --> %r"
+                    % (self.name, e.name))
 
     @classmethod
     def db_type(cls):
@@ -54,6 +79,8 @@ class Enum(enum.Enum):
         Returns the SQLAlchemy type to use for storing values of this enum in
         the database.
         """
+        if getattr(cls, '__db_codes__', None) is not None:
+            return EnumCodeType(cls)
         return EnumType(cls)
 
 
@@ -68,6 +95,7 @@ class EnumType(SchemaType, TypeDecorator):
                 lambda m: "_" + m.group(1).lower(),
                 enum.__name__)
         )
+        self._members = {sym.value: sym for sym in enum}
 
     def _set_table(self, table, column):
         self.impl._set_table(table, column)
@@ -85,4 +113,47 @@ class EnumType(SchemaType, TypeDecorator):
     def process_result_value(self, value, dialect):
         if value is None:
             return None
-        return self.enum(value.strip())
+        try:
+            return self._members[value]
+        except KeyError:
+            return self.enum(value.strip())
+
+
+class EnumCodeType(TypeDecorator):
+    """
+    Stores the members of an :class:`.Enum` as the integer codes declared in
+    its ``__db_codes__``.
+    """
+
+    impl = SmallInteger
+
+    def __init__(self, enum):
+        super().__init__()
+        self.enum = enum
+        unknown = set(enum.__db_codes__) - set(enum.__members__)
+        if unknown:
+            raise ValueError(
+                "Codes of unknown members in score.db.Enum %s: %s"
+                % (enum.__name__, ', '.join(sorted(unknown))))
+        self._codes = {sym: enum.__db_codes__[sym.name] for sym in enum}
+        self._codes.update((sym.value, code)
+                           for sym, code in list(self._codes.items()))
+        self._members = {code: sym for sym, code in self._codes.items()
+                         if isinstance(sym, enum)}
+
+    def copy(self):
+        return EnumCodeType(self.enum)
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return self._codes[value]
+        except KeyError:
+            raise ValueError(
+                "Invalid value for %s: %r" % (self.enum.__name__, value))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self._members[value]
@@ -24,15 +24,16 @@
 # the discretion of STRG.AT GmbH also the competent court, in whose district the
 # Licensee has his registered seat, an establishment or assets.
 
+import functools
 import re
 from sqlalchemy import (
-    Column, ForeignKey, BigInteger, Integer, UniqueConstraint, TypeDecorator,
-    String)
+    Column, ForeignKey, BigInteger, Index, Integer, LargeBinary,
+    SmallInteger, UniqueConstraint, TypeDecorator, String)
 from sqlalchemy.orm import backref, relationship
 from sqlalchemy.ext.associationproxy import association_proxy
-from sqlalchemy.ext.orderinglist import ordering_list
-from sqlalchemy.dialects.postgresql import JSONB
-import json
+from sqlalchemy.ext.orderinglist import OrderingList, ordering_list
+from . import _json
+from ._sa_json import JsonComparator
 
 
 IdType = BigInteger()
@@ -40,22 +41,184 @@ IdType = IdType.with_variant(Integer, 'sqlite')
 
 
 class JsonType(TypeDecorator):
+    """
+    Stores JSON values as text. Used by the types returned by
+    :func:`.json_type` on all databases except postgresql, where a JSONB
+    column is created instead.
+
+    If *lazy* is `True`, JSON objects will be returned as
+    :class:`LazyJsonDict <score.db._json.LazyJsonDict>` instances, which are
+    only de-serialized on first access and are not serialized again, unless
+    they were modified.
+    """
 
     impl = String
 
+    comparator_factory = JsonComparator
+
+    def __init__(self, *args, lazy=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy = lazy
+
     def process_bind_param(self, value, dialect):
-        if value is not None:
-            return json.dumps(value)
-        return None
+        if value is None:
+            return None
+        if isinstance(value, _json.LazyJsonDict) and value.raw is not None:
+            return value.raw
+        return _json.dumps(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if self.lazy and value[:1] == '{':
+            return _json.LazyJsonDict(value)
+        return _json.loads(value)
+
+
+class CompressedJSON(TypeDecorator):
+    """
+    Stores JSON values in a compressed binary column, which works on
+    postgresql and sqlite alike. Serialized values shorter than *threshold*
+    bytes are stored uncompressed, larger values are compressed using the
+    given *algorithm*, which may be ``zlib`` or ``lzma``. The compression
+    *level* is passed to the compression function, if it is not `None`.
+
+    The first byte of each stored value describes its format: ``0`` for
+    uncompressed, ``1`` for zlib and ``2`` for lzma compressed JSON. Values
+    can thus always be read, even if the configuration changed in the
+    meantime.
+
+    Note that the database can neither inspect nor index the contents of such
+    columns.
+    """
+
+    impl = LargeBinary
+
+    formats = {
+        'zlib': 1,
+        'lzma': 2,
+    }
+
+    def __init__(self, *args, algorithm='zlib', threshold=256, level=None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        if algorithm not in self.formats:
+            raise ValueError('Invalid compression algorithm "%s"' % algorithm)
+        self.algorithm = algorithm
+        self.threshold = threshold
+        self.level = level
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        data = _json.dumps(value).encode('utf-8')
+        if len(data) < self.threshold:
+            return b'\x00' + data
+        if self.algorithm == 'zlib':
+            import zlib
+            if self.level is None:
+                data = zlib.compress(data)
+            else:
+                data = zlib.compress(data, self.level)
+        else:
+            import lzma
+            data = lzma.compress(data, preset=self.level)
+        return bytes((self.formats[self.algorithm], )) + data
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        value = bytes(value)
+        format, data = value[0], value[1:]
+        if format == 1:
+            import zlib
+            data = zlib.decompress(data)
+        elif format == 2:
+            import lzma
+            data = lzma.decompress(data)
+        elif format != 0:
+            raise ValueError('Unknown compression format %d' % format)
+        return _json.loads(data.decode('utf-8'))
+
+
+def json_type(*, lazy=False, mutable=False):
+    """
+    Creates a type for storing JSON values, which is a JSONB column on
+    postgresql and a :class:`.JsonType` text column on sqlite. The default
+    value of *lazy* and *mutable* is also available as :data:`JSON`.
+
+    Passing `True` as *lazy* will postpone the de-serialization of JSON
+    objects on sqlite until they are accessed, which is useful for large
+    documents, that are rarely needed. On postgresql, the database driver
+    de-serializes the values, so this parameter has no effect.
+
+    By default, sqlalchemy will not notice modifications of the loaded
+    values, you need to assign a new value to the column instead. If
+    *mutable* is `True`, changes to a JSON object will be tracked and written
+    during the next flush. Note that only changes to the top-level object are
+    tracked and that all values must be JSON objects in this case.
+
+    The contents of such columns can be queried with the same expressions on
+    both databases, see :class:`JsonPath <score.db._sa_json.JsonPath>`::
+
+        session.query(Model).filter(Model.data['a']['b'].as_int() == 3)
+        session.query(Model).filter(Model.data.contains({'tags': ['x']}))
+    """
+    from sqlalchemy.dialects.postgresql import JSONB
+    type_ = JsonType(lazy=lazy).with_variant(JSONB(), 'postgresql')
+    if mutable:
+        from sqlalchemy.ext.mutable import MutableDict
+        MutableDict.as_mutable(type_)
+    return type_
+
+
+class TypeCodeType(TypeDecorator):
+    """
+    Stores the type names of an inheritance hierarchy as integer codes. Used
+    as the type of the type column of classes, that have ``type_codes``
+    enabled in their :ref:`configuration <db_config_member>`.
+    """
+
+    impl = SmallInteger
+
+    def __init__(self):
+        super().__init__()
+        self.codes = {}
+        self.names = {}
+
+    def add(self, name, code):
+        """
+        Registers the *code* of the type with given *name*.
+        """
+        if code in self.names:
+            raise ValueError('Type code %d of %s already used by %s' % (
+                code, name, self.names[code]))
+        self.codes[name] = code
+        self.names[code] = name
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return self.codes[value]
+        except KeyError:
+            raise ValueError('Unknown type name "%s"' % value)
 
     def process_result_value(self, value, dialect):
         if value is not None:
-            return json.loads(value)
+            return self.names[value]
         return None
 
 
-JSON = JSONB()
-JSON = JSON.with_variant(JsonType, 'sqlite')
+def __getattr__(name):
+    # the JSON type is created on first access, to avoid loading the
+    # postgresql dialect in applications not using it
+    if name != 'JSON':
+        raise AttributeError(
+            'module %r has no attribute %r' % (__name__, name))
+    global JSON
+    JSON = json_type()
+    return JSON
 
 
 # taken from stackoverflow:
@@ -73,7 +236,12 @@ def cls2tbl(cls):
     """
     if isinstance(cls, type):
         cls = cls.__name__
-    s1 = _first_cap_re.sub(r'\1_\2', cls)
+    return _cls2tbl(cls)
+
+
+@functools.lru_cache(maxsize=None)
+def _cls2tbl(classname):
+    s1 = _first_cap_re.sub(r'\1_\2', classname)
     return '_' + _all_cap_re.sub(r'\1_\2', s1).lower()
 
 
@@ -87,8 +255,91 @@ def tbl2cls(tbl):
     return ''.join(map(lambda s: s.capitalize(), parts))
 
 
+class SparseOrderingList(OrderingList):
+    """
+    An :class:`OrderingList <sqlalchemy.ext.orderinglist.OrderingList>`, that
+    leaves a *gap* between the ordering values of consecutive elements.
+
+    Inserting an element will only assign an ordering value to the new
+    element, as long as there is a gap left at the insertion point. Otherwise
+    the following elements will be shifted until the next gap is reached.
+    Removing elements will not change the ordering values of the remaining
+    elements at all. Moving an element with ``pop()`` and ``insert()`` will
+    thus usually update a single row only.
+
+    Calling :meth:`reorder` will re-distribute the ordering values evenly.
+    """
+
+    def __init__(self, ordering_attr, gap=1024):
+        super().__init__(ordering_attr,
+                         ordering_func=lambda index, collection: index * gap)
+        self.gap = gap
+
+    def append(self, entity):
+        list.append(self, entity)
+        if self._get_order_value(entity) is None or self.reorder_on_append:
+            self._place(len(self) - 1)
+
+    def insert(self, index, entity):
+        list.insert(self, index, entity)
+        if index < 0:
+            index += len(self) - 1
+        self._place(max(0, min(index, len(self) - 1)))
+
+    def remove(self, entity):
+        list.remove(self, entity)
+
+    def pop(self, index=-1):
+        return list.pop(self, index)
+
+    def __setitem__(self, index, entity):
+        if isinstance(index, slice):
+            super().__setitem__(index, entity)
+            return
+        value = self._get_order_value(self[index])
+        list.__setitem__(self, index, entity)
+        self._set_order_value(entity, value)
+
+    def __delitem__(self, index):
+        list.__delitem__(self, index)
+
+    def _place(self, index):
+        """
+        Assigns an ordering value to the element at given *index*, that lies
+        between the values of its neighbours.
+        """
+        prev = next = None
+        if index > 0:
+            prev = self._get_order_value(self[index - 1])
+        if index < len(self) - 1:
+            next = self._get_order_value(self[index + 1])
+        if (index > 0 and prev is None) or \
+                (index < len(self) - 1 and next is None):
+            # the neighbours were never numbered
+            self.reorder()
+            return
+        if next is None:
+            value = 0 if prev is None else prev + self.gap
+        elif prev is None:
+            value = next - self.gap
+        elif next - prev > 1:
+            value = prev + (next - prev) // 2
+        else:
+            # no gap left: shift the following elements up to the next gap
+            value = prev + 1
+            last = value
+            for entity in self[index + 1:]:
+                if self._get_order_value(entity) > last:
+                    break
+                last += 1
+                self._set_order_value(entity, last)
+        self._set_order_value(self[index], value)
+
+
 def create_relationship_class(cls1, cls2, member, *, classname=None,
-                              sorted=False, duplicates=True, backref=None):
+                              sorted=False, duplicates=True, backref=None,
+                              indexes=True, covering_indexes=True,
+                              lazy='select'):
     """
     Creates a class linking two given models and adds appropriate relationship
     properties to the classes.
@@ -129,6 +380,20 @@ def create_relationship_class(cls1, cls2, member, *, classname=None,
     Providing a *backref* member, will also add a relationship property to the
     second class with the given name.
 
+    The table will also have an index on ``user_id`` and one on ``group_id``,
+    unless *indexes* is `False`. If *covering_indexes* is `True`, these
+    indexes will also contain the respective other id column (and the
+    'index' column of sorted relationships, ordered between the two ids),
+    which allows the database to load the relationship—and its backref—from
+    the index alone.
+
+    The relationship and its backref are loaded using the given *lazy*
+    :ref:`loading strategy <sqlalchemy:relationship_loader_options>`. The
+    value ``selectin``, for example, will load the relationship for all
+    objects of a query with a single additional query. See
+    :meth:`.SessionMixin.load_collections` for loading the relationship of
+    arbitrary objects at once.
+
     """
     if classname is None:
         classname = cls1.__name__ + cls2.__name__
@@ -161,24 +426,38 @@ def create_relationship_class(cls1, cls2, member, *, classname=None,
         }
     if sorted:
         members['index'] = Column(Integer, nullable=False)
+    if indexes:
+        tablename = cls2tbl(classname)
+        owner_columns = [members[idcol1]]
+        member_columns = [members[idcol2]]
+        if sorted:
+            owner_columns.append(members['index'])
+        if covering_indexes:
+            owner_columns.append(members[idcol2])
+            member_columns.append(members[idcol1])
+        members['__table_args__'] = (
+            Index('ix_%s_%s' % (tablename, idcol1), *owner_columns),
+            Index('ix_%s_%s' % (tablename, idcol2), *member_columns),
+        )
     cls = type(classname, (cls1.__score_db__['base'],), members)
     if sorted:
         rel = relationship(cls2, secondary=cls.__tablename__,
                            order_by='%s.index' % cls.__name__,
-                           remote_side=lambda: cls1.id)
+                           remote_side=lambda: cls1.id, lazy=lazy)
     else:
         rel = relationship(cls2, secondary=cls.__tablename__,
-                           remote_side=lambda: cls1.id)
+                           remote_side=lambda: cls1.id, lazy=lazy)
     setattr(cls1, member, rel)
     if backref:
         rel = relationship(cls1, secondary=cls.__tablename__,
-                           remote_side=lambda: cls2.id)
+                           remote_side=lambda: cls2.id, lazy=lazy)
         setattr(cls2, backref, rel)
     return cls
 
 
 def create_collection_class(owner, member, column, *,
-                            sorted=True, duplicates=True):
+                            sorted=True, duplicates=True, indexes=True,
+                            ordering='dense', lazy='select'):
     """
     Creates a class for holding the values of a collection in given *owner*
     class.
@@ -192,15 +471,30 @@ def create_collection_class(owner, member, column, *,
     Group objects will now have a member called 'permissions', which contain a
     sorted list of PermissionEnum values.
 
-    See :func:`.create_relationship_class` for the description of the keyword
-    arguments.
+    The table will have an index on ``owner_id`` (followed by the 'index'
+    column, if the collection is *sorted*), unless *indexes* is `False`.
+
+    The 'index' values of a *sorted* collection are consecutive integers by
+    default, which means that inserting or removing an element will update
+    all elements after it. Passing ``'sparse'`` as *ordering* will use a
+    :class:`.SparseOrderingList` instead, which leaves gaps between the
+    values and only updates the affected element in most cases.
+
+    See :func:`.create_relationship_class` for the description of the other
+    keyword arguments.
     """
     name = owner.__name__ + tbl2cls(member)
-    if sorted:
+    if ordering not in ('dense', 'sparse'):
+        raise ValueError('Invalid ordering "%s"' % ordering)
+    if sorted and ordering == 'sparse':
         bref = backref(member + '_wrapper', order_by='%s.index' % name,
-                       collection_class=ordering_list('index'))
+                       collection_class=lambda: SparseOrderingList('index'),
+                       lazy=lazy)
+    elif sorted:
+        bref = backref(member + '_wrapper', order_by='%s.index' % name,
+                       collection_class=ordering_list('index'), lazy=lazy)
     else:
-        bref = backref(member + '_wrapper')
+        bref = backref(member + '_wrapper', lazy=lazy)
     members = {
         '__score_db__': {
             'inheritance': None
@@ -212,10 +506,19 @@ def create_collection_class(owner, member, column, *,
     }
     if sorted:
         members['index'] = Column(Integer, nullable=False)
+    table_args = []
     if not duplicates:
-        members['__table_args__'] = (
-            UniqueConstraint(members['owner_id'], column),
-        )
+        table_args.append(UniqueConstraint(members['owner_id'], column))
+    if indexes and (sorted or duplicates):
+        # the unique constraint of an unsorted collection already covers
+        # lookups by owner_id
+        owner_columns = [members['owner_id']]
+        if sorted:
+            owner_columns.append(members['index'])
+        table_args.append(Index(
+            'ix_%s_owner_id' % cls2tbl(name), *owner_columns))
+    if table_args:
+        members['__table_args__'] = tuple(table_args)
     cls = type(name, (owner.__score_db__['base'],), members)
     proxy = association_proxy(member + '_wrapper', 'value',
                               creator=lambda v: cls(value=v))
@@ -28,12 +28,20 @@
 Provides functions specific to PostgreSQL databases.
 """
 
+import datetime
+import decimal
+import io
 import logging
+import uuid
 import transaction
 from zope.sqlalchemy import mark_changed
 
 log = logging.getLogger(__name__)
 
+# types, whose str() is a valid input representation in postgresql
+_COPY_TYPES = (str, int, float, decimal.Decimal, uuid.UUID,
+               datetime.date, datetime.time)
+
 
 def list_views(session):
     """
@@ -44,6 +52,24 @@ def list_views(session):
     return [name for (name, ) in session.execute(sql)]
 
 
+def list_materialized_views(session):
+    """
+    Returns a list of materialized view names from the current database's
+    public schema.
+    """
+    sql = "SELECT matviewname FROM pg_matviews WHERE schemaname='public'"
+    return [name for (name, ) in session.execute(sql)]
+
+
+def list_triggers(session):
+    """
+    Returns a list of trigger names from the current database's public schema.
+    """
+    sql = "SELECT DISTINCT trigger_name FROM information_schema.triggers "\
+        "WHERE trigger_schema='public'"
+    return [name for (name, ) in session.execute(sql)]
+
+
 def list_tables(session):
     """
     Returns a list of table names from the current database's public schema.
@@ -71,6 +97,101 @@ def list_enum_types(session):
     return [name for (name, ) in session.execute(sql)]
 
 
+def _copy_value(value):
+    """
+    Converts a python *value* to its representation in the text format of
+    PostgreSQL's COPY command. Raises a :class:`TypeError` if the *value* has
+    no such representation.
+    """
+    if value is None:
+        return '\\N'
+    return _copy_escape(_copy_text(value))
+
+
+def _copy_text(value):
+    """
+    Returns the textual input representation of given *value*, which is not
+    yet escaped for the COPY command.
+    """
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    # the bind processor of binary columns wraps the bytes in psycopg2's
+    # Binary adapter, which would be rendered as an SQL literal
+    adapted = getattr(value, 'adapted', None)
+    if isinstance(adapted, (bytes, bytearray, memoryview)):
+        value = adapted
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '\\x' + bytes(value).hex()
+    if isinstance(value, (list, tuple)):
+        return _array_literal(value)
+    if isinstance(value, _COPY_TYPES):
+        return str(value)
+    raise TypeError('Cannot COPY value %r' % (value, ))
+
+
+def _array_literal(values):
+    """
+    Returns the textual representation of an ARRAY containing *values*.
+    """
+    elements = []
+    for value in values:
+        if value is None:
+            elements.append('NULL')
+        elif isinstance(value, (list, tuple)):
+            elements.append(_array_literal(value))
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            raise TypeError('Cannot COPY binary array %r' % (values, ))
+        else:
+            elements.append('"%s"' % _copy_text(value).
+                            replace('\\', '\\\\').
+                            replace('"', '\\"'))
+    return '{%s}' % ','.join(elements)
+
+
+def _copy_escape(text):
+    return text.\
+        replace('\\', '\\\\').\
+        replace('\t', '\\t').\
+        replace('\n', '\\n').\
+        replace('\r', '\\r')
+
+
+def copy_rows(session, table, rows, *, columns=None):
+    """
+    Inserts given *rows* into *table* using a single ``COPY FROM STDIN``
+    statement. Each row must be a tuple containing the values of the given
+    *columns*, which defaults to all columns of the table.
+
+    All rows are encoded before anything is sent to the database: a
+    :class:`TypeError` is raised without writing any rows, if a value has no
+    representation in the COPY format.
+    """
+    if columns is None:
+        columns = list(table.c)
+    connection = session.connection()
+    preparer = connection.dialect.identifier_preparer
+    sql = 'COPY %s (%s) FROM STDIN' % (
+        preparer.format_table(table),
+        ', '.join(preparer.format_column(col) for col in columns))
+    # apply the conversions of the column types, that an INSERT would apply
+    processors = [col.type.dialect_impl(connection.dialect).
+                  bind_processor(connection.dialect) for col in columns]
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(
+            _copy_value(value if process is None else process(value))
+            for process, value in zip(processors, row)))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+
+
 def destroy(session, destroyable):
     """
     Drops everything in the database – tables, views, sequences, etc. For
@@ -24,6 +24,12 @@
 # the discretion of STRG.AT GmbH also the competent court, in whose district the
 # Licensee has his registered seat, an establishment or assets.
 
+from itertools import islice
+
+
+# the default value of SQLITE_MAX_VARIABLE_NUMBER in older sqlite versions
+MAX_VARIABLES = 999
+
 
 def list_tables(session):
     """
@@ -49,6 +55,24 @@ def list_triggers(session):
     return [name for (name, ) in session.execute(sql)]
 
 
+def insert_rows(session, table, rows, *, columns=None):
+    """
+    Inserts given *rows* into *table* using as few multi-row ``INSERT``
+    statements as possible. Each row must be a tuple containing the values of
+    the given *columns*, which defaults to all columns of the table.
+    """
+    if columns is None:
+        columns = list(table.c)
+    keys = [col.key for col in columns]
+    batch_size = max(1, MAX_VARIABLES // len(keys))
+    rows = iter(rows)
+    while True:
+        batch = [dict(zip(keys, row)) for row in islice(rows, batch_size)]
+        if not batch:
+            break
+        session.execute(table.insert().values(batch))
+
+
 def destroy(session, destroyable):
     """
     Drops everything in the database – tables, views, sequences, etc. For
@@ -45,6 +45,7 @@ setup(
     namespace_packages=['score'],
     zip_safe=False,
     license='LGPL',
+    python_requires='>=3.7',
     classifiers=[
         'Development Status :: 4 - Beta',
         'Environment :: Console',
@@ -55,13 +56,14 @@ setup(
         'Operating System :: OS Independent',
         'Programming Language :: SQL',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
         'Topic :: Software Development :: Libraries :: Application Frameworks',
         'Topic :: Database :: Front-Ends',
     ],
     install_requires=[
         'score.init >= 0.3',
-        'SQLAlchemy >= 0.9',
+        'SQLAlchemy >= 1.2',
         'zope.sqlalchemy >= 0.7',
     ],
 )
@@ -0,0 +1,57 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import warnings
+
+import pytest
+import sqlalchemy as sa
+
+from score.db import ConfiguredDbModule
+
+
+@pytest.fixture
+def make_db(tmp_path):
+    """
+    Returns a function creating a :class:`ConfiguredDbModule` for a given
+    declarative base class on a fresh sqlite database.
+    """
+    engines = []
+
+    def make(Base, **kwargs):
+        engine = sa.create_engine(
+            'sqlite:///%s' % (tmp_path / 'test.sqlite3'),
+            connect_args={'check_same_thread': False})
+        engines.append(engine)
+        Base.metadata.bind = engine
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            conf = ConfiguredDbModule(engine, Base, True, None, **kwargs)
+        conf.create()
+        return conf
+
+    yield make
+    for engine in engines:
+        engine.dispose()
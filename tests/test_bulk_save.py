@@ -0,0 +1,131 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import pytest
+import sqlalchemy as sa
+
+from score.db import ObjectCache, create_base
+
+
+Base = create_base()
+
+
+class User(Base):
+    name = sa.Column(sa.String(100))
+
+
+class Admin(User):
+    level = sa.Column(sa.Integer)
+
+
+class Thing(Base):
+    __score_db__ = {'inheritance': 'single-table'}
+    label = sa.Column(sa.String(100))
+
+
+class SubThing(Thing):
+    extra = sa.Column(sa.String(100))
+
+
+@pytest.fixture
+def db(make_db):
+    return make_db(Base, cache=ObjectCache([User]))
+
+
+@pytest.fixture
+def session(db):
+    session = db.Session(extension=[])
+    session.add(User(name='first'))
+    session.commit()
+    return session
+
+
+def test_bulk_save(session):
+    ids = session.bulk_save(
+        Admin, ({'name': 'a%d' % i, 'level': i} for i in range(2000)))
+    assert ids == list(range(2, 2002))
+    assert session.bulk_save(User, [{'name': 'x'}]) == [2002]
+    session.commit()
+    assert session.query(User).count() == 2002
+    admin = session.query(User).get(7)
+    assert type(admin) is Admin
+    assert (admin.name, admin.level) == ('a5', 5)
+
+
+def test_bulk_save_single_table(session):
+    ids = session.bulk_save(SubThing, [{'label': 'l', 'extra': 'e'}])
+    session.commit()
+    thing = session.query(Thing).get(ids[0])
+    assert type(thing) is SubThing
+    assert (thing.label, thing.extra) == ('l', 'e')
+
+
+def test_bulk_save_conflict(session):
+    ids = session.bulk_save(Admin, [{'name': 'a', 'level': 1}])
+    session.commit()
+    with pytest.raises(sa.exc.IntegrityError):
+        session.bulk_save(Admin, [{'id': ids[0], 'name': 'b', 'level': 2}])
+    session.rollback()
+    with pytest.raises(ValueError):
+        session.bulk_save(Admin, [], on_conflict='replace')
+
+
+def test_bulk_save_ignore(session):
+    ids = session.bulk_save(Admin, [{'name': 'a', 'level': 1}])
+    new_ids = session.bulk_save(Admin, [
+        {'id': ids[0], 'name': 'b', 'level': 2},
+        {'name': 'c', 'level': 3},
+    ], on_conflict='ignore')
+    session.commit()
+    assert session.query(Admin).get(ids[0]).name == 'a'
+    assert session.query(Admin).get(new_ids[1]).name == 'c'
+
+
+def test_bulk_save_update(session):
+    ids = session.bulk_save(Admin, [{'name': 'a', 'level': 1}])
+    session.bulk_save(Admin, [{'id': ids[0], 'level': 2}],
+                      on_conflict='update')
+    session.commit()
+    admin = session.query(Admin).get(ids[0])
+    assert (admin.name, admin.level) == ('a', 2)
+
+
+def test_bulk_save_update_invalidates_cache(db, session):
+    ids = session.bulk_save(User, [{'name': 'a'}])
+    session.commit()
+    assert db.Session(extension=[]).query(User).get(ids[0]).name == 'a'
+    session.bulk_save(User, [{'id': ids[0], 'name': 'b'}],
+                      on_conflict='update')
+    session.commit()
+    assert db.Session(extension=[]).query(User).get(ids[0]).name == 'b'
+
+
+def test_bulk_save_zope_transaction(db, session):
+    transaction = pytest.importorskip('transaction')
+    zope_session = db.Session()
+    ids = zope_session.bulk_save(User, [{'name': 'x'}, {'name': 'y'}])
+    transaction.commit()
+    assert session.query(User).filter(User.id.in_(ids)).count() == 2
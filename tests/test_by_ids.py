@@ -0,0 +1,210 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import pytest
+import sqlalchemy as sa
+
+from score.db import create_base
+from score.db._session import IdNotFound
+
+
+Base = create_base()
+
+
+class User(Base):
+    name = sa.Column(sa.String(100))
+
+
+class Admin(User):
+    level = sa.Column(sa.Integer)
+
+
+@pytest.fixture
+def db(make_db):
+    conf = make_db(Base)
+    session = conf.Session(extension=[])
+    for i in range(50):
+        if i % 2:
+            session.add(User(name='u%02d' % i))
+        else:
+            session.add(Admin(name='a%02d' % i, level=i))
+    session.commit()
+    return conf
+
+
+@pytest.fixture
+def session(db):
+    return db.Session(extension=[])
+
+
+@pytest.mark.parametrize('single_query', [False, True])
+def test_by_ids_order(session, single_query):
+    ids = [5, 3, 99, 9, 1]
+    users = session.by_ids(User, ids, single_query=single_query, yield_per=2)
+    assert [user.id for user in users] == [5, 3, 9, 1]
+
+
+@pytest.mark.parametrize('single_query', [False, True])
+def test_by_ids_unordered(session, single_query):
+    users = session.by_ids(User, [5, 3, 99, 9, 1], order=None,
+                           single_query=single_query)
+    assert sorted(user.id for user in users) == [1, 3, 5, 9]
+
+
+@pytest.mark.parametrize('single_query', [False, True])
+def test_by_ids_custom_order(session, single_query):
+    ids = list(range(1, 30))
+    users = list(session.by_ids(User, ids, order=User.name.desc(),
+                                single_query=single_query, yield_per=7))
+    names = [user.name for user in users]
+    assert len(users) == 29
+    assert names == sorted(names, reverse=True)
+
+
+@pytest.mark.parametrize('single_query', [False, True])
+def test_by_ids_missing(session, single_query):
+    with pytest.raises(IdNotFound):
+        list(session.by_ids(User, [5, 99], single_query=single_query,
+                            ignore_missing=False))
+
+
+def test_by_ids_single_query_polymorphic(session):
+    users = session.by_ids(User, [2, 3], single_query=True)
+    assert [type(user) for user in users] == [User, Admin]
+
+
+def test_by_ids_identity_map(session):
+    loaded = list(session.by_ids(User, [1, 2, 3, 4]))
+    session.by_ids_stats['queried'] = 0
+    users = list(session.by_ids(User, [4, 10, 2, 11, 1]))
+    assert [user.id for user in users] == [4, 10, 2, 11, 1]
+    assert users[0] is loaded[3]
+    assert session.by_ids_stats['identity_map_hits'] == 3
+    assert session.by_ids_stats['queried'] == 2
+
+
+def test_by_ids_identity_map_skips_expired(session):
+    loaded = list(session.by_ids(User, [1, 2]))
+    session.expire(loaded[0])
+    hits = session.by_ids_stats['identity_map_hits']
+    users = list(session.by_ids(User, [1, 2]))
+    assert users == loaded
+    assert session.by_ids_stats['identity_map_hits'] == hits + 1
+
+
+def test_by_ids_remember_missing(session):
+    ids = [5, 99, 3]
+    users = session.by_ids(User, ids, remember_missing=True)
+    assert [user.id for user in users] == [5, 3]
+    users = session.by_ids(User, ids, remember_missing=True)
+    assert [user.id for user in users] == [5, 3]
+    assert session.by_ids_stats['missing_ids_hits'] == 1
+    # the remembered ids are forgotten on flush
+    session.add(User(id=99, name='x'))
+    session.flush()
+    users = session.by_ids(User, ids, remember_missing=True)
+    assert [user.id for user in users] == [5, 99, 3]
+
+
+@pytest.fixture
+def prefetch_session(db, monkeypatch):
+    # the prefetch mode is disabled on sqlite, since connections cannot be
+    # shared between threads. the file database used in these tests can be
+    # accessed from multiple connections, though.
+    monkeypatch.setattr(db.engine.dialect, 'name', 'sqlite-threaded')
+    session = db.Session(extension=[])
+    yield session
+    session.close()
+
+
+@pytest.mark.parametrize('order', ['_ids', None])
+def test_by_ids_prefetch(prefetch_session, order):
+    ids = [7, 3, 99, 1, 45, 20, 11, 12, 2, 8]
+    users = prefetch_session.by_ids(User, ids, order=order, prefetch=2,
+                                    yield_per=3)
+    result = [user.id for user in users]
+    if order is None:
+        result.sort()
+        ids.sort()
+    ids.remove(99)
+    assert result == ids
+    assert all(user in prefetch_session
+               for user in prefetch_session.by_ids(User, ids))
+
+
+def test_by_ids_prefetch_missing(prefetch_session):
+    with pytest.raises(IdNotFound):
+        list(prefetch_session.by_ids(User, [1, 99, 2], prefetch=1,
+                                     yield_per=1, ignore_missing=False))
+
+
+def test_by_ids_prefetch_keeps_session_objects(prefetch_session):
+    user = next(prefetch_session.by_ids(User, [2]))
+    user.name = 'changed'
+    users = list(prefetch_session.by_ids(User, [1, 2, 3], prefetch=1,
+                                         yield_per=1, use_identity_map=False))
+    assert users[1] is user
+    assert user.name == 'changed'
+
+
+def test_by_ids_prefetch_reuses_worker(prefetch_session):
+    list(prefetch_session.by_ids(User, [1, 2, 3], prefetch=1, yield_per=1))
+    executor = prefetch_session._prefetch_executor
+    assert executor is not None
+    prefetch_session.expunge_all()
+    list(prefetch_session.by_ids(User, [1, 2, 3], prefetch=1, yield_per=1))
+    assert prefetch_session._prefetch_executor is executor
+    prefetch_session.close()
+    assert prefetch_session._prefetch_executor is None
+
+
+@pytest.fixture
+def statements(db):
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sa.event.listen(db.engine, 'before_cursor_execute', count)
+    yield statements
+    sa.event.remove(db.engine, 'before_cursor_execute', count)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {}, {'single_query': True}, {'order': None}, {'order': User.name}])
+def test_by_ids_polymorphic_load(session, statements, kwargs):
+    users = list(session.by_ids(User, range(1, 51), polymorphic_load=True,
+                                yield_per=100, **kwargs))
+    del statements[:]
+    assert sum(user.level for user in users if isinstance(user, Admin)) == \
+        sum(range(0, 50, 2))
+    assert not statements
+
+
+@pytest.mark.parametrize('single_query', [False, True])
+def test_by_ids_duplicates(session, single_query):
+    users = session.by_ids(User, [3, 2, 3, 2], single_query=single_query)
+    assert [user.id for user in users] == [3, 2, 3, 2]
@@ -0,0 +1,135 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import pytest
+import sqlalchemy as sa
+
+from score.db import ObjectCache, create_base
+
+
+Base = create_base()
+
+
+class User(Base):
+    name = sa.Column(sa.String(100))
+
+
+class Admin(User):
+    level = sa.Column(sa.Integer)
+
+
+class Group(Base):
+    name = sa.Column(sa.String(100))
+
+
+@pytest.fixture
+def db(make_db):
+    conf = make_db(Base, cache=ObjectCache([User], 100))
+    session = conf.Session(extension=[])
+    for i in range(10):
+        if i % 2:
+            session.add(User(name='u%d' % i))
+        else:
+            session.add(Admin(name='a%d' % i, level=i))
+        session.add(Group(name='g%d' % i))
+    session.commit()
+    conf.cache.clear()
+    return conf
+
+
+@pytest.fixture
+def statements(db):
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sa.event.listen(db.engine, 'before_cursor_execute', count)
+    yield statements
+    sa.event.remove(db.engine, 'before_cursor_execute', count)
+
+
+def test_cache_by_ids(db, statements):
+    names = [user.name for user in
+             db.Session(extension=[]).by_ids(User, [2, 4, 1])]
+    del statements[:]
+    session = db.Session(extension=[])
+    users = list(session.by_ids(User, [2, 4, 1]))
+    assert [user.name for user in users] == names
+    assert isinstance(users[2], Admin)
+    assert session.by_ids_stats['cache_hits'] == 3
+    assert not statements
+
+
+def test_cache_query_get(db, statements):
+    db.Session(extension=[]).query(User).get(2)
+    del statements[:]
+    session = db.Session(extension=[])
+    assert session.query(User).get(2).name == 'u1'
+    assert not statements
+
+
+def test_cache_ignores_other_classes(db, statements):
+    db.Session(extension=[]).query(Group).get(2)
+    del statements[:]
+    db.Session(extension=[]).query(Group).get(2)
+    assert statements
+
+
+def test_cache_invalidation_on_flush(db):
+    session = db.Session(extension=[])
+    session.query(User).get(2).name = 'changed'
+    session.flush()
+    # uncommitted changes must not be visible to other sessions
+    assert db.Session(extension=[]).query(User).get(2).name == 'u1'
+    session.commit()
+    assert db.Session(extension=[]).query(User).get(2).name == 'changed'
+
+
+def test_cache_invalidation_on_delete(db):
+    session = db.Session(extension=[])
+    session.delete(session.query(User).get(2))
+    session.commit()
+    assert db.Session(extension=[]).query(User).get(2) is None
+
+
+def test_cache_invalidation_on_bulk_update(db):
+    db.Session(extension=[]).query(User).get(2)
+    session = db.Session(extension=[])
+    session.query(User).filter(User.id == 2).\
+        update({'name': 'bulk'}, synchronize_session=False)
+    session.commit()
+    assert db.Session(extension=[]).query(User).get(2).name == 'bulk'
+
+
+def test_cache_max_entries(make_db):
+    cache = ObjectCache([User], 3)
+    conf = make_db(Base, cache=cache)
+    session = conf.Session(extension=[])
+    session.add_all(User(name=str(i)) for i in range(5))
+    session.commit()
+    list(conf.Session(extension=[]).by_ids(User, range(1, 6)))
+    assert len(cache._entries) == 3
@@ -0,0 +1,303 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex
+
+from score.db import (
+    create_base, create_collection_class, create_relationship_class)
+from score.db.helpers import SparseOrderingList
+
+
+Base = create_base()
+
+
+class User(Base):
+    name = sa.Column(sa.String(100))
+
+
+class Group(Base):
+    name = sa.Column(sa.String(100))
+
+
+class Thing(Base):
+    name = sa.Column(sa.String(100))
+
+
+UserGroup = create_relationship_class(User, Group, 'groups', backref='users')
+GroupThing = create_relationship_class(Group, Thing, 'things',
+                                       covering_indexes=False)
+UserFavorite = create_relationship_class(User, Thing, 'favorites',
+                                         sorted=True, backref='fans')
+GroupPerms = create_collection_class(
+    Group, 'perms', sa.Column(sa.String(20), nullable=False))
+GroupQuals = create_collection_class(
+    Group, 'quals', sa.Column(sa.String(20), nullable=False),
+    sorted=False, duplicates=False)
+GroupRoles = create_collection_class(
+    Group, 'roles', sa.Column(sa.String(20), nullable=False), indexes=False)
+GroupTags = create_collection_class(
+    Group, 'tags', sa.Column(sa.String(20), nullable=False),
+    ordering='sparse')
+
+
+@pytest.fixture
+def session(make_db):
+    return make_db(Base).Session(extension=[])
+
+
+def _indexes(cls):
+    return sorted(str(CreateIndex(index).compile(dialect=sqlite.dialect()))
+                  for index in cls.__table__.indexes)
+
+
+def test_indexes():
+    assert _indexes(UserGroup) == [
+        'CREATE INDEX ix__user_group_group_id '
+        'ON _user_group (group_id, user_id)',
+        'CREATE INDEX ix__user_group_user_id '
+        'ON _user_group (user_id, group_id)',
+    ]
+    assert _indexes(GroupThing) == [
+        'CREATE INDEX ix__group_thing_group_id ON _group_thing (group_id)',
+        'CREATE INDEX ix__group_thing_thing_id ON _group_thing (thing_id)',
+    ]
+    assert _indexes(GroupPerms) == [
+        'CREATE INDEX ix__group_perms_owner_id '
+        'ON _group_perms (owner_id, "index")',
+    ]
+    # the unique constraint already covers lookups by owner
+    assert _indexes(GroupQuals) == []
+    assert any(isinstance(constraint, sa.UniqueConstraint)
+               for constraint in GroupQuals.__table__.constraints)
+    assert _indexes(GroupRoles) == []
+
+
+def test_relationships(session):
+    user = User(name='u')
+    group = Group(name='g')
+    user.groups.append(group)
+    group.perms.append('x')
+    session.add(user)
+    session.flush()
+    session.expire_all()
+    assert session.query(Group).one().users == [user]
+    assert session.query(Group).one().perms == ['x']
+
+
+@pytest.fixture
+def statements(session):
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = session.get_bind()
+    sa.event.listen(engine, 'before_cursor_execute', count)
+    yield statements
+    sa.event.remove(engine, 'before_cursor_execute', count)
+
+
+def test_sync_relationship(session, statements):
+    groups = [Group(name=str(i)) for i in range(10)]
+    user = User(name='u')
+    session.add_all(groups + [user])
+    session.flush()
+    result = session.sync_relationship(user, 'groups',
+                                       [g.id for g in groups[:5]])
+    assert result == (0, 5)
+    assert sorted(g.name for g in user.groups) == list('01234')
+    del statements[:]
+    result = session.sync_relationship(user, 'groups',
+                                       [g.id for g in groups[3:8]])
+    assert result == (3, 3)
+    statements = [sql.split()[0] for sql in statements
+                  if '_user_group' in sql]
+    assert statements == ['DELETE', 'INSERT']
+    assert sorted(g.name for g in user.groups) == list('34567')
+
+
+def test_sync_sorted_relationship(session):
+    things = [Thing(name=str(i)) for i in range(5)]
+    user = User(name='u')
+    session.add_all(things + [user])
+    session.flush()
+    ids = [things[i].id for i in (3, 1, 0)]
+    assert session.sync_relationship(user, 'favorites', ids) == (0, 3)
+    assert [t.name for t in user.favorites] == list('310')
+    ids = [things[i].id for i in (3, 4, 0, 1)]
+    assert session.sync_relationship(user, 'favorites', ids) == (1, 2)
+    assert [t.name for t in user.favorites] == list('3401')
+    with pytest.raises(ValueError):
+        session.sync_relationship(things[0], 'fans', [user.id])
+    with pytest.raises(ValueError):
+        session.sync_relationship(user, 'name', [])
+
+
+def test_sync_collection(session):
+    group = Group(name='g')
+    session.add(group)
+    assert session.sync_collection(group, 'perms', list('abca')) == (0, 4)
+    assert group.perms == list('abca')
+    assert session.sync_collection(group, 'perms', list('acc')) == (2, 1)
+    assert group.perms == list('acc')
+    assert session.sync_collection(group, 'quals', list('xyx')) == (0, 2)
+    assert sorted(group.quals) == list('xy')
+    assert session.sync_collection(group, 'quals', list('yz')) == (1, 1)
+    assert sorted(group.quals) == list('yz')
+    assert session.sync_collection(group, 'quals', []) == (2, 0)
+    assert group.quals == []
+
+
+def test_sync_zope_transaction(session):
+    transaction = pytest.importorskip('transaction')
+    user = User(name='u')
+    group = Group(name='g')
+    session.add_all([user, group])
+    session.commit()
+    zope_session = session.dbconf.Session()
+    zope_session.sync_relationship(
+        zope_session.query(User).get(user.id), 'groups', [group.id])
+    zope_session.sync_collection(
+        zope_session.query(Group).get(group.id), 'perms', list('ab'))
+    transaction.commit()
+    session.expire_all()
+    assert [g.name for g in user.groups] == ['g']
+    assert group.perms == list('ab')
+
+
+def test_sync_sparse_collection(session):
+    group = Group(name='g')
+    session.add(group)
+    session.sync_collection(group, 'tags', list('abc'))
+    assert [(tag.value, tag.index) for tag in group.tags_wrapper] == [
+        ('a', 0), ('b', 1024), ('c', 2048)]
+    # the gaps allow inserting elements without shifting others
+    group.tags.insert(1, 'x')
+    session.flush()
+    assert [(tag.value, tag.index) for tag in group.tags_wrapper] == [
+        ('a', 0), ('x', 512), ('b', 1024), ('c', 2048)]
+
+
+class Entry:
+
+    def __init__(self, name):
+        self.name = name
+        self.index = None
+
+
+def _positions(entries):
+    return [(entry.name, entry.index) for entry in entries]
+
+
+def test_sparse_ordering():
+    entries = SparseOrderingList('index', gap=10)
+    for name in 'abc':
+        entries.append(Entry(name))
+    assert _positions(entries) == [('a', 0), ('b', 10), ('c', 20)]
+    entries.insert(0, Entry('d'))
+    entries.insert(2, Entry('e'))
+    assert _positions(entries) == [
+        ('d', -10), ('a', 0), ('e', 5), ('b', 10), ('c', 20)]
+    entries.insert(len(entries), Entry('f'))
+    assert entries[-1].index == 30
+
+
+def test_sparse_ordering_move():
+    entries = SparseOrderingList('index', gap=10)
+    for name in 'abcd':
+        entries.append(Entry(name))
+    entries.insert(1, entries.pop(3))
+    assert _positions(entries) == [('a', 0), ('d', 5), ('b', 10), ('c', 20)]
+    del entries[0]
+    assert _positions(entries) == [('d', 5), ('b', 10), ('c', 20)]
+
+
+def test_sparse_ordering_shift():
+    entries = SparseOrderingList('index', gap=2)
+    for name in 'abc':
+        entries.append(Entry(name))
+    entries.insert(1, Entry('x'))
+    entries.insert(1, Entry('y'))
+    # no gap left between a and y: only the elements up to the next gap
+    # are shifted
+    assert _positions(entries) == [
+        ('a', 0), ('y', 1), ('x', 2), ('b', 3), ('c', 4)]
+    entries.reorder()
+    assert _positions(entries) == [
+        ('a', 0), ('y', 2), ('x', 4), ('b', 6), ('c', 8)]
+
+
+def test_sparse_collection(session, statements):
+    group = Group(name='g')
+    session.add(group)
+    group.tags.extend('t%d' % i for i in range(100))
+    session.flush()
+    del statements[:]
+    group.tags.insert(50, 'x')
+    session.flush()
+    assert [sql.split()[0] for sql in statements] == ['INSERT']
+    session.expire_all()
+    assert group.tags[49:52] == ['t49', 'x', 't50']
+
+
+def test_load_collections(session, statements):
+    groups = [Group(name=str(i)) for i in range(20)]
+    users = [User(name=str(i)) for i in range(5)]
+    session.add_all(groups + users)
+    session.flush()
+    for i, group in enumerate(groups):
+        group.perms.extend('p%d' % j for j in range(i % 4))
+        group.quals.append('q')
+    for i, user in enumerate(users):
+        session.sync_relationship(user, 'groups',
+                                  [g.id for g in groups[i:i + 3]])
+    session.commit()
+    session.expunge_all()
+    groups = session.query(Group).order_by(Group.id).all()
+    users = session.query(User).order_by(User.id).all()
+    del statements[:]
+    session.load_collections(groups, 'perms', 'quals', 'users')
+    session.load_collections(users, 'groups')
+    queries = len(statements)
+    assert queries == 4
+    assert [g.perms for g in groups[:4]] == [
+        [], ['p0'], ['p0', 'p1'], ['p0', 'p1', 'p2']]
+    assert all(g.quals == ['q'] for g in groups)
+    assert [sorted(u.name for u in g.users) for g in groups[:4]] == [
+        ['0'], ['0', '1'], ['0', '1', '2'], ['1', '2', '3']]
+    assert [sorted(int(g.name) for g in u.groups) for u in users[:2]] == [
+        [0, 1, 2], [1, 2, 3]]
+    assert groups[3].perms_wrapper[0].owner is groups[3]
+    assert len(statements) == queries
+    # loaded collections are left untouched
+    groups[0].perms.append('new')
+    session.load_collections(groups, 'perms')
+    assert groups[0].perms == ['new']
+    with pytest.raises(ValueError):
+        session.load_collections(groups, 'name')
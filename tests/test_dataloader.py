@@ -0,0 +1,189 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import io
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.ext.orderinglist import ordering_list
+
+from score.db import (
+    Enum, create_base, create_collection_class, create_relationship_class)
+from score.db.dataloader import DataLoaderException, load_data
+
+
+class Status(Enum):
+    DRAFT = 'draft'
+    PUBLISHED = 'published'
+
+
+Base = create_base()
+
+
+class Tag(Base):
+    name = sa.Column(sa.String(50))
+
+
+class Author(Base):
+    name = sa.Column(sa.String(50))
+
+
+class Article(Base):
+    title = sa.Column(sa.String(50))
+    status = sa.Column(Status.db_type())
+    author_id = sa.Column(sa.Integer, sa.ForeignKey('_author.id'))
+    author = sa.orm.relationship(Author, backref='articles')
+    _tags = sa.orm.relationship(
+        'ArticleTag', order_by='ArticleTag.position',
+        collection_class=ordering_list('position'))
+    tags = association_proxy('_tags', 'tag',
+                             creator=lambda tag: ArticleTag(tag=tag))
+
+
+class ArticleTag(Base):
+    article_id = sa.Column(sa.Integer, sa.ForeignKey('_article.id'))
+    tag_id = sa.Column(sa.Integer, sa.ForeignKey('_tag.id'))
+    position = sa.Column(sa.Integer)
+    tag = sa.orm.relationship(Tag)
+
+
+create_relationship_class(Article, Author, 'reviewers', sorted=True)
+create_collection_class(Article, 'keywords',
+                        sa.Column(sa.String(20), nullable=False))
+
+
+@pytest.fixture
+def session(make_db):
+    return make_db(Base).Session(extension=[])
+
+
+def _load(session, yaml, ids=None):
+    yaml = yaml.replace('MODULE', __name__)
+    return load_data(io.StringIO(yaml), ids, bulk=True, session=session)
+
+
+BASE = '''
+MODULE.Tag:
+  t1: {name: x}
+  t2: {name: y}
+MODULE.Author:
+  alice:
+    name: Alice
+    articles: [a1]
+  bob: {name: Bob}
+MODULE.Article:
+  a1:
+    title: A
+    status: published
+    tags: [t2, t1]
+    reviewers: [bob, alice]
+    keywords: [k1, k2]
+'''
+
+
+def test_bulk_load(session):
+    ids = _load(session, BASE)
+    assert ids == {
+        __name__ + '.Tag': {'t1': 1, 't2': 2},
+        __name__ + '.Author': {'alice': 1, 'bob': 2},
+        __name__ + '.Article': {'a1': 1},
+    }
+    session.commit()
+    article = session.query(Article).one()
+    assert (article.title, article.status) == ('A', Status.PUBLISHED)
+    assert article.author.name == 'Alice'
+    assert [tag.name for tag in article.tags] == ['y', 'x']
+    assert [entry.position for entry in article._tags] == [0, 1]
+    assert [author.name for author in article.reviewers] == ['Bob', 'Alice']
+    assert article.keywords == ['k1', 'k2']
+
+
+def test_bulk_load_zope_transaction(session):
+    transaction = pytest.importorskip('transaction')
+    zope_session = session.dbconf.Session()
+    _load(zope_session, BASE)
+    transaction.commit()
+    article = session.query(Article).one()
+    assert [tag.name for tag in article.tags] == ['y', 'x']
+    assert article.keywords == ['k1', 'k2']
+
+
+def test_bulk_load_references(session):
+    ids = _load(session, BASE)
+    ids = _load(session, '''
+MODULE.Article:
+  a2:
+    title: B
+    author: bob
+    tags: [t1, t2]
+  a3:
+    title: C
+    tags: [t2]
+''', ids)
+    session.commit()
+    assert ids[__name__ + '.Article'] == {'a1': 1, 'a2': 2, 'a3': 3}
+    articles = session.query(Article).order_by(Article.id).all()
+    assert [[tag.name for tag in a.tags] for a in articles] == [
+        ['y', 'x'], ['x', 'y'], ['y']]
+    assert articles[1].author.name == 'Bob'
+    ids = [id for (id, ) in session.query(ArticleTag.id)]
+    assert sorted(ids) == list(range(1, 6))
+
+
+def test_bulk_load_proxy_ids(session):
+    # the rows created for the association proxy and the named rows of the
+    # same class must receive distinct ids
+    ids = _load(session, '''
+MODULE.Tag:
+  t1: {name: x}
+MODULE.Article:
+  a1:
+    title: A
+    tags: [t1, t1]
+MODULE.ArticleTag:
+  at1: {article_id: 1, tag: t1, position: 2}
+''')
+    session.commit()
+    assert session.query(ArticleTag).count() == 3
+    assert ids[__name__ + '.ArticleTag']['at1'] in \
+        [id for (id, ) in session.query(ArticleTag.id)]
+
+
+def test_bulk_load_errors(session):
+    with pytest.raises(DataLoaderException):
+        load_data(io.StringIO('{}'), bulk=True)
+    with pytest.raises(DataLoaderException):
+        _load(session, '''
+MODULE.Article:
+  a1: {author: nobody}
+''')
+    with pytest.raises(DataLoaderException):
+        _load(session, '''
+MODULE.Author:
+  alice:
+    articles: [a1]
+''')
@@ -0,0 +1,102 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import pytest
+import sqlalchemy as sa
+
+from score.db import Enum, create_base
+from score.db.dbenum import EnumCodeType
+
+
+class Status(Enum):
+    __db_codes__ = {'ONLINE': 1, 'OFFLINE': 2}
+    ONLINE = 'online'
+    OFFLINE = 'offline'
+
+
+class Plain(Enum):
+    A = 'a'
+    B = 'b'
+
+
+Base = create_base()
+
+
+class Event(Base):
+    status = sa.Column(Status.db_type())
+    plain = sa.Column(Plain.db_type())
+
+
+@pytest.fixture
+def session(make_db):
+    session = make_db(Base).Session(extension=[])
+    session.add_all([
+        Event(status=Status.ONLINE, plain=Plain.A),
+        Event(status='offline', plain='b'),
+        Event(),
+    ])
+    session.flush()
+    session.expire_all()
+    return session
+
+
+def test_code_type():
+    assert isinstance(Event.__table__.c.status.type, EnumCodeType)
+    assert not isinstance(Event.__table__.c.plain.type, EnumCodeType)
+
+
+def test_storage(session):
+    assert session.execute(
+        'SELECT status, plain FROM _event ORDER BY id').fetchall() == [
+            (1, 'a'), (2, 'b'), (None, None)]
+    events = session.query(Event).order_by(Event.id)
+    assert [(event.status, event.plain) for event in events] == [
+        (Status.ONLINE, Plain.A), (Status.OFFLINE, Plain.B), (None, None)]
+    query = session.query(Event.id).filter(Event.status == Status.OFFLINE)
+    assert query.all() == [(2, )]
+
+
+@pytest.mark.parametrize('codes', [
+    {'ONLINE': 1, 'OFFLINE': 1},
+    {'ONLINE': 1},
+    {'ONLINE': 1, 'OFFLINE': 'x'},
+    {'ONLINE': 1, 'OFFLINE': 99999},
+])
+def test_invalid_codes(codes):
+    with pytest.raises(ValueError):
+        class Invalid(Enum):
+            __db_codes__ = codes
+            ONLINE = 'online'
+            OFFLINE = 'offline'
+
+
+def test_codes_of_unknown_members():
+    class Unknown(Enum):
+        __db_codes__ = {'ONLINE': 1, 'X': 2}
+        ONLINE = 'online'
+
+    with pytest.raises(ValueError):
+        Unknown.db_type()
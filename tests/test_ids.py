@@ -0,0 +1,118 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import pytest
+import sqlalchemy as sa
+
+from score.db import create_base
+
+
+Base = create_base()
+
+
+class Post(Base):
+    __score_db__ = {'id_block_size': 50}
+    title = sa.Column(sa.String(100))
+
+
+class Article(Post):
+    body = sa.Column(sa.String(100))
+
+
+@pytest.fixture
+def db(make_db):
+    return make_db(Base)
+
+
+def test_block_ids(db):
+    session = db.Session(extension=[])
+    session.add(Post(title='first'))
+    session.commit()
+    statements = []
+
+    @sa.event.listens_for(db.engine, 'before_cursor_execute')
+    def count(conn, cursor, statement, params, context, executemany):
+        if statement.startswith('INSERT INTO _post'):
+            statements.append(executemany)
+
+    for i in range(120):
+        if i % 2:
+            session.add(Article(title='t', body='b'))
+        else:
+            session.add(Post(title='p'))
+    session.flush()
+    # ids known up front allow inserting all rows of a table at once
+    assert statements == [True]
+    session.commit()
+    ids = [id for (id, ) in session.query(Post.id).order_by(Post.id)]
+    assert ids == list(range(1, 122))
+    assert session.bulk_save(Article, [{'title': 'q', 'body': 'z'}]) == [122]
+
+
+def test_block_ids_after_rollback(db):
+    session = db.Session(extension=[])
+    post = Post(title='x')
+    session.add(post)
+    session.flush()
+    id = post.id
+    session.rollback()
+    # the block was reserved outside of the rolled back transaction
+    assert db.engine.execute(
+        'SELECT next FROM _score_db_ids').scalar() == id + 50
+    post = Post(title='y')
+    session.add(post)
+    session.flush()
+    assert post.id == id + 1
+
+
+def test_block_ids_within_write_transaction(db):
+    session = db.Session(extension=[])
+    session.add_all(Post(title='a') for i in range(40))
+    session.flush()
+    # the next block is reserved within the session's transaction, which
+    # already holds sqlite's write lock
+    session.add_all(Post(title='b') for i in range(40))
+    session.flush()
+    ids = [id for (id, ) in session.query(Post.id).order_by(Post.id)]
+    assert ids == list(range(1, 81))
+    session.rollback()
+    post = Post(title='c')
+    session.add(post)
+    session.flush()
+    assert post.id == 51
+
+
+def test_block_ids_after_destroy(db):
+    session = db.Session(extension=[])
+    session.add(Post(title='a'))
+    session.commit()
+    db.destroy(db.Session(extension=[]))
+    db.create()
+    session = db.Session(extension=[])
+    post = Post(title='b')
+    session.add(post)
+    session.commit()
+    assert post.id == 1
@@ -0,0 +1,102 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+
+def _run(code):
+    subprocess.check_call([sys.executable, '-c', textwrap.dedent(code)])
+
+
+def test_lazy_members():
+    _run('''
+        import sys
+        import score.db
+        assert 'score.db.dataloader' not in sys.modules
+        assert 'yaml' not in sys.modules
+        assert 'sqlalchemy.dialects.postgresql' not in sys.modules
+        assert 'load_data' in dir(score.db)
+        from score.db import load_data, DataLoaderException
+        assert 'score.db.dataloader' in sys.modules
+        assert load_data is score.db.dataloader.load_data
+    ''')
+
+
+def test_star_import():
+    _run('''
+        from score.db import *
+        assert json_type is not None
+        assert JsonType is not None
+    ''')
+
+
+def test_unknown_member():
+    _run('''
+        import score.db
+        try:
+            score.db.nonexistent
+        except AttributeError:
+            pass
+        else:
+            raise AssertionError()
+    ''')
+
+
+def test_lazy_zope():
+    _run('''
+        import sys
+        import warnings
+        import sqlalchemy as sa
+        from score.db import ConfiguredDbModule, create_base
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            conf = ConfiguredDbModule(
+                sa.create_engine('sqlite://'), create_base(), False, None)
+            conf.Session(extension=[]).close()
+            assert 'zope.sqlalchemy' not in sys.modules
+            session = conf.Session()
+        assert 'zope.sqlalchemy' in sys.modules
+        assert session._zope_extension is not None
+    ''')
+
+
+def test_alembic_operations():
+    _run('''
+        import sys
+        import score.db
+        assert 'score.db.alembic' not in sys.modules
+    ''')
+    pytest.importorskip('alembic')
+    _run('''
+        import sys
+        import alembic
+        import score.db
+        assert 'score.db.alembic' in sys.modules
+    ''')
@@ -0,0 +1,220 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from score.db import create_base
+from score.db._conf import ConfigurationError
+from score.db._sa_stmt import CreateInheritanceTrigger, StatementBatch
+
+
+def _create_classes(**config):
+    Base = create_base()
+
+    class User(Base):
+        __score_db__ = dict(config)
+        name = sa.Column(sa.String(100))
+
+    class Admin(User):
+        level = sa.Column(sa.Integer)
+
+    class SuperAdmin(Admin):
+        power = sa.Column(sa.Integer)
+
+    return Base, User, Admin, SuperAdmin
+
+
+@pytest.mark.parametrize('delete_trigger', ['row', 'statement'])
+def test_delete_trigger(make_db, delete_trigger):
+    Base, User, Admin, SuperAdmin = _create_classes(
+        delete_trigger=delete_trigger)
+    assert SuperAdmin.__score_db__['delete_trigger'] == delete_trigger
+    db = make_db(Base)
+    session = db.Session(extension=[])
+    session.add_all(SuperAdmin(name=str(i), level=i, power=i)
+                    for i in range(10))
+    session.add(User(name='user'))
+    session.commit()
+    session.execute(SuperAdmin.__table__.delete().where(
+        SuperAdmin.__table__.c.id <= 5))
+    session.commit()
+    assert session.query(sa.func.count(Admin.__table__.c.id)).scalar() == 5
+    assert session.query(User).count() == 6
+
+
+@pytest.mark.parametrize('level', ['row', 'statement'])
+def test_delete_trigger_statement_sql(level):
+    Base, User, Admin, SuperAdmin = _create_classes(delete_trigger='statement')
+    sql = str(CreateInheritanceTrigger(
+        Admin.__table__, User.__table__, 'statement').compile(
+            dialect=postgresql.dialect()))
+    assert 'REFERENCING OLD TABLE AS old_rows' in sql
+    assert 'FOR EACH STATEMENT' in sql
+    batch = str(StatementBatch([
+        CreateInheritanceTrigger(Admin.__table__, User.__table__, level),
+        sa.text('SELECT 1')]).compile(dialect=postgresql.dialect()))
+    assert ';;' not in batch
+
+
+def test_delete_trigger_invalid():
+    with pytest.raises(ConfigurationError):
+        _create_classes(delete_trigger='table')
+
+
+def _view_rows(session, name):
+    return session.execute(
+        'SELECT id, title, fmt FROM "%s" ORDER BY id' % name).fetchall()
+
+
+def _create_documents(view):
+    Base = create_base()
+
+    class Doc(Base):
+        __score_db__ = {'view': view}
+        title = sa.Column(sa.String(100))
+
+    class Img(Doc):
+        __score_db__ = {'view': view}
+        fmt = sa.Column(sa.String(10))
+
+    return Base, Doc, Img
+
+
+def test_materialized_view(make_db):
+    Base, Doc, Img = _create_documents('materialized')
+    assert Img.__score_db__['view'] == 'materialized'
+    db = make_db(Base)
+    session = db.Session(extension=[])
+    img = Img(title='i', fmt='png')
+    session.add_all([img, Doc(title='d')])
+    session.commit()
+    assert _view_rows(session, 'img') == [(1, 'i', 'png')]
+    img.title = 'I'
+    img.fmt = 'gif'
+    session.commit()
+    assert _view_rows(session, 'img') == [(1, 'I', 'gif')]
+    session.delete(img)
+    session.commit()
+    assert _view_rows(session, 'img') == []
+    assert session.execute('SELECT title FROM doc').fetchall() == [('d', )]
+
+
+def test_materialized_view_indexes(make_db):
+    Base, Doc, Img = _create_documents('materialized')
+    db = make_db(Base)
+    indexes = [name for (name, ) in db.engine.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' "
+        "AND tbl_name = 'img'")]
+    assert sorted(indexes) == ['ix_img_id', 'ix_img_type']
+
+
+def test_refresh_views_zope_session(make_db, monkeypatch):
+    transaction = pytest.importorskip('transaction')
+    Base, Doc, Img = _create_documents('materialized')
+    db = make_db(Base)
+    # pretend to refresh the views on postgresql, writing through the session
+    monkeypatch.setattr(db.engine.dialect, 'name', 'postgresql')
+    monkeypatch.setattr(db, '_refresh_views', lambda session, concurrently:
+                        session.execute("INSERT INTO _doc (title, _type) "
+                                        "VALUES ('x', 'doc')"))
+    db.refresh_views(db.Session())
+    transaction.commit()
+    monkeypatch.undo()
+    session = db.Session(extension=[])
+    assert session.execute('SELECT title FROM doc').fetchall() == [('x', )]
+
+
+@pytest.mark.parametrize('views', [
+    ('plain', 'materialized', 'plain'),
+    ('materialized', 'plain', 'materialized'),
+])
+def test_switch_view_kind(make_db, views):
+    for id, view in enumerate(views, start=1):
+        Base, Doc, Img = _create_documents(view)
+        db = make_db(Base)
+        session = db.Session(extension=[])
+        session.add(Img(title=view, fmt='png'))
+        session.commit()
+        assert [title for _, title, _ in _view_rows(session, 'img')] == \
+            list(views[:id])
+        session.close()
+
+
+def _schema(db):
+    return sorted(db.engine.execute(
+        "SELECT type, name, sql FROM sqlite_master "
+        "WHERE type IN ('view', 'trigger', 'table')").fetchall())
+
+
+def test_create_unchanged(make_db):
+    Base, User, Admin, SuperAdmin = _create_classes()
+    db = make_db(Base)
+    schema = _schema(db)
+    executed = []
+    sa.event.listen(db.engine, 'before_cursor_execute',
+                    lambda conn, cursor, sql, *args: executed.append(sql))
+    db.create()
+    assert not [sql for sql in executed
+                if sql.lstrip().startswith(('CREATE', 'DROP'))]
+    assert _schema(db) == schema
+
+
+def test_create_restores_missing_objects(make_db):
+    Base, User, Admin, SuperAdmin = _create_classes()
+    db = make_db(Base)
+    schema = _schema(db)
+    db.engine.execute('DROP VIEW admin')
+    db.engine.execute('DROP TRIGGER autodel_super_admin')
+    db.create()
+    assert _schema(db) == schema
+
+
+def test_create_recreated_table(make_db):
+    Base, User, Admin, SuperAdmin = _create_classes()
+    db = make_db(Base)
+    schema = _schema(db)
+    # dropping a table drops its triggers, too
+    SuperAdmin.__table__.drop()
+    db.create()
+    assert _schema(db) == schema
+
+
+
+def test_create_changed_definition(make_db):
+    Base, User, Admin, SuperAdmin = _create_classes()
+    db = make_db(Base)
+    db.engine.execute('ALTER TABLE _admin ADD COLUMN rank INTEGER')
+    db.engine.dispose()
+    Base, User, Admin, SuperAdmin = _create_classes()
+    Admin.rank = sa.Column(sa.Integer)
+    db = make_db(Base)
+    views = dict((name, sql) for type, name, sql in _schema(db)
+                 if type == 'view')
+    assert 'rank' in views['admin']
+    assert 'rank' in views['super_admin']
+    assert 'rank' not in views['user']
@@ -0,0 +1,167 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import copy
+import json
+import pickle
+
+import pytest
+import sqlalchemy as sa
+
+from score.db import CompressedJSON, _json, create_base, engine_from_config
+from score.db._json import LazyJsonDict
+from score.db.helpers import JSON, JsonType, json_type
+
+
+Base = create_base()
+
+
+class Doc(Base):
+    data = sa.Column(json_type(lazy=True, mutable=True))
+    plain = sa.Column(JSON)
+    lazy = sa.Column(json_type(lazy=True))
+
+
+class Archive(Base):
+    small = sa.Column(CompressedJSON())
+    large = sa.Column(CompressedJSON(algorithm='lzma', threshold=10))
+
+
+@pytest.fixture
+def session(make_db):
+    session = make_db(Base).Session(extension=[])
+    session.add(Doc(data={'a': 1, 'b': [1, 2]}, plain=[1, 2], lazy={'x': 1}))
+    session.commit()
+    session.expunge_all()
+    return session
+
+
+@pytest.fixture
+def backend():
+    dumps, loads = _json.dumps, _json.loads
+    yield
+    _json.dumps, _json.loads = dumps, loads
+
+
+def test_set_backend(backend):
+    _json.set_backend('json')
+    assert _json.dumps is json.dumps
+    _json.set_backend('auto')
+    assert _json.loads('{"a": [1]}') == {'a': [1]}
+    with pytest.raises(ValueError):
+        _json.set_backend('simplejson')
+
+
+@pytest.mark.parametrize('url, kwargs', [
+    ('sqlite://', set()),
+    ('postgresql://localhost/test', {'json_serializer', 'json_deserializer'}),
+])
+def test_engine_kwargs(monkeypatch, url, kwargs):
+    calls = []
+    monkeypatch.setattr(sa, 'engine_from_config',
+                        lambda conf, **kwargs: calls.append(kwargs))
+    engine_from_config({'sqlalchemy.url': url})
+    assert set(calls[0]) == kwargs
+
+
+def test_lazy_dict():
+    value = LazyJsonDict('{"k": 2}')
+    assert not value.decoded
+    assert len(value) == 1
+    assert value.decoded
+    assert value == {'k': 2}
+    assert not LazyJsonDict('{}')
+    assert pickle.loads(pickle.dumps(value)) == {'k': 2}
+    assert copy.deepcopy(value) == {'k': 2}
+
+
+def test_lazy_dict_compare():
+    assert LazyJsonDict('{"k": 2}') == LazyJsonDict('{"k": 2}')
+    assert LazyJsonDict('{"k": 2}') != LazyJsonDict('{"k": 3}')
+    assert not LazyJsonDict('{"k": 2}') != LazyJsonDict('{"k": 2}')
+    assert {'k': 2} == LazyJsonDict('{"k": 2}')
+
+
+def test_lazy_column(session):
+    doc = session.query(Doc).one()
+    assert isinstance(doc.data, LazyJsonDict)
+    assert not doc.data.decoded
+    assert doc.data['a'] == 1
+    assert doc.plain == [1, 2]
+    assert doc.lazy == {'x': 1}
+
+
+def test_mutable_column(session):
+    doc = session.query(Doc).one()
+    doc.data['c'] = 3
+    doc.lazy['y'] = 2
+    session.commit()
+    session.expunge_all()
+    doc = session.query(Doc).one()
+    assert doc.data == {'a': 1, 'b': [1, 2], 'c': 3}
+    # changes to non-mutable columns are not detected
+    assert doc.lazy == {'x': 1}
+
+
+def test_unmodified_values_are_not_serialized(monkeypatch):
+    type = JsonType(lazy=True)
+    value = LazyJsonDict('{"x": 1}')
+    assert value['x'] == 1
+    monkeypatch.setattr(_json, 'dumps', None)
+    assert type.process_bind_param(value, None) == '{"x": 1}'
+    monkeypatch.undo()
+    value['y'] = 2
+    assert json.loads(type.process_bind_param(value, None)) == \
+        {'x': 1, 'y': 2}
+
+
+@pytest.mark.parametrize('algorithm, format', [('zlib', 1), ('lzma', 2)])
+def test_compressed_json_formats(algorithm, format):
+    type = CompressedJSON(algorithm=algorithm, threshold=10)
+    value = {'key': 'value' * 100}
+    data = type.process_bind_param(value, None)
+    assert data[0] == format
+    assert len(data) < len(json.dumps(value))
+    assert type.process_result_value(data, None) == value
+    data = type.process_bind_param([1], None)
+    assert data == b'\x00[1]'
+    assert type.process_result_value(data, None) == [1]
+
+
+def test_compressed_json_invalid():
+    with pytest.raises(ValueError):
+        CompressedJSON(algorithm='gzip')
+    with pytest.raises(ValueError):
+        CompressedJSON().process_result_value(b'\x07abc', None)
+
+
+def test_compressed_json_column(session):
+    value = {'list': list(range(100))}
+    session.add(Archive(small=[1, 2], large=value))
+    session.commit()
+    session.expunge_all()
+    archive = session.query(Archive).one()
+    assert (archive.small, archive.large) == ([1, 2], value)
@@ -0,0 +1,167 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import CompileError
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.sql.util import ClauseAdapter
+
+from score.db import create_base
+from score.db._conf import ConfigurationError
+from score.db.helpers import JSON
+
+
+Base = create_base()
+
+
+class Doc(Base):
+    __score_db__ = {
+        'json_indexes': {
+            'data': 'gin',
+            ('data', 'a', 'b'): 'int',
+            ('data', 'a', 's'): 'str',
+        },
+    }
+    data = sa.Column(JSON)
+
+
+@pytest.fixture
+def session(make_db):
+    session = make_db(Base).Session(extension=[])
+    session.add_all(Doc(data={
+        'a': {'b': i, 's': 'x%d' % i, 'f': i / 2, 'ok': i % 2 == 0,
+              'n': None},
+        'tags': ['t%d' % i, 'all'],
+        'k y': i,
+    }) for i in range(5))
+    session.flush()
+    return session
+
+
+def _sql(expr, dialect):
+    return str(expr.compile(dialect=dialect,
+                            compile_kwargs={'literal_binds': True}))
+
+
+@pytest.mark.parametrize('expr, ids', [
+    (Doc.data['a']['b'].as_int() == 3, [4]),
+    (Doc.data[('a', 'b')].as_int() > 2, [4, 5]),
+    (Doc.data['a']['s'].as_str() == 'x1', [2]),
+    (Doc.data['a']['s'].astext == 'x1', [2]),
+    (Doc.data['a']['f'].as_float() == 1.5, [4]),
+    (Doc.data['a']['ok'].as_bool() == sa.true(), [1, 3, 5]),
+    (Doc.data['k y'].as_int() == 1, [2]),
+    (Doc.data['tags'][0].as_str() == 't2', [3]),
+    (Doc.data.contains({'a': {'b': 1}}), [2]),
+    (Doc.data.contains({'tags': ['all', 't3']}), [4]),
+    (Doc.data.contains({'a': {'ok': False, 'n': None}}), [2, 4]),
+    (Doc.data['a'].contains({'s': 'x0'}), [1]),
+])
+def test_query(session, expr, ids):
+    assert sorted(id for (id, ) in session.query(Doc.id).filter(expr)) == ids
+
+
+def test_select_values(session):
+    query = session.query(Doc.data['a']['b'].as_int(),
+                          Doc.data['a']['ok'].as_bool()).order_by(Doc.id)
+    assert query.limit(2).all() == [(0, True), (1, False)]
+
+
+def test_postgresql():
+    dialect = postgresql.dialect()
+    assert _sql(Doc.data['a'][0].as_int() == 3, dialect) == \
+        "CAST((_doc.data #>> '{\"a\",\"0\"}') AS BIGINT) = 3"
+    assert _sql(Doc.data['a'].astext, dialect) == \
+        "(_doc.data #>> '{\"a\"}')"
+    assert _sql(Doc.data.contains({'a': 1}), dialect) == \
+        "_doc.data @> CAST('{\"a\": 1}' AS JSONB)"
+    # the operators of sqlalchemy's JSONB type remain available
+    assert _sql(Doc.data.has_key('a'), dialect) == "_doc.data ? 'a'"
+    assert _sql(Doc.data['a'].has_key('b'), dialect) == \
+        "(_doc.data #> '{\"a\"}') ? 'b'"
+    assert str(Doc.data.contained_by({'a': 1}).compile(dialect=dialect)) == \
+        '_doc.data <@ %(param_1)s'
+
+
+def test_sqlite_errors():
+    dialect = sqlite.dialect()
+    with pytest.raises(CompileError):
+        _sql(Doc.data['a"b'].as_int(), dialect)
+    with pytest.raises(CompileError):
+        _sql(Doc.data.contains({'tags': [{'a': 1}]}), dialect)
+
+
+def test_indexes():
+    indexes = dict((index.name, index) for index in Doc.__table__.indexes)
+    assert set(indexes) == {
+        'ix__doc_data', 'ix__doc_data_a_b', 'ix__doc_data_a_s'}
+    create = CreateIndex(indexes['ix__doc_data'])
+    assert str(create.compile(dialect=postgresql.dialect())) == \
+        'CREATE INDEX ix__doc_data ON _doc USING gin (data)'
+
+
+
+def test_gin_index_sqlite(session):
+    names = [name for (name, ) in session.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' "
+        "AND tbl_name = '_doc'")]
+    assert 'ix__doc_data' not in names
+    assert 'ix__doc_data_a_b' in names
+    # the index remains part of the metadata
+    assert 'ix__doc_data' in [index.name for index in Doc.__table__.indexes]
+
+
+def test_adapt(session):
+    alias = Doc.__table__.alias('d')
+    expr = ClauseAdapter(alias).traverse(
+        (Doc.data['a']['b'].as_int() == 3) & Doc.data.contains({'k y': 2}))
+    sql = _sql(expr, sqlite.dialect())
+    assert sql.count('d.data') == 2
+    assert '_doc' not in sql
+    query = session.query(Doc).from_self().\
+        filter(Doc.data['a']['b'].as_int() == 3)
+    assert [doc.id for doc in query] == [4]
+
+
+@pytest.mark.parametrize('expr, index', [
+    (Doc.data['a']['b'].as_int() == 3, 'ix__doc_data_a_b'),
+    (Doc.data['a']['s'].as_str() == '3', 'ix__doc_data_a_s'),
+])
+def test_index_usage(session, expr, index):
+    query = session.query(Doc.id).filter(expr)
+    plan = session.execute('EXPLAIN QUERY PLAN ' + _sql(
+        query.statement, sqlite.dialect())).fetchall()
+    assert index in str(plan)
+
+
+def test_invalid_index():
+    Base = create_base()
+    with pytest.raises(ConfigurationError):
+        class Invalid(Base):
+            __score_db__ = {'json_indexes': {'other': 'gin'}}
+            data = sa.Column(JSON)
@@ -0,0 +1,106 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import datetime
+import os
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from score.db import create_base
+from score.db.pg import _copy_value
+
+
+class Binary:
+    # mimics psycopg2's adapter returned by the bind processor of bytea
+    def __init__(self, adapted):
+        self.adapted = adapted
+
+    def __str__(self):
+        return "'\\\\000'::bytea"
+
+
+@pytest.mark.parametrize('value,expected', [
+    (None, '\\N'),
+    (True, 't'),
+    ('a\tb\\c\n', 'a\\tb\\\\c\\n'),
+    (12, '12'),
+    (datetime.date(2020, 1, 2), '2020-01-02'),
+    (b'\x00\xff', '\\\\x00ff'),
+    (Binary(b'\x00\xff'), '\\\\x00ff'),
+    ([1, 2], '{"1","2"}'),
+    ([[1, None], ['a"b', 'c\\d']],
+     '{{"1",NULL},{"a\\\\"b","c\\\\\\\\d"}}'),
+    ('{"a": [1, 2]}', '{"a": [1, 2]}'),
+])
+def test_copy_value(value, expected):
+    assert _copy_value(value) == expected
+
+
+@pytest.mark.parametrize('value', [{'a': 1}, datetime.timedelta(1)])
+def test_copy_value_unsupported(value):
+    with pytest.raises(TypeError):
+        _copy_value(value)
+
+
+Base = create_base()
+
+
+class Blob(Base):
+    data = sa.Column(sa.LargeBinary)
+    doc = sa.Column(sa.JSON)
+    tags = sa.Column(postgresql.ARRAY(sa.String(10)))
+
+
+@pytest.fixture
+def pg_session():
+    url = os.environ.get('SCORE_DB_TEST_POSTGRESQL')
+    if not url:
+        pytest.skip('SCORE_DB_TEST_POSTGRESQL is not set')
+    from score.db import ConfiguredDbModule
+    engine = sa.create_engine(url)
+    Base.metadata.bind = engine
+    conf = ConfiguredDbModule(engine, Base, True, None)
+    conf.create()
+    session = conf.Session(extension=[])
+    yield session
+    session.close()
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+def test_copy_round_trip(pg_session):
+    rows = [
+        {'data': b'\x00\\\t\xff', 'doc': {'a': 'b\tc', 'd': [1, None]},
+         'tags': ['x', 'y"z', '']},
+        {'data': None, 'doc': None, 'tags': None},
+    ]
+    ids = pg_session.bulk_save(Blob, rows)
+    pg_session.commit()
+    blobs = pg_session.query(Blob).filter(Blob.id.in_(ids)).order_by(Blob.id)
+    assert [(blob.data, blob.doc, blob.tags) for blob in blobs] == \
+        [(row['data'], row['doc'], row['tags']) for row in rows]
@@ -0,0 +1,86 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import sqlalchemy as sa
+
+from score.db import create_base
+
+
+Base = create_base()
+
+
+class User(Base):
+    name = sa.Column(sa.String(100))
+
+
+class Admin(User):
+    level = sa.Column(sa.Integer)
+
+
+class SuperAdmin(Admin):
+    power = sa.Column(sa.Integer)
+
+
+class Group(Base):
+    name = sa.Column(sa.String(100))
+
+
+class Thing(Base):
+    __score_db__ = {'inheritance': 'single-table'}
+    label = sa.Column(sa.String(100))
+
+
+class SubThing(Thing):
+    extra = sa.Column(sa.String(100))
+
+
+registry = Base.__score_db_registry__
+
+
+def test_hierarchy():
+    assert registry.roots() == [User, Group, Thing]
+    assert list(registry.levels()) == [
+        [User, Group, Thing], [Admin, SubThing], [SuperAdmin]]
+    assert registry.root(SuperAdmin) is User
+    assert registry.root(Group) is Group
+    assert registry.ancestors(SuperAdmin) == (Admin, User)
+    assert registry.children(User) == [Admin]
+    assert registry.descendants(User) == [Admin, SuperAdmin]
+
+
+def test_tables():
+    assert registry.tables(SuperAdmin) == [
+        User.__table__, Admin.__table__, SuperAdmin.__table__]
+    assert registry.tables(SubThing) == [Thing.__table__]
+    assert registry.by_table('_admin') is Admin
+    assert registry.by_table('_thing') is Thing
+
+
+def test_type_names():
+    assert registry.type_names(Thing) == ['thing', 'sub_thing']
+    assert registry.type_names(Admin) == ['admin', 'super_admin']
+    assert registry.by_type_name(Thing, 'sub_thing') is SubThing
+    assert registry.by_type_name(User, 'super_admin') is SuperAdmin
@@ -0,0 +1,91 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import pytest
+import sqlalchemy as sa
+
+from score.db import create_base
+
+
+Base = create_base()
+
+
+class Item(Base):
+    rank = sa.Column(sa.Integer, nullable=False)
+    name = sa.Column(sa.String(100))
+
+
+@pytest.fixture
+def session(make_db):
+    conf = make_db(Base)
+    session = conf.Session(extension=[])
+    for i in range(95):
+        session.add(Item(rank=i % 10, name='item%02d' % i))
+    session.commit()
+    return conf.Session(extension=[])
+
+
+def test_stream(session):
+    ids = []
+    for item in session.stream(Item, batch_size=10):
+        ids.append(item.id)
+        assert len(session.identity_map) <= 10
+    assert ids == list(range(1, 96))
+
+
+@pytest.mark.parametrize('order', [Item.rank, Item.rank.desc()])
+def test_stream_order(session, order):
+    items = [(item.rank, item.id)
+             for item in session.stream(Item, order=order, batch_size=7,
+                                        filter=Item.id > 5)]
+    assert len(items) == 90
+    assert items == sorted(items, reverse=order is not Item.rank)
+
+
+def test_stream_server_side_cursor(session):
+    ids = [item.id
+           for item in session.stream(Item, batch_size=7,
+                                      server_side_cursor=True)]
+    assert ids == list(range(1, 96))
+    assert len(session.identity_map) <= 7
+
+
+def test_stream_rejects_nullable_order(session):
+    with pytest.raises(ValueError):
+        next(session.stream(Item, order=Item.name))
+    items = session.stream(Item, order=sa.func.coalesce(Item.name, ''))
+    assert len(list(items)) == 95
+
+
+def test_stream_keeps_modified_objects(session):
+    modified = []
+    for item in session.stream(Item, batch_size=10):
+        if item.id % 20 == 0:
+            item.name = 'modified'
+            modified.append(item)
+    assert all(item in session for item in modified)
+    session.flush()
+    assert session.query(Item).filter(Item.name == 'modified').count() == 4
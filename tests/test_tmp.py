@@ -0,0 +1,173 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import pytest
+import sqlalchemy as sa
+
+from score.db import create_base
+
+
+Base = create_base()
+
+
+class User(Base):
+    name = sa.Column(sa.String(100))
+
+
+@pytest.fixture
+def session(make_db):
+    conf = make_db(Base)
+    session = conf.Session(extension=[])
+    session.add_all(User(name='u%04d' % i) for i in range(300))
+    session.commit()
+    return conf.Session(extension=[])
+
+
+def _count(session, table):
+    return session.execute(
+        sa.select([sa.func.count()]).select_from(table)).scalar()
+
+
+@pytest.mark.parametrize('threshold', [1000, 10])
+def test_filter_in(session, threshold):
+    ids = list(range(1, 250, 2)) + [1, 3, 999]
+    query = session.filter_in(session.query(User), User.id, ids,
+                              threshold=threshold)
+    assert sorted(user.id for user in query) == list(range(1, 250, 2))
+
+
+def test_filter_in_releases_tables(session):
+    query = session.filter_in(session.query(User), User.id, range(1, 50),
+                              threshold=10)
+    assert query.count() == 49
+    assert session._tmp_tables
+    session.commit()
+    assert not session._tmp_tables
+
+
+def test_mktmp_rows(session):
+    columns = [sa.Column('a', sa.Integer), sa.Column('b', sa.String(10))]
+    rows = ((i, 'x%d' % i) for i in range(1000))
+    with session.mktmp(columns, rows=rows) as table:
+        assert _count(session, table) == 1000
+        assert session.execute(
+            sa.select([table.c.b]).where(table.c.a == 5)).scalar() == 'x5'
+
+
+@pytest.fixture
+def statements(session):
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement.split()[0])
+
+    engine = session.get_bind()
+    sa.event.listen(engine, 'before_cursor_execute', count)
+    yield statements
+    sa.event.remove(engine, 'before_cursor_execute', count)
+
+
+def test_mktmp_reuses_tables(session, statements):
+    names = set()
+    for i in range(3):
+        columns = [sa.Column('id', sa.Integer, primary_key=True)]
+        with session.mktmp(columns, rows=[(i, ) for i in range(10)]) as table:
+            names.add(table.name)
+            assert _count(session, table) == 10
+    assert len(names) == 1
+    assert statements.count('CREATE') == 1
+    assert 'DROP' not in statements
+
+
+def test_mktmp_survives_commit(session):
+    columns = [sa.Column('id', sa.Integer, primary_key=True)]
+    with session.mktmp(columns, rows=[(1, )]) as table:
+        name = table.name
+    session.commit()
+    columns = [sa.Column('id', sa.Integer, primary_key=True)]
+    with session.mktmp(columns, rows=[(2, )]) as table:
+        assert table.name == name
+        assert _count(session, table) == 1
+    assert not [name for name in session.get_bind().table_names()
+                if name.startswith('tmp')]
+
+
+def test_mktmp_after_rollback(session):
+    columns = [sa.Column('x', sa.String(10))]
+    with session.mktmp(columns, rows=[('a', )]):
+        pass
+    session.rollback()
+    # the table created in the rolled back transaction must not be reused
+    columns = [sa.Column('x', sa.String(10))]
+    with session.mktmp(columns, rows=[('a', )]) as table:
+        assert _count(session, table) == 1
+
+
+@pytest.fixture
+def connection_session(session):
+    # a session bound to a single connection keeps the connection's pool of
+    # temporary tables across transactions.
+    connection = session.get_bind().connect()
+    session = session.dbconf.Session(extension=[], bind=connection)
+    # let the driver begin a transaction, so that the savepoints below are
+    # nested within it.
+    session.add(User(name='other'))
+    session.flush()
+    yield session
+    session.close()
+    connection.close()
+
+
+def test_mktmp_savepoint_rollback(connection_session, statements):
+    session = connection_session
+    int_columns = [sa.Column('id', sa.Integer, primary_key=True)]
+    with session.mktmp(int_columns, rows=[(1, )]) as table:
+        name = table.name
+    session.begin_nested()
+    str_columns = [sa.Column('x', sa.String(10))]
+    with session.mktmp(str_columns, rows=[('a', )]):
+        pass
+    session.rollback()
+    # the table created before the savepoint is still available
+    with session.mktmp(int_columns, rows=[(2, )]) as table:
+        assert table.name == name
+        assert _count(session, table) == 1
+    with session.mktmp(str_columns, rows=[('a', )]) as table:
+        assert _count(session, table) == 1
+    assert statements.count('CREATE') == 3
+
+
+def test_mktmp_savepoint_release(connection_session):
+    session = connection_session
+    session.begin_nested()
+    columns = [sa.Column('x', sa.String(10))]
+    with session.mktmp(columns, rows=[('a', )]):
+        pass
+    session.commit()
+    session.rollback()
+    # the table was created within the rolled back transaction
+    with session.mktmp(columns, rows=[('a', )]) as table:
+        assert _count(session, table) == 1
@@ -0,0 +1,108 @@
+# Copyright © 2015-2017 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in the
+# file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district the
+# Licensee has his registered seat, an establishment or assets.
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex
+
+from score.db import create_base
+from score.db._conf import ConfigurationError
+
+
+Base = create_base()
+
+
+class Animal(Base):
+    __score_db__ = {
+        'inheritance': 'single-table',
+        'type_codes': True,
+        'type_code': 1,
+    }
+    name = sa.Column(sa.String(100))
+
+
+class Dog(Animal):
+    __score_db__ = {'type_code': 2, 'partial_index': ['name']}
+
+
+class Puppy(Dog):
+    __score_db__ = {'type_code': 3}
+
+
+class Cat(Animal):
+    __score_db__ = {'type_code': 4, 'partial_index': True}
+
+
+def _indexes(table):
+    return sorted(str(CreateIndex(index).compile(dialect=sqlite.dialect()))
+                  for index in table.indexes)
+
+
+def test_type_indexes():
+    assert _indexes(Animal.__table__) == [
+        'CREATE INDEX ix__animal__type ON _animal (_type)',
+        'CREATE INDEX ix__animal_cat ON _animal (id) WHERE _type IN (4)',
+        'CREATE INDEX ix__animal_dog ON _animal (name) WHERE _type IN (2, 3)',
+    ]
+
+
+def test_type_index_disabled():
+    Base = create_base()
+
+    class Plant(Base):
+        __score_db__ = {'inheritance': 'single-table', 'type_index': False}
+
+    class Tree(Plant):
+        pass
+
+    assert not Plant.__table__.indexes
+
+
+def test_type_codes(make_db):
+    db = make_db(Base)
+    session = db.Session(extension=[])
+    session.add_all([Dog(name='a'), Puppy(name='b'), Cat(name='c'),
+                     Animal(name='d')])
+    session.flush()
+    session.bulk_save(Puppy, [{'name': 'e'}])
+    session.commit()
+    assert session.execute(
+        'SELECT name, _type FROM _animal ORDER BY id').fetchall() == [
+            ('a', 2), ('b', 3), ('c', 4), ('d', 1), ('e', 3)]
+    session.expunge_all()
+    dogs = session.query(Dog).order_by(Dog.id).all()
+    assert [(type(dog), dog.name) for dog in dogs] == [
+        (Dog, 'a'), (Puppy, 'b'), (Puppy, 'e')]
+
+
+def test_type_codes_invalid():
+    with pytest.raises(ConfigurationError):
+        class Duplicate(Animal):
+            __score_db__ = {'type_code': 4}
+    with pytest.raises(ConfigurationError):
+        class Missing(Animal):
+            pass